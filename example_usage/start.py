@@ -2,7 +2,6 @@
 
 import os
 import sys
-import time
 
 PLUGIN_PATH = os.path.expanduser("~/Pimoroni/displayotron/examples/")
 
@@ -46,6 +45,5 @@ picecold.add_to_menu(menu)
 
 # nav.enable_repeat(True)
 
-while True:
-    menu.redraw()
-    time.sleep(0.025)
+# Redraws only when needed and wakes up on every input
+picecold.scheduler.run_forever()
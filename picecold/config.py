@@ -4,22 +4,32 @@ import json
 import logging
 import multiprocessing
 import os
+import re
+import threading
 
 import main
+from libs.latency import LatencyModel
 
 
 class Configuration:
-    # The two conversion values define how the timing is stored - per default it's second/kilobyte
+    # The two conversion values define how the timing samples are stored - per default in seconds and kilobytes
     TIME_CONVERT = 1  # second
     SIZE_CONVERT = 1000  # KB
 
-    MAX_TIMINGS_PER_KEY = 5
     _TIMING_KEY_SIGN = 'sign'
     _TIMING_KEY_DESERIALIZE = 'deserialize'
+    _METRICS_KEY_DAEMON = 'daemon'
 
-    def __init__(self, cfg_dict: configparser.ConfigParser):
+    # s/kb on a dual core as long as there are no samples
+    _FALLBACK_TIMINGS = {_TIMING_KEY_SIGN: 20, _TIMING_KEY_DESERIALIZE: 10}
+
+    def __init__(self, cfg_dict: configparser.ConfigParser, cfg_dir='.'):
         # TODO: Validate settings
         self._cfg = cfg_dict
+        self._cfg_dir = cfg_dir
+        self._unsigned_regex = None
+        # The stats are updated by the Electrum workers and the prefetcher while the UI loop reads them
+        self._stats_lock = threading.Lock()
         self._load_trusted_uuids()
         self._load_timings()
 
@@ -27,6 +37,10 @@ class Configuration:
     def display_type(self):
         return self._cfg['Display']['type']
 
+    @property
+    def display_idle_timeout(self):
+        return self._cfg.getfloat('Display', 'idle_timeout', fallback=60.0)
+
     @property
     def transaction_dir(self):
         return self._cfg['Transaction']['directory']
@@ -35,10 +49,44 @@ class Configuration:
     def unsigned_pattern(self):
         return self._cfg['Transaction']['unsigned_pattern']
 
+    @property
+    def unsigned_regex(self):
+        """unsigned_pattern compiled (once)."""
+        if self._unsigned_regex is None or self._unsigned_regex.pattern != self.unsigned_pattern:
+            self._unsigned_regex = re.compile(self.unsigned_pattern)
+        return self._unsigned_regex
+
+    @property
+    def transaction_sort(self):
+        """Order of the transaction list: None (as stored on the stick), "name", "mtime" or "size"."""
+        sort_by = self._cfg.get('Transaction', 'sort', fallback='none').strip().lower()
+        return None if sort_by in ('', 'none') else sort_by
+
     @property
     def signed_suffix(self):
         return self._cfg['Transaction']['signed_suffix']
 
+    @property
+    def native_deserialize(self):
+        return self._cfg.getboolean('Transaction', 'native_deserialize', fallback=True)
+
+    @property
+    def recursive_search(self):
+        return self._cfg.getboolean('Transaction', 'recursive', fallback=True)
+
+    @property
+    def index_dir(self):
+        """Directory on the SD card for the transaction indexes of the sticks (next to the configuration file)."""
+        return self._cfg.get('Transaction', 'index_directory', fallback='') or self._cfg_dir
+
+    @property
+    def cache_size(self):
+        return self._cfg.getint('Transaction', 'cache_size', fallback=32)
+
+    @property
+    def cache_file(self):
+        return self._cfg.get('Transaction', 'cache_file', fallback='')
+
     @property
     def electrum_path(self):
         return self._cfg['Electrum']['electrum_path']
@@ -47,74 +95,172 @@ class Configuration:
     def wallet_password(self):
         return self._cfg['Electrum']['wallet_password']
 
+    @property
+    def electrum_network(self):
+        return self._cfg.get('Electrum', 'network', fallback='mainnet')
+
+    @property
+    def electrum_backend(self):
+        return self._cfg.get('Electrum', 'backend', fallback='subprocess')
+
+    @property
+    def electrum_rpc_host(self):
+        return self._cfg.get('Electrum', 'rpc_host', fallback='127.0.0.1')
+
+    @property
+    def electrum_rpc_port(self):
+        return self._cfg.getint('Electrum', 'rpc_port', fallback=7777)
+
+    @property
+    def electrum_rpc_user(self):
+        return self._cfg.get('Electrum', 'rpc_user', fallback='picecold')
+
+    @property
+    def electrum_rpc_password(self):
+        return self._cfg.get('Electrum', 'rpc_password', fallback='')
+
     def _load_timings(self):
-        self._timings = json.loads(self._cfg.get('Stats', 'electrum_timings', fallback="{}"))
+        timings = json.loads(self._cfg.get('Stats', 'electrum_timings', fallback="{}"))
+        # Older versions stored plain s/kb averages which cannot be converted into samples - they are dropped
+        self._latency_models = {key: LatencyModel([sample for sample in timings.get(key, [])
+                                                   if isinstance(sample, list)])
+                                for key in (Configuration._TIMING_KEY_SIGN, Configuration._TIMING_KEY_DESERIALIZE)}
 
-    def _calc_timings_avg(self, key):
-        """Get average result of benchmarks.
+    @property
+    def deserialize_latency(self) -> LatencyModel:
+        return self._latency_models[Configuration._TIMING_KEY_DESERIALIZE]
+
+    @property
+    def sign_latency(self) -> LatencyModel:
+        return self._latency_models[Configuration._TIMING_KEY_SIGN]
+
+    @property
+    def electrum_timeout_factor(self):
+        return self._cfg.getfloat('Electrum', 'timeout_factor', fallback=5.0)
+
+    @property
+    def electrum_min_timeout(self):
+        return self._cfg.getfloat('Electrum', 'min_timeout', fallback=120.0)
+
+    def calc_timeout(self, estimated_time) -> float:
+        """Utility function to get the time after which an Electrum operation is considered to be stuck
+
+        Returns:
+            Timeout in seconds
+        """
+        return max(self.electrum_min_timeout, self.electrum_timeout_factor * estimated_time)
+
+    def calc_estimated_deserialize_time(self, tx_path, io_count=None, percentile=50) -> float:
+        return self._calc_estimated_time(Configuration._TIMING_KEY_DESERIALIZE, tx_path, io_count, percentile)
+
+    def calc_estimated_sign_time(self, tx_path, io_count=None, percentile=50) -> float:
+        return self._calc_estimated_time(Configuration._TIMING_KEY_SIGN, tx_path, io_count, percentile)
+
+    def _calc_estimated_time(self, key, tx_path, io_count, percentile) -> float:
+        """Utility function to get estimated time for a transaction
 
         Args:
             key: can either be _TIMING_KEY_SIGN or _TIMING_KEY_DESERIALIZE
+            io_count: Amount of inputs + outputs of the transaction if already known
+            percentile: 50 for the typical time, higher values for more pessimistic estimates (e.g. timeouts)
 
         Returns:
-             Average (s per kb size of transaction)
+            Estimated time in seconds
         """
-        self._load_timings()
-        timing = self._timings.get(key)
-        if timing is None:
-            return None
-        else:
-            return round(sum(timing) / len(timing), 2)
+        size_kb = os.stat(tx_path).st_size / Configuration.SIZE_CONVERT
+        with self._stats_lock:
+            estimated = self._latency_models[key].estimate(size_kb, io_count, percentile)
+        if estimated is None:
+            # More or less pessimistic fallback as long as nothing has been measured
+            return Configuration._FALLBACK_TIMINGS[key] / (multiprocessing.cpu_count() / 2) * size_kb
+        return estimated * Configuration.TIME_CONVERT
+
+    def add_sign_timing(self, measured_seconds, tx_path, io_count=None):
+        self._add_timing(Configuration._TIMING_KEY_SIGN, measured_seconds, tx_path, io_count)
+
+    def add_deserialize_timing(self, measured_seconds, tx_path, io_count=None):
+        self._add_timing(Configuration._TIMING_KEY_DESERIALIZE, measured_seconds, tx_path, io_count)
+
+    def _add_timing(self, timing_key, measured_seconds, tx_path, io_count):
+        size_kb = os.stat(tx_path).st_size / Configuration.SIZE_CONVERT
+        with self._stats_lock:
+            self._latency_models[timing_key].add(round(size_kb, 3), io_count,
+                                                 round(measured_seconds / Configuration.TIME_CONVERT, 3))
+            self._cfg['Stats']['electrum_timings'] = json.dumps({key: model.samples
+                                                                 for key, model in self._latency_models.items()})
+
+    def add_sign_metrics(self, metrics: dict):
+        self._add_metrics(Configuration._TIMING_KEY_SIGN, metrics)
+
+    def add_deserialize_metrics(self, metrics: dict):
+        self._add_metrics(Configuration._TIMING_KEY_DESERIALIZE, metrics)
+
+    def add_daemon_metrics(self, metrics: dict):
+        """Stores one-off measurements of the Electrum daemon (like the time it took to load the wallet)."""
+        self._add_metrics(Configuration._METRICS_KEY_DAEMON, metrics)
+
+    def _add_metrics(self, key, metrics):
+        """Stores the measurements of an Electrum run (see libs.electrum.RunMetrics.as_dict()).
+
+        Times are kept as moving average, max_rss as the highest value seen so far.
+        """
+        with self._stats_lock:
+            stored = json.loads(self._cfg.get('Stats', 'electrum_metrics', fallback="{}"))
+            averages = stored.setdefault(key, {})
+            for name, value in metrics.items():
+                if value is None:
+                    continue
+                if averages.get(name) is None:
+                    averages[name] = round(value, 3)
+                elif name == 'max_rss':
+                    averages[name] = max(averages[name], value)
+                else:
+                    averages[name] = round((averages[name] + value) / 2, 3)
+            self._cfg['Stats']['electrum_metrics'] = json.dumps(stored)
 
     @property
-    def deserialize_time_average(self):
-        """Get average deserialization timing per (s per kb)
+    def sign_metrics(self) -> dict:
+        return self._metrics(Configuration._TIMING_KEY_SIGN)
 
-        Returns:
-            Average deserialization time (s per kb size of transaction)
-        """
-        avg = self._calc_timings_avg(Configuration._TIMING_KEY_DESERIALIZE)
-        return avg if avg else 10 / (multiprocessing.cpu_count() / 2)  # more or less pessimistic fallback
+    @property
+    def deserialize_metrics(self) -> dict:
+        return self._metrics(Configuration._TIMING_KEY_DESERIALIZE)
 
     @property
-    def sign_time_average(self):
-        """Get average deserialization timing (s per kb)
+    def daemon_metrics(self) -> dict:
+        return self._metrics(Configuration._METRICS_KEY_DAEMON)
 
-        Returns:
-            Average deserialization time (ms per kb size of transaction)
-        """
-        avg = self._calc_timings_avg(Configuration._TIMING_KEY_SIGN)
-        return avg if avg else 20 / (multiprocessing.cpu_count() / 2)  # more or less pessimistic fallback
+    def _metrics(self, key):
+        return json.loads(self._cfg.get('Stats', 'electrum_metrics', fallback="{}")).get(key, {})
 
-    @staticmethod
-    def calc_estimated_time(timing, tx_path) -> float:
-        """Utility function to get estimated time for a transaction
+    def add_cache_result(self, hit):
+        """Counts hits and misses of the transaction cache next to the Electrum timings."""
+        with self._stats_lock:
+            stats = json.loads(self._cfg.get('Stats', 'deserialize_cache', fallback='{"hits": 0, "misses": 0}'))
+            stats['hits' if hit else 'misses'] += 1
+            self._cfg['Stats']['deserialize_cache'] = json.dumps(stats)
+
+    @property
+    def cache_stats(self):
+        """Get hits and misses of the transaction cache
 
         Returns:
-            Estimated time in seconds
+            Tuple (hits, misses)
         """
-        return timing * (os.stat(tx_path).st_size / Configuration.SIZE_CONVERT)
-
-    def add_sign_timing(self, measured_seconds, tx_path):
-        self._add_timing(Configuration._TIMING_KEY_SIGN, measured_seconds, tx_path)
-
-    def add_deserialize_timing(self, measured_seconds, tx_path):
-        self._add_timing(Configuration._TIMING_KEY_DESERIALIZE, measured_seconds, tx_path)
-
-    def _add_timing(self, timing_key, measured_seconds, tx_path):
-        file_size = os.stat(tx_path).st_size
-        # The definition of a "timing"
-        timing = (measured_seconds / Configuration.TIME_CONVERT) / (file_size / Configuration.SIZE_CONVERT)
-        # Save the measured value in a list which behaves like a queue with a max. amount of items MAX_TIMINGS_PER_KEY:
-        if not isinstance(self._timings.get(timing_key), list):
-            self._timings[timing_key] = [timing]
-        elif len(self._timings[timing_key]) <= Configuration.MAX_TIMINGS_PER_KEY:
-            self._timings[timing_key].insert(0, timing)
-        else:
-            self._timings[timing_key].insert(0, timing)
-            self._timings[timing_key].pop(len(self._timings[timing_key]) - 1)
-        self._cfg['Stats']['electrum_timings'] = json.dumps(self._timings)
-        self._load_timings()
+        stats = json.loads(self._cfg.get('Stats', 'deserialize_cache', fallback='{"hits": 0, "misses": 0}'))
+        return stats['hits'], stats['misses']
+
+    @property
+    def auto_mount(self):
+        return self._cfg.getboolean('USB', 'auto_mount', fallback=True)
+
+    @property
+    def unmount_timeout(self):
+        return self._cfg.getfloat('USB', 'unmount_timeout', fallback=30.0)
+
+    @property
+    def hotplug_interval(self):
+        return self._cfg.getfloat('USB', 'hotplug_interval', fallback=1.0)
 
     def add_trusted_uuid(self, uuid):
         self._trusted_uuids.add(uuid)
@@ -134,7 +280,7 @@ class ConfigurationManager:
         self._save_on_exit = save_on_exit
         self._cfg_dict = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
         self.load_configuration()
-        self._configuration = Configuration(self._cfg_dict)
+        self._configuration = Configuration(self._cfg_dict, os.path.dirname(os.path.abspath(file_path)))
 
     @property
     def configuration(self) -> Configuration:
@@ -0,0 +1,148 @@
+"""Registry of the block devices with a filesystem, read from sysfs and the udev symlinks instead of running blkid.
+
+The kernel lists all partitions in /proc/partitions and udev links every filesystem by its UUID (and label) in
+/dev/disk. Reading these is a matter of microseconds and needs no root privileges - unlike "sudo blkid", which
+probes every block device (including the SD card) each time. The registry is only built again when one of these
+sources has changed.
+"""
+import logging
+import os
+import re
+import threading
+
+
+class BlockDevice:
+    __slots__ = ('name', 'path', 'uuid', 'label', 'removable', 'usb')
+
+    def __init__(self, name, path, uuid, label=None, removable=False, usb=False):
+        self.name = name  # e.g. "sda1"
+        self.path = path  # e.g. "/dev/sda1"
+        self.uuid = uuid
+        self.label = label
+        self.removable = removable
+        self.usb = usb
+
+    def __repr__(self):
+        return "BlockDevice({0}, UUID={1}, LABEL={2})".format(self.path, self.uuid, self.label)
+
+
+class DeviceRegistry:
+    """Block devices with a filesystem UUID, indexed by UUID and device path.
+
+    Every query first checks if /proc/partitions or /dev/disk/by-uuid has changed (one read and one stat) and only
+    then probes sysfs and the symlinks again. All paths are relative to root, so a fake tree can be used in tests.
+    """
+    _ESCAPED = re.compile(r'\\x([0-9a-fA-F]{2})')
+
+    def __init__(self, root='/'):
+        self._root = root
+        self._lock = threading.Lock()
+        self._state = None  # what the devices have been probed for
+        self._by_uuid = {}
+        self._by_path = {}
+        self.probes = 0
+
+    def _path(self, *parts):
+        return os.path.join(self._root, *parts)
+
+    def refresh(self) -> bool:
+        """Probes the devices again if the partitions or their UUIDs have changed.
+
+        Returns:
+            True if the devices have been probed
+        """
+        state = (self._read_partitions(), self._mtime(self._path('dev', 'disk', 'by-uuid')))
+        with self._lock:
+            if state == self._state:
+                return False
+            self._probe()
+            self._state = state
+            return True
+
+    @property
+    def partitions_state(self) -> str:
+        """Content of /proc/partitions (changes whenever a disk or partition is added or removed)."""
+        return self._read_partitions()
+
+    def devices(self, dev_filter=None) -> list:
+        """Get all devices (with a filesystem UUID), optionally only those whose path matches dev_filter."""
+        self.refresh()
+        with self._lock:
+            return [device for path, device in sorted(self._by_path.items())
+                    if dev_filter is None or re.match(dev_filter, path)]
+
+    def by_uuid(self, uuid) -> BlockDevice:
+        """Get a device by its filesystem UUID (None if it is not plugged in)."""
+        self.refresh()
+        return self._by_uuid.get(uuid)
+
+    def by_path(self, path) -> BlockDevice:
+        self.refresh()
+        return self._by_path.get(path)
+
+    def is_plugged_in(self, dev_or_uuid) -> bool:
+        self.refresh()
+        return dev_or_uuid in self._by_path or dev_or_uuid in self._by_uuid
+
+    def get_dev(self, uuid) -> str:
+        device = self.by_uuid(uuid)
+        return device.path if device is not None else ""
+
+    def _read_partitions(self) -> str:
+        try:
+            with open(self._path('proc', 'partitions')) as partitions:
+                return partitions.read()
+        except OSError:
+            return ""
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _probe(self):
+        self.probes += 1
+        labels = {}
+        for name, target in self._links(self._path('dev', 'disk', 'by-label')):
+            labels[target] = DeviceRegistry._ESCAPED.sub(lambda match: chr(int(match.group(1), 16)), name)
+        by_uuid = {}
+        by_path = {}
+        for uuid, target in self._links(self._path('dev', 'disk', 'by-uuid')):
+            name = os.path.basename(target)
+            sys_path = self._path('sys', 'class', 'block', name)
+            if not os.path.exists(sys_path):
+                continue  # a stale link of a removed device
+            disk_path = os.path.realpath(sys_path)
+            if os.path.exists(os.path.join(disk_path, 'partition')):
+                disk_path = os.path.dirname(disk_path)
+            device = BlockDevice(name, '/dev/' + name, uuid, labels.get(target),
+                                 removable=self._read_flag(os.path.join(disk_path, 'removable')),
+                                 usb='/usb' in disk_path)
+            by_uuid[uuid] = device
+            by_path[device.path] = device
+        self._by_uuid = by_uuid
+        self._by_path = by_path
+
+    @staticmethod
+    def _links(directory):
+        """(name, device name) of all symlinks in a /dev/disk/by-* directory."""
+        try:
+            with os.scandir(directory) as entries:
+                return [(entry.name, os.path.basename(os.readlink(entry.path)))
+                        for entry in entries if entry.is_symlink()]
+        except OSError as ex:
+            logging.debug("Could not read \"%s\": %s", directory, ex)
+            return []
+
+    @staticmethod
+    def _read_flag(path) -> bool:
+        try:
+            with open(path) as flag:
+                return flag.read().strip() == '1'
+        except OSError:
+            return False
+
+
+registry = DeviceRegistry()
@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+class Subscription:
+    def __init__(self, interval, callback, suspend_in_idle, start, due):
+        self.interval = interval
+        self.callback = callback
+        self.suspend_in_idle = suspend_in_idle
+        self.start = start
+        self.due = due
+
+
+class AnimationClock:
+    """One clock for all animations (blinking, backlight sweeps and fades, scrolling) instead of a thread each.
+
+    Animations subscribe with an interval and a callback, which gets the seconds since the subscription. The
+    callback can return False to end the animation. The clock is ticked by the UI loop (see scheduler), so all
+    callbacks run on the UI thread and the speed of an animation does not depend on the redraw rate.
+    Decorative animations (e.g. blinking) subscribe with suspend_in_idle: they pause while the UI loop is in deep idle,
+    so they do not keep waking it up. Their elapsed seconds are animation time (see now()), which stands still
+    meanwhile - like the position of scrolling text, so they continue where they stopped and stay in step with it.
+    """
+
+    def __init__(self, time_source=time.monotonic):
+        """
+        Args:
+            time_source: Returns the current time in seconds (like time.monotonic)
+        """
+        self._time = time_source
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._paused = 0.0  # seconds spent in deep idle, in total
+        self._paused_since = None
+        self.ticks = 0
+        self.tick_time = 0.0  # seconds spent in callbacks, in total
+        self.last_tick_time = 0.0
+
+    def subscribe(self, interval, callback, suspend_in_idle=False) -> Subscription:
+        """Calls callback(elapsed_seconds) every interval seconds, starting with the next tick."""
+        subscription = Subscription(interval, callback, suspend_in_idle,
+                                    self.now() if suspend_in_idle else self._time(), self._time())
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def now(self) -> float:
+        """Animation time in seconds: runs like time.monotonic, but stands still while the UI loop is in deep idle."""
+        with self._lock:
+            now = self._time() if self._paused_since is None else self._paused_since
+            return now - self._paused
+
+    def tick(self, idle=False):
+        """Runs the callbacks of all due animations (while idle, only of those which are not suspended).
+
+        The animation time (see now()) stops with the first idle tick and continues with the next tick without idle.
+        """
+        start = self._time()
+        with self._lock:
+            if idle and self._paused_since is None:
+                self._paused_since = start
+            elif not idle and self._paused_since is not None:
+                self._paused += start - self._paused_since
+                self._paused_since = None
+            due = [subscription for subscription in self._subscriptions
+                   if subscription.due <= start and not (idle and subscription.suspend_in_idle)]
+        if not due:
+            return
+        animation_time = self.now()
+        for subscription in due:
+            # Skip missed ticks instead of catching up with them
+            subscription.due = max(subscription.due + subscription.interval, start)
+            elapsed = (animation_time if subscription.suspend_in_idle else start) - subscription.start
+            if subscription.callback(elapsed) is False:
+                self.unsubscribe(subscription)
+        self.last_tick_time = self._time() - start
+        self.tick_time += self.last_tick_time
+        self.ticks += 1
+
+    def next_due(self, idle=False):
+        """Seconds until the next animation is due or None if there are no (running) animations."""
+        with self._lock:
+            dues = [subscription.due for subscription in self._subscriptions
+                    if not (idle and subscription.suspend_in_idle)]
+        if not dues:
+            return None
+        return max(min(dues) - self._time(), 0.0)
+
+    @property
+    def active(self):
+        return len(self._subscriptions)
+
+    @property
+    def average_tick_time(self):
+        return self.tick_time / self.ticks if self.ticks > 0 else 0.0
+
+
+clock = AnimationClock()
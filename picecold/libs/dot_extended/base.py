@@ -1,5 +1,10 @@
+import itertools
+
 from dot3k.menu import MenuOption
 
+from . import scheduler
+from .marquee import MarqueeRows
+
 # Documentation: http://www.lcd-module.de/pdf/doma/dog-m.pdf
 BUILTIN_SYMBOLS = {
     'double_arrow_left': chr(251),
@@ -12,6 +17,9 @@ BUILTIN_SYMBOLS = {
 
 
 class SymbolHandler:
+    """Writes symbols to fixed slots. Prefer glyph placeholders (see glyphs.GlyphManager), which are only uploaded
+    when they are not on the display yet."""
+
     def __init__(self, lcd, symbols):
         self._lcd = lcd
         self._symbols = symbols
@@ -24,6 +32,61 @@ class SymbolHandler:
                 self._lcd.create_char(idx, sym)
 
 
+class LazyList:
+    """Sequence which takes its items from an iterator only when they are accessed.
+
+    Used for long lists (like the files on a USB stick) of which only a screen is shown at a time: the first screen
+    is available after reading a few items, the rest is read while the user scrolls. len() reads all items.
+    """
+
+    def __init__(self, iterable):
+        self._items = []
+        self._source = iter(iterable)
+
+    def available(self, idx) -> bool:
+        """Reads the items up to idx (if not done yet) and tells if there is an item with this index."""
+        while self._source is not None and len(self._items) <= idx:
+            try:
+                self._items.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return 0 <= idx < len(self._items)
+
+    def extend(self, iterable):
+        """Appends items (after the ones which have not been read yet)."""
+        if self._source is None:
+            self._source = iter(iterable)
+        else:
+            self._source = itertools.chain(self._source, iterable)
+
+    @property
+    def loaded(self) -> list:
+        """The items read so far."""
+        return self._items
+
+    @property
+    def complete(self) -> bool:
+        return self._source is None
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice) or idx < 0:
+            len(self)
+        else:
+            self.available(idx)
+        return self._items[idx]
+
+    def __len__(self):
+        while self._source is not None:
+            self.available(len(self._items))
+        return len(self._items)
+
+    def __iter__(self):
+        idx = 0
+        while self.available(idx):
+            yield self._items[idx]
+            idx += 1
+
+
 class ScrollableMenu(MenuOption):
     scroll_speed = 400
     scroll_delay = 800
@@ -38,25 +101,32 @@ class ScrollableMenu(MenuOption):
         self._available_rows = 2 if title else 3
         self.cursor_char = cursor_char
         self._page_range = range(self._current_idx, self._available_rows)
+        self._marquees = MarqueeRows()
         super().__init__()
 
     def redraw(self, menu):
         if self._show_title():
-            menu.write_option(0, self._title,
-                              scroll=len(self._title) > 16,
-                              scroll_delay=self.scroll_delay,
-                              scroll_speed=self.scroll_speed)
+            menu.write_row(0, self._marquees.render(0, self._title, icon=' ', scroll=len(self._title) > 16,
+                                                    scroll_delay=self.scroll_delay,
+                                                    scroll_speed=self.scroll_speed))
         for row_idx, i in enumerate(self._page_range):
-            if i in range(0, len(self._entries)):
+            if self._has_entry(i):
                 row_txt = self.get_entry(i)
-                menu.write_option(self._write_offset + row_idx, row_txt,
-                                  scroll=len(row_txt) > 16 and i == self._current_idx,
-                                  scroll_delay=self.scroll_delay,
-                                  scroll_speed=self.scroll_speed,
-                                  icon=self._get_cursor(i))
+                menu.write_row(self._write_offset + row_idx,
+                               self._marquees.render(self._write_offset + row_idx, row_txt,
+                                                     icon=self._get_cursor(i),
+                                                     scroll=len(row_txt) > 16 and i == self._current_idx,
+                                                     scroll_delay=self.scroll_delay,
+                                                     scroll_speed=self.scroll_speed))
             else:
                 menu.clear_row(self._write_offset + row_idx)
 
+    def frame_need(self):
+        texts = [self._title] if self._show_title() else []
+        if self._has_entry(self._current_idx):
+            texts.append(self.get_entry(self._current_idx))
+        return scheduler.scroll_need(texts, self.scroll_speed)
+
     # Delivers cursor if idx == current index
     def _get_cursor(self, idx):
         return self.cursor_char if idx == self._current_idx else ' '
@@ -64,9 +134,15 @@ class ScrollableMenu(MenuOption):
     def _show_title(self) -> bool:
         return self._title
 
+    def _has_entry(self, idx) -> bool:
+        # Only reads lazy entries up to idx instead of all of them, as len() would do
+        if isinstance(self._entries, LazyList):
+            return self._entries.available(idx)
+        return 0 <= idx < len(self._entries)
+
     def up(self):
-        if len(self._entries) > 0:
-            if (self._current_idx - 1) in range(0, len(self._entries)):
+        if self._has_entry(0):
+            if self._has_entry(self._current_idx - 1):
                 self._current_idx -= 1
                 # check if new cursor points on last element of screen/page, that would mean "one page up":
                 if (self._current_idx + 1) % self._available_rows == 0:
@@ -78,8 +154,8 @@ class ScrollableMenu(MenuOption):
                                          len(self._entries))
 
     def down(self):
-        if len(self._entries) > 0:
-            if (self._current_idx + 1) in range(0, len(self._entries)):
+        if self._has_entry(0):
+            if self._has_entry(self._current_idx + 1):
                 self._current_idx += 1
                 # check if new cursor points on first element of screen/page, that would mean "one page down":
                 if self._current_idx % self._available_rows == 0:
@@ -124,6 +200,10 @@ class MenuOptionSwitcher(MenuOption):
         self._current_menu_opt = None
 
     def switch(self, menu_opt):
+        # Views are often switched by background jobs - the switch itself always happens on the UI loop
+        scheduler.run_in_ui(self._switch, menu_opt)
+
+    def _switch(self, menu_opt):
         if self._current_menu_opt is not None:
             self._current_menu_opt.cleanup()
         self._current_menu_opt = menu_opt
@@ -140,6 +220,13 @@ class MenuOptionSwitcher(MenuOption):
         if self._current_menu_opt is not None:
             self._current_menu_opt.redraw(menu)
 
+    def frame_need(self):
+        current = self._current_menu_opt
+        if current is None:
+            return scheduler.ON_INPUT
+        return current.frame_need() if hasattr(current, 'frame_need') \
+            else scheduler.animation(scheduler.RedrawScheduler.LEGACY_INTERVAL)
+
     def select(self):
         return self._current_menu_opt.select()
 
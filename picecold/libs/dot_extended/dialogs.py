@@ -1,8 +1,9 @@
-import threading
-import time
-
 from dot3k.menu import MenuOption
 
+from . import scheduler
+from .animation import clock
+from .marquee import MarqueeRows
+
 
 class SimpleDialog(MenuOption):
     scroll_speed = 300
@@ -19,6 +20,7 @@ class SimpleDialog(MenuOption):
         self._selected = None
         self._callback_on_positive = callback_on_positive
         self._callback_on_negative = callback_on_negative
+        self._marquees = MarqueeRows()
 
     def redraw(self, menu):
         for i, row in enumerate(self.rows):
@@ -29,10 +31,13 @@ class SimpleDialog(MenuOption):
                           + (chr(252) if self.selected_answer == self.positive else " ") + self.positive
                 menu.write_row(i, answers)
             else:
-                menu.write_option(i, row.center(16) if self._auto_center else row,
-                                  scroll=len(row) > 16,
-                                  scroll_delay=SimpleDialog.scroll_delay, scroll_speed=SimpleDialog.scroll_speed)
-        time.sleep(0.01)
+                menu.write_row(i, self._marquees.render(i, row.center(16) if self._auto_center else row, icon=' ',
+                                                        scroll=len(row) > 16,
+                                                        scroll_delay=SimpleDialog.scroll_delay,
+                                                        scroll_speed=SimpleDialog.scroll_speed))
+
+    def frame_need(self):
+        return scheduler.scroll_need([row for row in self.rows if "{answers}" not in row], SimpleDialog.scroll_speed)
 
     def select_answer(self, opt):
         self._selected = opt
@@ -78,15 +83,17 @@ class SimpleMessage(MenuOption):
         self._blink = blink
         self._auto_center = auto_center
 
-        self._blink_timer = None
+        self._blink_animation = None
         self._show_arrows = True
+        self._marquees = MarqueeRows()
 
         if auto_button and len(self.rows) < 3:
             self.rows.append("{button}")
 
     def begin(self):
         if self._blink:
-            self._start_animation_timer()
+            # Blinking is decoration: it stops in deep idle like scrolling text
+            self._blink_animation = clock.subscribe(1.0, self._toggle_arrows, suspend_in_idle=True)
 
     def redraw(self, menu):
         for i, row in enumerate(self.rows):
@@ -96,22 +103,27 @@ class SimpleMessage(MenuOption):
                 else:
                     menu.write_row(i, self.button.center(16))
             else:
-                menu.write_option(i, row.center(16) if self._auto_center else row,
-                                  scroll=len(row) > 16, scroll_delay=self.scroll_delay, scroll_speed=self.scroll_speed)
-        time.sleep(0.01)
+                menu.write_row(i, self._marquees.render(i, row.center(16) if self._auto_center else row, icon=' ',
+                                                        scroll=len(row) > 16, scroll_delay=self.scroll_delay,
+                                                        scroll_speed=self.scroll_speed))
+
+    def frame_need(self):
+        need = scheduler.scroll_need([row for row in self.rows if "{button}" not in row], self.scroll_speed)
+        return scheduler.combine(need, scheduler.scroll(1.0)) if self._blink_animation is not None else need
 
     def cleanup(self):
-        if self._blink_timer is not None:
-            self._blink_timer.cancel()
+        if self._blink_animation is not None:
+            clock.unsubscribe(self._blink_animation)
+            self._blink_animation = None
 
-    def _start_animation_timer(self):
-        if self._blink_timer is None or self._blink_timer.finished:
-            self._show_arrows = not self._show_arrows
-            self._blink_timer = threading.Timer(1.0, self._start_animation_timer)
-            self._blink_timer.start()
+    def _toggle_arrows(self, elapsed):
+        self._show_arrows = not self._show_arrows
 
 
 class StatusMessage(SimpleMessage):
+    FADE_TIME = 0.5  # seconds
+    FADE_INTERVAL = 0.05
+
     _COLOR_MAP = {"Success": [0, 255, 0],
                   "Info": [0, 0, 255],
                   "Note": [0, 0, 255],
@@ -122,6 +134,7 @@ class StatusMessage(SimpleMessage):
         super().__init__(rows)
         self._backlight = backlight
         self._color = None
+        self._fade_animation = None
         for kw in self._COLOR_MAP:
             if kw in rows[0]:
                 self._color = self._COLOR_MAP[kw]
@@ -129,13 +142,26 @@ class StatusMessage(SimpleMessage):
     def begin(self):
         super().begin()
         if self._color is not None:
-            self._backlight.rgb(self._color[0], self._color[1], self._color[2])
+            self._fade_animation = clock.subscribe(StatusMessage.FADE_INTERVAL, self._fade)
+
+    def _fade(self, elapsed):
+        """Fades from the configured backlight colour to the status colour."""
+        progress = min(elapsed / StatusMessage.FADE_TIME, 1.0)
+        start = self._configured_color()
+        self._backlight.rgb(*(int(s + (c - s) * progress) for s, c in zip(start, self._color)))
+        return progress < 1.0
+
+    def _configured_color(self):
+        return (int(self.get_option('Backlight', 'r', 255)),
+                int(self.get_option('Backlight', 'g', 255)),
+                int(self.get_option('Backlight', 'b', 255)))
 
     def cleanup(self):
         super().cleanup()
-        self._backlight.rgb(int(self.get_option('Backlight', 'r', 255)),
-                            int(self.get_option('Backlight', 'g', 255)),
-                            int(self.get_option('Backlight', 'b', 255)))
+        if self._fade_animation is not None:
+            clock.unsubscribe(self._fade_animation)
+            self._fade_animation = None
+        self._backlight.rgb(*self._configured_color())
 
     def select(self):
         self.cleanup()
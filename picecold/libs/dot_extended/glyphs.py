@@ -0,0 +1,81 @@
+import re
+import threading
+from collections import OrderedDict
+
+
+class GlyphManager:
+    """Manages the 8 slots for custom characters (CGRAM) of the display.
+
+    Views do not use slot numbers ("\\x00" - "\\x07") anymore. They embed a placeholder character per glyph name
+    (see placeholder()) in their text, and the placeholders are replaced by the slot holding the glyph when the
+    text is written to the display. A glyph is only uploaded if it is not already in a slot; if all slots are taken,
+    the least recently used glyph is evicted.
+    """
+    SLOTS = 8
+    _PLACEHOLDER_BASE = 0xE000  # Unicode private use area, never sent to the display
+    _PLACEHOLDERS = re.compile('[\ue000-\uf8ff]')
+
+    _lock = threading.Lock()
+    _placeholders = {}  # name -> placeholder
+    _bitmaps = {}  # placeholder -> bitmap
+
+    @staticmethod
+    def placeholder(name, bitmap) -> str:
+        """Get the placeholder character of a glyph (defines it on first use).
+
+        Args:
+            name: Unique name of the glyph, e.g. "BTC_LOGO"
+            bitmap: Eight rows of five pixels each, see util.Symbols
+        """
+        with GlyphManager._lock:
+            char = GlyphManager._placeholders.get(name)
+            if char is None:
+                char = chr(GlyphManager._PLACEHOLDER_BASE + len(GlyphManager._placeholders))
+                GlyphManager._placeholders[name] = char
+                GlyphManager._bitmaps[char] = tuple(bitmap)
+            return char
+
+    def __init__(self, upload):
+        """
+        Args:
+            upload: Function (slot, bitmap) which writes a glyph to the display
+        """
+        self._upload = upload
+        self._slots = OrderedDict()  # placeholder -> slot, least recently used first
+        self.uploads = 0
+
+    def translate(self, text) -> str:
+        """Replaces all placeholders in the text with the slots of their glyphs (uploading them if necessary).
+
+        Raises:
+            OverflowError: If the text needs more than eight different glyphs
+        """
+        if GlyphManager._PLACEHOLDERS.search(text) is None:
+            return text
+        if len(set(GlyphManager._PLACEHOLDERS.findall(text))) > GlyphManager.SLOTS:
+            raise OverflowError("Display only supports eight created chars at a time.")
+        return GlyphManager._PLACEHOLDERS.sub(lambda match: chr(self._slot(match.group(0))), text)
+
+    def _slot(self, char):
+        slot = self._slots.get(char)
+        if slot is not None:
+            self._slots.move_to_end(char)
+            return slot
+        if len(self._slots) < GlyphManager.SLOTS:
+            slot = min(set(range(GlyphManager.SLOTS)) - set(self._slots.values()))
+        else:
+            _, slot = self._slots.popitem(last=False)
+        self._upload(slot, GlyphManager._bitmaps[char])
+        self.uploads += 1
+        self._slots[char] = slot
+        return slot
+
+    def release_slot(self, slot):
+        """Forgets what is stored in a slot (because it has been overwritten without the manager)."""
+        for char, used_slot in list(self._slots.items()):
+            if used_slot == slot:
+                del self._slots[char]
+
+    @property
+    def used_slots(self):
+        return len(self._slots)
@@ -0,0 +1,56 @@
+from . import animation
+
+
+class Marquee:
+    """Scrolling text for one display row, with all frames computed once when the text is set.
+
+    Drawing a frame only picks one of the precomputed rows by the time since the text has been set: the text stands
+    still for scroll_delay ms, then moves one character every scroll_speed ms and starts over after a full cycle.
+    Texts which fit into the row are not scrolled. The time is the animation time of the clock (the shared one by
+    default), so the text stops where it is in deep idle and moves in step with the other animations.
+    """
+    WIDTH = 16
+
+    def __init__(self, text, icon='', scroll=True, scroll_speed=300, scroll_delay=500, padding='  ', clock=None):
+        self.key = (text, icon, scroll, scroll_speed, scroll_delay)
+        width = Marquee.WIDTH - len(icon)
+        self._speed = scroll_speed / 1000.0
+        self._delay = scroll_delay / 1000.0
+        if not scroll or len(text) <= width:
+            self._frames = (icon + text[:width].ljust(width),)
+        else:
+            loop = text + padding
+            doubled = loop + loop
+            self._frames = tuple(icon + doubled[i:i + width] for i in range(len(loop)))
+        self._cycle = self._delay + len(self._frames) * self._speed
+        self._clock = clock if clock is not None else animation.clock
+        self._start = self._clock.now()
+
+    @property
+    def scrolling(self):
+        return len(self._frames) > 1
+
+    def frame(self) -> str:
+        if len(self._frames) == 1:
+            return self._frames[0]
+        position = (self._clock.now() - self._start) % self._cycle - self._delay
+        return self._frames[0] if position < 0 else self._frames[int(position / self._speed)]
+
+
+class MarqueeRows:
+    """Keeps the marquee of every row of a view, so its frames are only computed again if the row's text changes."""
+
+    def __init__(self, clock=None):
+        self._clock = clock
+        self._rows = {}
+
+    def render(self, row, text, icon='', scroll=True, scroll_speed=300, scroll_delay=500) -> str:
+        """Get the current frame of a row (creating its marquee if the text or the settings have changed)."""
+        marquee = self._rows.get(row)
+        if marquee is None or marquee.key != (text, icon, scroll, scroll_speed, scroll_delay):
+            marquee = Marquee(text, icon, scroll, scroll_speed, scroll_delay, clock=self._clock)
+            self._rows[row] = marquee
+        return marquee.frame()
+
+    def clear(self):
+        self._rows.clear()
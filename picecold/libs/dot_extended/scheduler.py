@@ -0,0 +1,193 @@
+import collections
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from dot3k.menu import _MODE_ADJ as ADJUST
+
+from .animation import clock
+
+FrameNeed = collections.namedtuple('FrameNeed', ['kind', 'interval'])
+FrameNeed.__doc__ = """What a view needs after it has been drawn, returned by its frame_need() method.
+
+Use the constants/functions below: NEVER (static content), ON_INPUT (only changes through input), scroll(interval)
+(scrolling text, which stops in deep idle) and animation(interval) (e.g. progress bars, which never stop).
+"""
+
+NEVER = FrameNeed('never', None)
+ON_INPUT = FrameNeed('input', None)
+
+
+def scroll(interval) -> FrameNeed:
+    return FrameNeed('scroll', interval)
+
+
+def animation(interval) -> FrameNeed:
+    return FrameNeed('animation', interval)
+
+
+def combine(*needs) -> FrameNeed:
+    """The need which satisfies all given needs (e.g. of all rows of a view)."""
+    timed = [need for need in needs if need.interval is not None]
+    if not timed:
+        return ON_INPUT if ON_INPUT in needs else NEVER
+    kind = 'animation' if any(need.kind == 'animation' for need in timed) else 'scroll'
+    return FrameNeed(kind, min(need.interval for need in timed))
+
+
+def scroll_need(texts, scroll_speed) -> FrameNeed:
+    """Scroll ticks if any of the texts is too long for a row (scroll_speed in ms like for marquee.Marquee)."""
+    return scroll(scroll_speed / 1000.0) if any(len(text) > 16 for text in texts) else ON_INPUT
+
+
+_schedulers = []
+
+
+def run_in_ui(func, *args):
+    """Runs func on the UI loop: at once if called from there (or if there is no loop), otherwise queued."""
+    if not _schedulers or _schedulers[0].in_loop():
+        func(*args)
+    else:
+        _schedulers[0].post(func, *args)
+
+
+def in_ui(func):
+    """Wraps func so it always runs on the UI loop - e.g. for callbacks of futures, which run on worker threads."""
+    return lambda *args: run_in_ui(func, *args)
+
+
+def call_later(delay, func, *args):
+    """Runs func on the UI loop after delay seconds."""
+    if _schedulers:
+        _schedulers[0].call_later(delay, func, *args)
+    else:
+        threading.Timer(delay, func, args).start()
+
+
+class RedrawScheduler:
+    """The UI loop: redraws the menu only when something needs to be shown instead of every 25 ms.
+
+    Everything which changes the UI (input, view switches, progress updates, backlight) runs on this loop's thread,
+    one after another: other threads hand it over with post()/call_later() (or run_in_ui()/in_ui()/call_later() of
+    this module), so input is never blocked by a long operation and views are never changed while being drawn.
+
+    After each frame, the view in focus is asked for its frame_need(). Views without this method (like the plugins
+    of the Display-o-Tron examples) are redrawn every LEGACY_INTERVAL. Input (see wake()) triggers a frame at once.
+    Without input for idle_timeout seconds the scheduler falls into deep idle: scrolling stops and nothing is
+    redrawn until the next touch - only animations (like a running progress bar) keep going.
+    The shared animation clock (see animation) is ticked before every frame and wakes the loop when it is due -
+    except for its subscriptions with suspend_in_idle, which pause once there has been no input for idle_timeout.
+    """
+    MIN_INTERVAL = 0.025  # seconds, at most 40 frames per second
+    LEGACY_INTERVAL = 0.025
+    MENU_INTERVAL = 0.1  # the menu itself scrolls long item names
+
+    def __init__(self, menu, lcd=None, idle_timeout=60.0):
+        self._menu = menu
+        self._lcd = lcd
+        self._idle_timeout = idle_timeout
+        self._condition = threading.Condition()
+        self._woken = False
+        self._calls = collections.deque()
+        self._timers = []  # heap of (due, sequence, func, args)
+        self._sequence = itertools.count()
+        self._thread = None
+        self._last_input = time.monotonic()
+        self._last_frame = 0.0
+        self.frames = 0
+        self.deep_idle = False
+        _schedulers.append(self)
+
+    def wake(self, user_input=True):
+        """Requests a frame as soon as possible (input also ends the deep idle)."""
+        with self._condition:
+            if user_input:
+                self._last_input = time.monotonic()
+            self._woken = True
+            self._condition.notify()
+
+    def post(self, func, *args):
+        """Queues func to be run on the loop (followed by a redraw)."""
+        with self._condition:
+            self._calls.append((func, args))
+            self._woken = True
+            self._condition.notify()
+
+    def post_input(self, func, *args):
+        """Like post(), but for user input (ends the deep idle)."""
+        with self._condition:
+            self._last_input = time.monotonic()
+        self.post(func, *args)
+
+    def call_later(self, delay, func, *args):
+        with self._condition:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._sequence), func, args))
+            self._condition.notify()
+
+    def in_loop(self):
+        return threading.current_thread() is self._thread
+
+    def run_forever(self):
+        while True:
+            self.run_once()
+
+    def run_once(self):
+        """Runs the pending calls, draws one frame and waits until the next one is due."""
+        self._thread = threading.current_thread()
+        self._run_pending()
+        wait = RedrawScheduler.MIN_INTERVAL - (time.monotonic() - self._last_frame)
+        if wait > 0:
+            time.sleep(wait)
+            self._run_pending()
+        self._last_frame = time.monotonic()
+        clock.tick(self._input_idle())
+        self._menu.redraw()
+        if hasattr(self._lcd, 'end_frame'):
+            self._lcd.end_frame()
+        self.frames += 1
+        timeout = self._next_timeout(self.frame_need())
+        with self._condition:
+            self.deep_idle = timeout is None and self._input_idle()
+            wake_ups = [due for due in (clock.next_due(self._input_idle()),
+                                        max(self._timers[0][0] - time.monotonic(), 0.0) if self._timers else None)
+                        if due is not None]
+            if wake_ups:
+                timeout = min(wake_ups) if timeout is None else min([timeout] + wake_ups)
+            if not self._woken and not self._calls:
+                self._condition.wait(timeout)
+            self._woken = False
+
+    def _run_pending(self):
+        while True:
+            with self._condition:
+                if self._calls:
+                    func, args = self._calls.popleft()
+                elif self._timers and self._timers[0][0] <= time.monotonic():
+                    _, _, func, args = heapq.heappop(self._timers)
+                else:
+                    return
+            try:
+                func(*args)
+            except Exception:
+                logging.exception("Error in UI loop")
+
+    def _input_idle(self):
+        return time.monotonic() >= self._last_input + self._idle_timeout
+
+    def frame_need(self) -> FrameNeed:
+        current = self._menu.current_value()
+        if self._menu.mode != ADJUST:
+            return scroll(RedrawScheduler.MENU_INTERVAL)
+        if not hasattr(current, 'frame_need'):
+            return animation(RedrawScheduler.LEGACY_INTERVAL)
+        return current.frame_need()
+
+    def _next_timeout(self, need: FrameNeed):
+        if need.kind == 'animation':
+            return need.interval
+        if need.kind == 'scroll':
+            remaining = self._last_input + self._idle_timeout - time.monotonic()
+            return need.interval if remaining > 0 else None
+        return None
@@ -0,0 +1,139 @@
+import threading
+
+from .glyphs import GlyphManager
+
+
+class ShadowLcd:
+    """Wraps the dot3k/dothat lcd module and only sends what actually changes on the display.
+
+    A shadow copy of the 16x3 characters on the display is kept. write() compares the text with it and only sends
+    runs of changed characters (plus a cursor move if the display's cursor is not already in place), so redrawing
+    an unchanged screen every frame costs no bus traffic at all. create_char() skips glyphs which are already
+    stored in their slot. Glyph placeholders in the text are resolved by the GlyphManager (see glyphs).
+
+    Everything else (set_contrast, create_animation, ...) is passed through to the wrapped module.
+    The bytes sent per frame are counted - call end_frame() after every redraw.
+    """
+    COLS = 16
+    ROWS = 3
+
+    # Bytes on the bus per command (the ST7036 gets one byte per command/character)
+    _BYTES_CURSOR = 1
+    _BYTES_CLEAR = 1
+    _BYTES_CHAR_DEFINITION = 1 + 8
+
+    def __init__(self, lcd):
+        self._lcd = lcd
+        self._lock = threading.RLock()
+        self._shadow = [None] * (ShadowLcd.COLS * ShadowLcd.ROWS)  # the content is unknown until written once
+        self._glyphs = [None] * 8
+        self._animated = set()
+        self._cursor = 0  # where the application writes next
+        self._hw_cursor = None  # where the display writes next (None if unknown)
+        self._frame_bytes = 0
+        self.glyphs = GlyphManager(self._create_char)
+        self.last_frame_bytes = 0
+        self.total_bytes = 0
+        self.frames = 0
+
+    def __getattr__(self, name):
+        return getattr(self._lcd, name)
+
+    def set_cursor_position(self, column, row):
+        self._cursor = (row * ShadowLcd.COLS + column) % len(self._shadow)
+
+    def set_cursor_offset(self, offset):
+        self._cursor = offset % len(self._shadow)
+
+    def write(self, value):
+        with self._lock:
+            size = len(self._shadow)
+            run_start, run = None, []
+            for char in self.glyphs.translate(str(value)):
+                if self._shadow[self._cursor] != char:
+                    if run_start is None:
+                        run_start = self._cursor
+                    run.append(char)
+                    self._shadow[self._cursor] = char
+                elif run_start is not None:
+                    self._send(run_start, run)
+                    run_start, run = None, []
+                self._cursor = (self._cursor + 1) % size
+                if self._cursor == 0 and run_start is not None:
+                    # The display does not wrap from the last cell to the first one like the shadow does
+                    self._send(run_start, run)
+                    run_start, run = None, []
+            if run_start is not None:
+                self._send(run_start, run)
+
+    def _send(self, offset, chars):
+        if self._hw_cursor != offset:
+            self._lcd.set_cursor_position(offset % ShadowLcd.COLS, offset // ShadowLcd.COLS)
+            self._frame_bytes += ShadowLcd._BYTES_CURSOR
+        self._lcd.write(''.join(chars))
+        self._frame_bytes += len(chars)
+        # Behind the last cell, the display's address counter is not at the first one
+        end = offset + len(chars)
+        self._hw_cursor = end if end < len(self._shadow) else None
+
+    def clear(self):
+        with self._lock:
+            self._lcd.clear()
+            self._frame_bytes += ShadowLcd._BYTES_CLEAR
+            self._shadow = [' '] * len(self._shadow)
+            self._cursor = 0
+            self._hw_cursor = 0
+
+    def create_char(self, char_pos, char_map):
+        with self._lock:
+            self.glyphs.release_slot(char_pos)
+            self._create_char(char_pos, char_map)
+
+    def _create_char(self, char_pos, char_map):
+        with self._lock:
+            glyph = tuple(char_map)
+            if self._glyphs[char_pos] == glyph:
+                return
+            self._lcd.create_char(char_pos, char_map)
+            self._frame_bytes += ShadowLcd._BYTES_CHAR_DEFINITION
+            self._glyphs[char_pos] = glyph
+            self._hw_cursor = None  # defining a char moves the display's address counter into the char memory
+
+    def create_animation(self, anim_pos, anim_map, frame_rate):
+        with self._lock:
+            self._lcd.create_animation(anim_pos, anim_map, frame_rate)
+            self._animated.add(anim_pos)
+            self._glyphs[anim_pos] = None
+            self.glyphs.release_slot(anim_pos)
+
+    def update_animations(self):
+        with self._lock:
+            self._lcd.update_animations()
+            # Animations define their chars directly on the display, so the cached glyphs are outdated
+            for anim_pos in self._animated:
+                self._glyphs[anim_pos] = None
+            if self._animated:
+                self._hw_cursor = None
+
+    def invalidate(self):
+        """Forgets the shadow, so the next frame is sent completely (e.g. after something wrote to the display
+        without this wrapper)."""
+        with self._lock:
+            self._shadow = [None] * len(self._shadow)
+            self._glyphs = [None] * 8
+            self._hw_cursor = None
+            for slot in range(GlyphManager.SLOTS):
+                self.glyphs.release_slot(slot)
+
+    def end_frame(self) -> int:
+        """Marks the end of a redraw.
+
+        Returns:
+            The amount of bytes which have been sent to the display for this frame
+        """
+        with self._lock:
+            self.last_frame_bytes = self._frame_bytes
+            self.total_bytes += self._frame_bytes
+            self.frames += 1
+            self._frame_bytes = 0
+            return self.last_frame_bytes
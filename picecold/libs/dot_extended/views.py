@@ -1,13 +1,15 @@
-import os
 import re
-from collections import defaultdict
 
 from dot3k.menu import MenuOption
 
-from .base import ScrollableMenu
+from . import scheduler
+from .base import LazyList, ScrollableMenu
+from .marquee import MarqueeRows
 
 
 class ProgressBarView(MenuOption):
+    FRAME_INTERVAL = 0.25  # seconds, the value is set from outside at any time
+
     def __init__(self, rows=('Progress Bar:', '{bar}', '{val:%}'), initial_value=0.0,
                  fill_char='*', empty_char=' ', total_len=16,
                  auto_center=True, callback_after_redraw=None):
@@ -28,6 +30,9 @@ class ProgressBarView(MenuOption):
         if self._call_after_redraw:
             self._call_after_redraw()
 
+    def frame_need(self):
+        return scheduler.animation(ProgressBarView.FRAME_INTERVAL)
+
     @property
     def value(self):
         return self._value
@@ -52,61 +57,116 @@ class ProgressBarView(MenuOption):
         self.value = new_percentage if new_percentage >= 0.0 else 0.0
 
 
+class _Replacements(dict):
+    """Replacements for str.format_map() which leave unknown keys empty."""
+
+    def __missing__(self, key):
+        return ""
+
+
 class PageView(MenuOption):
     scroll_speed = 300
     scroll_delay = 500
 
     class Page:
+        """One page: the rows to show and the fixed (not scrolled) text in front of each row.
+
+        Pages are created in large numbers (one per output of a transaction), so the page format is only parsed once
+        per format and its fixed texts are shared by all pages using it.
+        """
+        __slots__ = ('rows', 'fixed_pre_texts')
+        _ROW_PATTERN = re.compile("^(.+)({text1}|{text2}|{nav}.*)$")
+        _parsed_formats = {}  # page_format -> (fixed_pre_texts, templates)
+
         def __init__(self, texts, page_format=("{text1}", "{text2}", "{nav}")):
-            self.rows = []
-            self.fixed_pre_texts = []
-            for fmt in page_format:
-                match = re.match("^(.+)({text1}|{text2}|{nav}.*)$", fmt)
-                replacements = defaultdict(str,
-                                           text1=texts[0] if len(texts) > 0 else "",
-                                           text2=texts[1] if len(texts) > 1 else "",
-                                           text3=texts[2] if len(texts) > 2 else "",
-                                           nav="{nav}")
-                if match:
-                    self.fixed_pre_texts.append(match.group(1))
-                    self.rows.append(match.group(2).format_map(replacements))
-                else:
-                    self.fixed_pre_texts.append("")
-                    self.rows.append(fmt.format_map(replacements))  # TODO: Fix this
-
-    def __init__(self, pages, auto_center=True, callback_after_redraw=None, callback_on_select=None):
+            self.fixed_pre_texts, templates = PageView.Page._parse(page_format)
+            replacements = _Replacements(text1=texts[0] if len(texts) > 0 else "",
+                                         text2=texts[1] if len(texts) > 1 else "",
+                                         text3=texts[2] if len(texts) > 2 else "",
+                                         nav="{nav}")
+            self.rows = [template.format_map(replacements) for template in templates]
+
+        @staticmethod
+        def _parse(page_format):
+            page_format = tuple(page_format)
+            parsed = PageView.Page._parsed_formats.get(page_format)
+            if parsed is None:
+                fixed_pre_texts = []
+                templates = []
+                for fmt in page_format:
+                    match = PageView.Page._ROW_PATTERN.match(fmt)
+                    if match:
+                        fixed_pre_texts.append(match.group(1))
+                        templates.append(match.group(2))
+                    else:
+                        fixed_pre_texts.append("")
+                        templates.append(fmt)  # TODO: Fix this
+                parsed = (tuple(fixed_pre_texts), tuple(templates))
+                PageView.Page._parsed_formats[page_format] = parsed
+            return parsed
+
+    def __init__(self, pages, auto_center=True, callback_after_redraw=None, callback_on_select=None,
+                 page_count=None):
         """
         Args:
-            pages: List containing PageView.Pages
+            pages: List containing PageView.Pages or an iterable which creates them on demand
             auto_center: Automatically center the text
+            page_count: Amount of pages if pages is no list (shown as "?" as long as it is unknown)
         """
         super().__init__()
-        self._pages = pages
+        if isinstance(pages, list):
+            self._pages = pages
+            self._page_source = None
+            self._page_count = len(pages)
+        else:
+            self._pages = []
+            self._page_source = iter(pages)
+            self._page_count = page_count
         self._auto_center = auto_center
         self._call_after_redraw = callback_after_redraw
         self._callback = callback_on_select
         self._current_page_idx = 0
+        self._marquees = MarqueeRows()
+
+    def _get_page(self, idx):
+        """Get a page, creating the pages up to it if necessary.
+
+        Returns:
+            The PageView.Page or None if there is no page with this index
+        """
+        while self._page_source is not None and len(self._pages) <= idx:
+            try:
+                self._pages.append(next(self._page_source))
+            except StopIteration:
+                self._page_source = None
+                self._page_count = len(self._pages)
+        return self._pages[idx] if idx < len(self._pages) else None
 
     def redraw(self, menu):
-        for i, row in enumerate(self._pages[self._current_page_idx].rows):
+        page = self._get_page(self._current_page_idx)
+        for i, row in enumerate(page.rows):
             if row == "{nav}":
                 prev_visible = self._current_page_idx > 0
-                next_visible = self._current_page_idx != len(self._pages) - 1
+                next_visible = self._get_page(self._current_page_idx + 1) is not None
                 text = (chr(251) if prev_visible else " ") + \
-                       (str(self._current_page_idx + 1) + "/" + str(len(self._pages))).center(14) + \
+                       (str(self._current_page_idx + 1) + "/" +
+                        ("?" if self._page_count is None else str(self._page_count))).center(14) + \
                        (chr(252) if next_visible else " ")
                 menu.write_row(i, text)
             else:
-                menu.write_option(i, row.center(16) if self._auto_center else row,
-                                  scroll=len(row) > 16,
-                                  scroll_delay=self.scroll_delay,
-                                  scroll_speed=self.scroll_speed,
-                                  icon=self._pages[self._current_page_idx].fixed_pre_texts[i])
+                menu.write_row(i, self._marquees.render(i, row.center(16) if self._auto_center else row,
+                                                        icon=page.fixed_pre_texts[i] or ' ',
+                                                        scroll=len(row) > 16,
+                                                        scroll_delay=self.scroll_delay,
+                                                        scroll_speed=self.scroll_speed))
         if self._call_after_redraw is not None:
             self._call_after_redraw()
 
+    def frame_need(self):
+        return scheduler.scroll_need(self._get_page(self._current_page_idx).rows, self.scroll_speed)
+
     def right(self):
-        if self._current_page_idx < len(self._pages) - 1:
+        if self._get_page(self._current_page_idx + 1) is not None:
             self._current_page_idx += 1
         return True
 
@@ -123,12 +183,25 @@ class PageView(MenuOption):
 class SelectFileView(ScrollableMenu):
     """
     Possibly only works when using base.MenuOptionSwitcher
+
+    The files are given as FileEntries (e.g. from a TransactionIndex) and can be added to while the view is shown.
+    An iterable is consumed lazily: the first screen is shown after its first entries, the remaining ones are taken
+    while scrolling (unless the list is sorted, which needs all of them).
     """
+    SORT_KEYS = {
+        'name': (lambda entry: entry.file_entry_text, False),
+        'mtime': (lambda entry: entry.mtime, True),  # newest first
+        'size': (lambda entry: entry.size, True),  # largest first
+    }
 
     class FileEntry:
-        def __init__(self, file_path, file_entry_text):
+        __slots__ = ('file_path', 'file_entry_text', 'size', 'mtime')
+
+        def __init__(self, file_path, file_entry_text, size=None, mtime=None):
             self.file_path = file_path
             self.file_entry_text = file_entry_text
+            self.size = size
+            self.mtime = mtime
 
         def __str__(self):
             return self.file_entry_text
@@ -136,33 +209,58 @@ class SelectFileView(ScrollableMenu):
         def __repr__(self):
             return str(self)
 
-    def __init__(self, root, prompt="Select file", file_filter_pattern=".*", callback_on_select=None):
+    def __init__(self, file_entries, prompt="Select file", callback_on_select=None, callback_on_cursor_change=None,
+                 sort_by=None):
+        """
+        Args:
+            file_entries: Iterable of FileEntry
+            sort_by: None (given order), "name", "mtime" (newest first) or "size" (largest first)
+        """
         self._callback = callback_on_select
-        self._file_entries = SelectFileView._search_files(root, file_filter_pattern)
-        super().__init__([str(entry) for entry in self._file_entries], prompt)
+        self._callback_cursor = callback_on_cursor_change
+        self._sort_by = sort_by
+        self._file_entries = LazyList(SelectFileView.sort_entries(file_entries, sort_by))
+        super().__init__(self._file_entries, prompt)
 
     @staticmethod
-    def _search_files(search_directory, pattern):
-        """Search files in the given search_directory which match the pattern.
+    def sort_entries(file_entries, sort_by):
+        """Sorts FileEntries (see SORT_KEYS), returning an iterator. Without sort_by, the entries are not touched."""
+        if sort_by is None:
+            return iter(file_entries)
+        key, reverse = SelectFileView.SORT_KEYS[sort_by]
+        return iter(sorted(file_entries, key=key, reverse=reverse))
 
-        Args:
-            search_directory: The directory to search in (not recursively).
-            pattern: The pattern to use as filter (only matches will be included)
+    def add_entries(self, file_entries):
+        """Appends FileEntries (e.g. of a stick which has been listed later), sorted among themselves."""
+        self._file_entries.extend(SelectFileView.sort_entries(file_entries, self._sort_by))
 
-        Returns:
-             List of FileEntry
-        """
-        file_names = os.listdir(search_directory)
-        file_paths_filtered = []
-        for name in file_names:
-            if re.search(pattern, name):
-                file_paths_filtered.append(SelectFileView.FileEntry(os.path.join(search_directory, name), name))
-        return file_paths_filtered
+    def get_entry(self, idx):
+        return self._file_entries[idx].file_entry_text
 
     def select(self):
-        if self._callback and len(self._file_entries) > 0:
+        if self._callback and self._file_entries.available(self._current_idx):
             self._callback(self._file_entries[self._current_idx])
 
+    def up(self):
+        super().up()
+        self._cursor_changed()
+
+    def down(self):
+        super().down()
+        self._cursor_changed()
+
+    def _cursor_changed(self):
+        if self._callback_cursor is not None:
+            self._callback_cursor(self._current_idx)
+
     @property
     def current_file_entry(self):
         return self._file_entries[self._current_idx]
+
+    @property
+    def file_entries(self):
+        return self._file_entries
+
+    @property
+    def current_idx(self):
+        return self._current_idx
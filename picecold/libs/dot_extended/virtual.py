@@ -0,0 +1,245 @@
+import collections
+import threading
+import time
+
+Event = collections.namedtuple('Event', ['time', 'source', 'name', 'args'])
+Event.__doc__ = """Something done with the virtual display: time in seconds since the display has been created, source
+("lcd", "backlight" or "nav"), name of the call and its arguments."""
+
+
+class EventLog:
+    """Thread-safe, timestamped record of everything done with a VirtualDisplay."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self.events = []
+
+    def record(self, source, name, *args):
+        with self._lock:
+            self.events.append(Event(time.monotonic() - self._start, source, name, args))
+
+    def select(self, source=None, name=None) -> list:
+        with self._lock:
+            return [event for event in self.events
+                    if (source is None or event.source == source) and (name is None or event.name == name)]
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+
+
+class VirtualLcd:
+    """In-memory replacement of the dot3k/dothat lcd module (16x3 characters, 8 custom chars).
+
+    Every call which goes over the bus is recorded with the bytes it costs (one per command or character, nine per
+    char definition like for the ST7036), so render costs can be measured without the hardware.
+    """
+    COLS = 16
+    ROWS = 3
+
+    def __init__(self, log: EventLog):
+        self._log = log
+        self._lock = threading.Lock()
+        self._chars = [' '] * (VirtualLcd.COLS * VirtualLcd.ROWS)
+        self._cursor = 0
+        self._animations = {}  # slot -> (frames, frame_rate)
+        self.cgram = [None] * 8
+        self.contrast = None
+        self.bytes = 0
+
+    def set_cursor_position(self, column, row):
+        with self._lock:
+            self._cursor = (row * VirtualLcd.COLS + column) % len(self._chars)
+            self.bytes += 1
+        self._log.record('lcd', 'set_cursor_position', column, row)
+
+    def set_cursor_offset(self, offset):
+        with self._lock:
+            self._cursor = offset % len(self._chars)
+            self.bytes += 1
+        self._log.record('lcd', 'set_cursor_offset', offset)
+
+    def write(self, value):
+        value = str(value)
+        with self._lock:
+            for char in value:
+                self._chars[self._cursor] = char
+                self._cursor = (self._cursor + 1) % len(self._chars)
+            self.bytes += len(value)
+        self._log.record('lcd', 'write', value)
+
+    def clear(self):
+        with self._lock:
+            self._chars = [' '] * len(self._chars)
+            self._cursor = 0
+            self.bytes += 1
+        self._log.record('lcd', 'clear')
+
+    def create_char(self, char_pos, char_map):
+        with self._lock:
+            self.cgram[char_pos] = tuple(char_map)
+            self.bytes += 1 + 8
+        self._log.record('lcd', 'create_char', char_pos, tuple(char_map))
+
+    def create_animation(self, anim_pos, anim_map, frame_rate):
+        with self._lock:
+            self._animations[anim_pos] = (anim_map, frame_rate)
+        self._log.record('lcd', 'create_animation', anim_pos, frame_rate)
+
+    def update_animations(self):
+        with self._lock:
+            animations = list(self._animations.items())
+        for anim_pos, (anim_map, frame_rate) in animations:
+            self.create_char(anim_pos, anim_map[int(round(time.time() * frame_rate)) % len(anim_map)])
+
+    def set_contrast(self, contrast):
+        self.contrast = contrast
+        self._log.record('lcd', 'set_contrast', contrast)
+
+    def set_display_mode(self, enable=True, cursor=False, blink=False):
+        self._log.record('lcd', 'set_display_mode', enable, cursor, blink)
+
+    @property
+    def rows(self) -> list:
+        """The text on the display, one string per row (custom chars as "\\x00" - "\\x07")."""
+        with self._lock:
+            return [''.join(self._chars[row * VirtualLcd.COLS:(row + 1) * VirtualLcd.COLS])
+                    for row in range(VirtualLcd.ROWS)]
+
+    def __str__(self):
+        return '\n'.join(self.rows)
+
+
+class VirtualBacklight:
+    """In-memory replacement of the dot3k/dothat backlight module, recording every change."""
+    LEDS = 6  # the DOT-HAT has six RGB LEDs (the dot3k three), set in groups of two from left to right
+
+    def __init__(self, log: EventLog):
+        self._log = log
+        self.leds = [(0, 0, 0)] * VirtualBacklight.LEDS
+        self.graph = [0.0] * 6
+
+    def rgb(self, r, g, b):
+        self.leds = [(r, g, b)] * VirtualBacklight.LEDS
+        self._log.record('backlight', 'rgb', r, g, b)
+
+    def single_rgb(self, led, r, g, b):
+        self.leds[led] = (r, g, b)
+        self._log.record('backlight', 'single_rgb', led, r, g, b)
+
+    def left_rgb(self, r, g, b):
+        self.leds[0:2] = [(r, g, b)] * 2
+        self._log.record('backlight', 'left_rgb', r, g, b)
+
+    def mid_rgb(self, r, g, b):
+        self.leds[2:4] = [(r, g, b)] * 2
+        self._log.record('backlight', 'mid_rgb', r, g, b)
+
+    def right_rgb(self, r, g, b):
+        self.leds[4:6] = [(r, g, b)] * 2
+        self._log.record('backlight', 'right_rgb', r, g, b)
+
+    def hue(self, hue):
+        self.rgb(*VirtualBacklight.hue_to_rgb(hue))
+
+    def sweep(self, hue, sweep_range=0.0833):
+        for led in range(VirtualBacklight.LEDS):
+            self.leds[led] = VirtualBacklight.hue_to_rgb(hue + sweep_range * led)
+        self._log.record('backlight', 'sweep', hue, sweep_range)
+
+    def off(self):
+        self.rgb(0, 0, 0)
+
+    def set_graph(self, value):
+        lit = value * len(self.graph)
+        self.graph = [max(0.0, min(1.0, lit - idx)) for idx in range(len(self.graph))]
+        self._log.record('backlight', 'set_graph', value)
+
+    def set_bar(self, index, value):
+        self.graph[index] = value
+        self._log.record('backlight', 'set_bar', index, value)
+
+    def graph_off(self):
+        self.set_graph(0)
+
+    @staticmethod
+    def hue_to_rgb(hue):
+        hue %= 1.0
+        sector, fraction = int(hue * 6), hue * 6 - int(hue * 6)
+        rising, falling = int(255 * fraction), int(255 * (1 - fraction))
+        return [(255, rising, 0), (falling, 255, 0), (0, 255, rising),
+                (0, falling, 255), (rising, 0, 255), (255, 0, falling)][sector]
+
+
+class VirtualNav:
+    """In-memory replacement of dothat.touch: handlers are bound with on() and called by press() or play()."""
+    UP = 1
+    DOWN = 2
+    LEFT = 3
+    RIGHT = 5
+    BUTTON = 4
+    CANCEL = 0
+
+    def __init__(self, log: EventLog):
+        self._log = log
+        self._handlers = {}
+
+    def on(self, buttons, bounce=-1):
+        buttons = buttons if isinstance(buttons, (list, tuple)) else [buttons]
+
+        def register(handler):
+            for button in buttons:
+                self._handlers[button] = handler
+            return handler
+        return register
+
+    def press(self, button):
+        """Presses a button - given by its value (e.g. VirtualNav.UP) or name (e.g. "up")."""
+        if isinstance(button, str):
+            button = getattr(VirtualNav, button.upper())
+        self._log.record('nav', 'press', button)
+        handler = self._handlers.get(button)
+        if handler is not None:
+            handler(button, 'press')
+
+    def play(self, script) -> threading.Thread:
+        """Presses buttons from another thread (like the touch driver does).
+
+        Args:
+            script: Iterable of (seconds to wait before the press, button)
+
+        Returns:
+            The started thread, join() it to wait for the end of the script
+        """
+        def run():
+            for delay, button in script:
+                if delay > 0:
+                    time.sleep(delay)
+                self.press(button)
+        thread = threading.Thread(target=run, name="VirtualNav", daemon=True)
+        thread.start()
+        return thread
+
+    # Settings of the touch driver, without effect
+    def enable_repeat(self, enable):
+        pass
+
+    def set_repeat_rate(self, rate):
+        pass
+
+    def high_sensitivity(self):
+        pass
+
+
+class VirtualDisplay:
+    """Headless Display-o-Tron (HAT): lcd, backlight and nav sharing one EventLog.
+
+    Chosen with Display.type = virtual, e.g. to profile the menus or to run them in CI on a normal Linux box.
+    """
+
+    def __init__(self):
+        self.log = EventLog()
+        self.lcd = VirtualLcd(self.log)
+        self.backlight = VirtualBacklight(self.log)
+        self.nav = VirtualNav(self.log)
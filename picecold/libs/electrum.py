@@ -1,5 +1,18 @@
+import base64
+import codecs
+import http.client
+import ipaddress
+import itertools
 import json
+import logging
+import os
+import re
+import socket
 import subprocess
+import threading
+import time
+
+from . import process as proc
 
 
 class ElectrumError(Exception):
@@ -15,49 +28,427 @@ class TransactionReadError(ElectrumError):
     pass
 
 
+class OutputStreamParser:
+    """Incrementally parses Electrum's JSON output and extracts the "outputs" array element by element.
+
+    The text is fed in chunks as it arrives from Electrum. Every output is decoded as soon as it is complete and
+    its text is dropped afterwards, so the complete output never has to be kept as one string. The "inputs" array is
+    streamed the same way, but its elements are only counted (input_count) - consolidation transactions can have
+    thousands of them. The rest of the document is kept as text, but at most MAX_SKELETON characters of it.
+    """
+    _ARRAY_START = re.compile(r'"(inputs|outputs)"\s*:\s*\[')
+    _SKIP = ' \t\r\n,'
+    MAX_SKELETON = 64 * 1024
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._skeleton = []  # everything apart from the inputs and outputs
+        self._skeleton_size = 0
+        self._array = None  # name of the array which is streamed at the moment
+        self._streamed = set()  # names of the arrays which have been streamed completely
+        self.input_count = 0
+        self.outputs = []
+
+    def feed(self, text):
+        """Feed the next chunk of text.
+
+        Returns:
+            List of outputs (dicts) which have been completed by this chunk
+        """
+        self._buffer += text
+        completed = []
+        while True:
+            if self._array is None:
+                match = OutputStreamParser._ARRAY_START.search(self._buffer)
+                if match is None:
+                    # Keep a tail which could be the beginning of the "inputs"/"outputs" key
+                    keep = 32
+                    self._add_skeleton(self._buffer[:-keep])
+                    self._buffer = self._buffer[-keep:]
+                    break
+                self._add_skeleton(self._buffer[:match.end()])
+                self._buffer = self._buffer[match.end():]
+                if match.group(1) in self._streamed:
+                    continue  # only the first array of a name (the one of the transaction) is streamed
+                self._array = match.group(1)
+            if not self._stream_array(completed):
+                break
+        self.outputs.extend(completed)
+        return completed
+
+    def _stream_array(self, completed) -> bool:
+        """Decodes the complete elements of the current array at the start of the buffer.
+
+        Returns:
+            True if the end of the array has been reached
+        """
+        pos = 0
+        closed = False
+        while True:
+            while pos < len(self._buffer) and self._buffer[pos] in OutputStreamParser._SKIP:
+                pos += 1
+            if pos == len(self._buffer):
+                break
+            if self._buffer[pos] == ']':
+                closed = True
+                break
+            try:
+                element, pos = self._decoder.raw_decode(self._buffer, pos)
+            except ValueError:
+                break  # incomplete, wait for more text
+            if self._array == 'outputs':
+                completed.append(element)
+            else:
+                self.input_count += 1
+        self._buffer = self._buffer[pos:]
+        if closed:
+            self._streamed.add(self._array)
+            self._array = None
+        return closed
+
+    def _add_skeleton(self, text):
+        self._skeleton_size += len(text)
+        if self._skeleton_size <= OutputStreamParser.MAX_SKELETON:
+            self._skeleton.append(text)
+
+    def close(self) -> dict:
+        """Finishes parsing.
+
+        Returns:
+            The complete JSON document with all outputs and the number of inputs as "input_count" (instead of
+            the "inputs" array)
+
+        Raises:
+            ValueError: If the text was no valid JSON containing an "outputs" array or too large
+        """
+        if 'outputs' not in self._streamed or self._array is not None:
+            raise ValueError("Electrum output does not contain a complete \"outputs\" list.")
+        if self._skeleton_size > OutputStreamParser.MAX_SKELETON:
+            raise ValueError("Electrum output has more than {0} characters apart from inputs and outputs."
+                             .format(OutputStreamParser.MAX_SKELETON))
+        document = json.loads(''.join(self._skeleton + [self._buffer]))
+        document['outputs'] = self.outputs
+        if 'inputs' in self._streamed:
+            del document['inputs']
+            document['input_count'] = self.input_count
+        return document
+
+
+class RunMetrics:
+    """Measurements of one Electrum operation, split into phases (in seconds, None if not measurable):
+
+    spawn - starting the Electrum process (subprocess backend only)
+    load - loading the wallet (only separable for the daemon, which loads it once in start(), see load_time)
+    work - until Electrum answers; for a subprocess this also covers its startup and wallet load, because
+           Electrum does not write anything before it is done
+    write - receiving the answer and writing it to disk (or parsing it)
+
+    user/system (CPU seconds) and max_rss (peak resident memory in kB) are the usage of the Electrum child process
+    and only known for the subprocess backend.
+    """
+    PHASES = ('spawn', 'load', 'work', 'write')
+
+    def __init__(self):
+        self.phases = dict.fromkeys(RunMetrics.PHASES)
+        self.wall = None
+        self.user = None
+        self.system = None
+        self.max_rss = None
+        self._start = time.monotonic()
+        self._last_mark = self._start
+
+    def mark(self, phase):
+        """Ends the given phase - it started when the previous one ended."""
+        now = time.monotonic()
+        self.phases[phase] = now - self._last_mark
+        self._last_mark = now
+
+    def finish(self, usage: proc.ChildUsage = None):
+        self.wall = time.monotonic() - self._start
+        if usage is not None:
+            self.user, self.system, self.max_rss = usage
+
+    def as_dict(self):
+        metrics = {'wall': self.wall, 'user': self.user, 'system': self.system, 'max_rss': self.max_rss}
+        metrics.update(self.phases)
+        return metrics
+
+
 class ElectrumSigner:
+    """Runs Electrum commands.
+
+    The results of the last operation (last_raw_tx, last_metrics) are kept per thread: one signer
+    (like the shared ElectrumDaemonSigner) can be used by several workers at once, and each of them only sees the
+    results of its own calls.
+    """
+    CHUNK_SIZE = 4096
+
     def __init__(self, path='electrum'):
         self._path = path
-        self._json_tx = None
+        self._last = threading.local()
 
     @property
     def last_raw_tx(self):
-        return self._json_tx
+        return getattr(self._last, 'json_tx', None)
+
+    @property
+    def last_metrics(self) -> RunMetrics:
+        """Measurements of the last operation (None if it failed)."""
+        return getattr(self._last, 'metrics', None)
 
     @staticmethod
     def _convert_satoshi(sat):
         return float(sat) / 10.0 ** 8
 
-    def deserialize_transaction(self, path_txn, convert_to_btc=True):
+    def _extract_outputs(self, convert_to_btc):
+        try:
+            tx_parts = []
+            for tx in self._last.json_tx['outputs']:
+                tx_parts.append((tx['address'],
+                                 self._convert_satoshi(tx['value']) if convert_to_btc else tx['value']))
+            return tx_parts
+        except KeyError:
+            raise IOError("Transaction file does not seem to be valid or does not have a compatible format.")
+
+    def _stream(self, args, on_chunk, job=None, stdin_path=None):
+        """Runs an Electrum command and hands its output chunk by chunk to on_chunk as soon as it arrives.
+
+        Args:
+            args: Electrum arguments (without the Electrum path)
+            on_chunk: Called with every chunk (bytes) of the output
+            job: Optional jobs.Job which can cancel the command (kills its whole process group)
+            stdin_path: Optional file which Electrum reads as stdin ("-" argument)
+
+        Raises:
+            IOError: If stdin_path cannot be opened
+            ElectrumStartError: If Electrum cannot be started or exits with an error
+            jobs.JobCancelledError: If the job has been cancelled or timed out
+        """
+        argv = [self._path] + list(args)
+        self._last.metrics = None
+        metrics = RunMetrics()
+        if stdin_path is not None:
+            # Open it here, so a missing transaction file is not mistaken for a missing Electrum
+            with open(stdin_path, 'rb'):
+                pass
         try:
-            out = subprocess.check_output("cat \"{path_txn}\" | {path_elec} deserialize -"
-                                          .format(path_txn=path_txn, path_elec=self._path),
-                                          shell=True, universal_newlines=True)
-            self._json_tx = json.loads(out)
+            process = proc.spawn(argv, stdin_path, stdout=subprocess.PIPE, start_new_session=True)
+        except OSError:
+            raise ElectrumStartError("Could not start electrum. Path: " + self._path)
+        metrics.mark('spawn')
+        received = 0
+        with process:
+            if job is not None:
+                job.attach_process(process)
             try:
-                tx_parts = []
-                for tx in self._json_tx['outputs']:
-                    tx_parts.append((tx['address'],
-                                     self._convert_satoshi(tx['value']) if convert_to_btc else tx['value']))
-                return tx_parts
-            except KeyError:
-                raise IOError("Transaction file does not seem to be valid or does not have a compatible format.")
+                for chunk in iter(lambda: process.stdout.read1(ElectrumSigner.CHUNK_SIZE), b''):
+                    if received == 0:
+                        metrics.mark('work')
+                    received += len(chunk)
+                    on_chunk(chunk)
+                usage = proc.wait(process)
+            finally:
+                if job is not None:
+                    job.detach()
+        if received == 0:
+            metrics.mark('work')
+        metrics.mark('write')
+        metrics.finish(usage)
+        if job is not None:
+            job.check()
+        if process.returncode != 0:
+            raise ElectrumStartError("Electrum exited with code {0}. Path: {1}".format(process.returncode,
+                                                                                       self._path))
+        self._last.metrics = metrics
+
+    def deserialize_transaction(self, path_txn, convert_to_btc=True, job=None):
+        try:
+            parser = OutputStreamParser()
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            self._stream(['deserialize', '-'], lambda chunk: parser.feed(decoder.decode(chunk)),
+                         job, stdin_path=path_txn)
+            self._last.json_tx = parser.close()
+            return self._extract_outputs(convert_to_btc)
         except IOError:
             raise IOError("Unable to read transaction file. Path: " + path_txn)
-        except subprocess.CalledProcessError:
-            raise ElectrumStartError("Could not start electrum. Path: " + self._path)
 
-    def sign_transaction(self, path_txn, path_signed_txn, password=""):
+    def sign_transaction(self, path_txn, path_signed_txn, password="", job=None):
         try:
-            signed_text = subprocess.check_output("cat \"{path_txn}\" | {path_elec} signtransaction - {password}"
-                                                  .format(path_txn=path_txn, path_elec=self._path,
-                                                          password="" if password == "" else "-W " + password),
-                                                  shell=True, universal_newlines=True)
-            with open(path_signed_txn, 'x') as signed_file:
-                signed_file.write(signed_text)
-                return True
+            ElectrumSigner._write_signed(path_signed_txn, lambda signed_file: self._stream(
+                ['signtransaction', '-'] + ([] if password == "" else ['-W', password]),
+                signed_file.write, job, stdin_path=path_txn))
+            return True
         except IOError as io_err:
-            print(io_err)
+            logging.warning("Signing %s failed: %s", path_txn, io_err)
             raise IOError("Unable to sign. Path: {0}. Details: {1}".format(path_txn, io_err))
+
+    @staticmethod
+    def _write_signed(path_signed_txn, write):
+        """Writes a signed transaction with write(file) into a temporary file, which only gets its final name once
+        write() has succeeded and the content has been synced to the device.
+
+        Raises:
+            FileExistsError: If the signed transaction exists or is being written by someone else at the moment
+        """
+        if os.path.exists(path_signed_txn):
+            raise FileExistsError("File exists: " + path_signed_txn)
+        tmp_path = path_signed_txn + '.part'
+        created = False  # only our own temporary file may be removed, not the one of another run
+        try:
+            with open(tmp_path, 'xb') as signed_file:
+                created = True
+                write(signed_file)
+                # On the device before it gets its final name - a signed file is never seen half-written
+                signed_file.flush()
+                os.fsync(signed_file.fileno())
+            os.rename(tmp_path, path_signed_txn)
+            created = False
+        finally:
+            if created:
+                os.remove(tmp_path)
+
+    def version(self):
+        try:
+            return proc.check_output([self._path, 'version']).strip()
         except subprocess.CalledProcessError:
             raise ElectrumStartError("Could not start electrum. Path: " + self._path)
+
+
+class ElectrumDaemonSigner(ElectrumSigner):
+    """Talks to one long-running offline Electrum daemon via JSON-RPC instead of starting Electrum for every call.
+
+    The daemon is started once (see start()) and keeps the wallet loaded, so the interpreter start, the Electrum
+    import and the wallet decryption are only paid once.
+    Only loopback addresses are accepted as RPC host - the daemon must never be reachable from the outside.
+    """
+    START_TIMEOUT = 120  # seconds
+
+    def __init__(self, path='electrum', host='127.0.0.1', port=7777, user='picecold', password='',
+                 timeout=600):
+        super().__init__(path)
+        if not ipaddress.ip_address(host).is_loopback:
+            raise ValueError("Electrum daemon RPC host has to be a loopback address, got: " + host)
+        self._host = host
+        self._port = int(port)
+        self._auth = base64.b64encode("{0}:{1}".format(user, password).encode()).decode()
+        self._user = user
+        self._rpc_password = password
+        self._timeout = timeout
+        self._ids = itertools.count(1)
+        self.load_time = None
+
+    def start(self, wallet_password=""):
+        """Configures and starts the offline daemon, then loads the wallet.
+
+        Raises:
+            ElectrumStartError: If the daemon could not be started or did not answer in time
+        """
+        for key, value in (('rpchost', self._host), ('rpcport', self._port),
+                           ('rpcuser', self._user), ('rpcpassword', self._rpc_password)):
+            self._run_electrum('setconfig', key, str(value))
+        # "daemon -d" is the Electrum 4 syntax, "daemon start" the one of Electrum 3
+        if not self._run_electrum('daemon', '-d', check=False) and not self._run_electrum('daemon', 'start',
+                                                                                          check=False):
+            raise ElectrumStartError("Could not start electrum daemon. Path: " + self._path)
+        self._wait_until_ready()
+        params = {} if wallet_password == "" else {'password': wallet_password}
+        start = time.monotonic()
+        if not self._call('load_wallet', **params):
+            raise ElectrumStartError("Electrum daemon could not load the wallet.")
+        self.load_time = time.monotonic() - start
+
+    def stop(self):
+        try:
+            self._call('stop')
+        except (ElectrumError, OSError, http.client.HTTPException):
+            pass
+
+    def _run_electrum(self, *args, check=True):
+        err_code = proc.run([self._path, '--offline'] + list(args))
+        if check and err_code != 0:
+            raise ElectrumStartError("Could not run electrum {0}. Path: {1}".format(args[0], self._path))
+        return err_code == 0
+
+    def _wait_until_ready(self):
+        deadline = time.monotonic() + ElectrumDaemonSigner.START_TIMEOUT
+        while True:
+            try:
+                self._call('version')
+                return
+            except (ElectrumError, OSError, http.client.HTTPException):
+                if time.monotonic() > deadline:
+                    raise ElectrumStartError("Electrum daemon did not answer on {0}:{1}."
+                                             .format(self._host, self._port))
+                time.sleep(0.5)
+
+    def _call(self, method, job=None, **params):
+        payload = json.dumps({'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params})
+        remaining = None if job is None else job.remaining()
+        connection = http.client.HTTPConnection(self._host, self._port,
+                                                timeout=self._timeout if remaining is None else remaining)
+        if job is not None:
+            # The daemon keeps working on a cancelled request, but the result is not waited for anymore
+            job.attach(lambda: connection.sock and connection.sock.shutdown(socket.SHUT_RDWR))
+        try:
+            connection.request('POST', '/', body=payload,
+                               headers={'Content-Type': 'application/json',
+                                        'Authorization': 'Basic ' + self._auth})
+            response = connection.getresponse()
+            if response.status != 200:
+                raise ElectrumError("Electrum daemon answered with HTTP {0}.".format(response.status))
+            reply = json.loads(response.read().decode())
+        except (OSError, http.client.HTTPException):
+            if job is not None:
+                job.check()
+            raise
+        finally:
+            if job is not None:
+                job.detach()
+            connection.close()
+        if reply.get('error'):
+            error = reply['error']
+            raise ElectrumError(error.get('message', str(error)) if isinstance(error, dict) else str(error))
+        return reply.get('result')
+
+    @staticmethod
+    def _read_tx(path_txn):
+        with open(path_txn) as tx_file:
+            return tx_file.read().strip()
+
+    def deserialize_transaction(self, path_txn, convert_to_btc=True, job=None):
+        self._last.metrics = None
+        metrics = RunMetrics()
+        try:
+            tx = self._read_tx(path_txn)
+        except IOError:
+            raise IOError("Unable to read transaction file. Path: " + path_txn)
+        self._last.json_tx = self._call('deserialize', job=job, tx=tx)
+        metrics.mark('work')
+        outputs = self._extract_outputs(convert_to_btc)
+        metrics.mark('write')
+        metrics.finish()
+        self._last.metrics = metrics
+        return outputs
+
+    def sign_transaction(self, path_txn, path_signed_txn, password="", job=None):
+        self._last.metrics = None
+        metrics = RunMetrics()
+        try:
+            params = {'tx': self._read_tx(path_txn)}
+            if password != "":
+                params['password'] = password
+            signed = self._call('signtransaction', job=job, **params)
+            metrics.mark('work')
+            content = (signed if isinstance(signed, str) else json.dumps(signed, indent=4)).encode()
+            ElectrumSigner._write_signed(path_signed_txn, lambda signed_file: signed_file.write(content))
+        except IOError as io_err:
+            logging.warning("Signing %s failed: %s", path_txn, io_err)
+            raise IOError("Unable to sign. Path: {0}. Details: {1}".format(path_txn, io_err))
+        metrics.mark('write')
+        metrics.finish()
+        self._last.metrics = metrics
+        return True
+
+    def version(self):
+        return str(self._call('version')).strip()
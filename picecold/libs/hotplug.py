@@ -0,0 +1,53 @@
+import logging
+import threading
+
+from .block_devices import DeviceRegistry
+
+
+class HotplugWatcher:
+    """Notices sticks being plugged in or removed by polling the device registry in the background.
+
+    A poll only reads /proc/partitions and stats /dev/disk/by-uuid (see DeviceRegistry.refresh), so polling every
+    second costs next to nothing. Callbacks get the block_devices.BlockDevice and run on the watcher's thread.
+    """
+
+    def __init__(self, registry: DeviceRegistry, on_added=None, on_removed=None, dev_filter=None, interval=1.0):
+        self._registry = registry
+        self._on_added = on_added
+        self._on_removed = on_removed
+        self._dev_filter = dev_filter
+        self._interval = interval
+        self._known = {}  # uuid -> BlockDevice
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Checks once for added and removed devices and calls the callbacks."""
+        devices = {device.uuid: device for device in self._registry.devices(self._dev_filter)}
+        added = [device for uuid, device in devices.items() if uuid not in self._known]
+        removed = [device for uuid, device in self._known.items() if uuid not in devices]
+        self._known = devices
+        for device, callback in [(device, self._on_removed) for device in removed] + \
+                                [(device, self._on_added) for device in added]:
+            if callback is not None:
+                try:
+                    callback(device)
+                except Exception:
+                    logging.exception("Error in hotplug callback for %s", device)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="HotplugWatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self._interval)
@@ -0,0 +1,190 @@
+import os
+import signal
+import threading
+import time
+
+from .electrum import ElectrumError
+
+
+class JobCancelledError(ElectrumError):
+    pass
+
+
+class JobTimeoutError(JobCancelledError):
+    pass
+
+
+class Job:
+    """Handle of one Electrum operation which can be cancelled from any thread and has an optional deadline.
+
+    Processes attached to a job are started in their own process group, so cancelling kills Electrum together with
+    anything it started: first with SIGTERM, then with SIGKILL if the group is still alive after KILL_GRACE seconds.
+    """
+    KILL_GRACE = 3  # seconds
+
+    def __init__(self, timeout=None, watchdog=None):
+        """
+        Args:
+            timeout: Seconds after start() at which the job is cancelled with JobTimeoutError (None: never)
+            watchdog: Watchdog enforcing the timeout and the kill (default: the shared one)
+        """
+        self._timeout = timeout
+        self._watchdog = watchdog if watchdog is not None else _watchdog
+        self._lock = threading.Lock()
+        self._process = None
+        self._abort = None
+        self._error = None
+        self.deadline = None
+        self.kill_at = None
+
+    def start(self):
+        """Marks the job as running - the deadline starts now (time spent waiting in a queue does not count)."""
+        if self._timeout is not None:
+            self.deadline = self._watchdog.clock() + self._timeout
+        self._watchdog.watch(self)
+        self.check()
+
+    def finish(self):
+        self._watchdog.unwatch(self)
+
+    def attach_process(self, process):
+        """Attaches a process started with start_new_session=True, which is killed on cancel."""
+        with self._lock:
+            self._process = process
+            cancelled = self._error is not None
+        if cancelled:
+            self._terminate(process)
+
+    def attach(self, abort):
+        """Attaches any other callable which aborts the current operation on cancel."""
+        with self._lock:
+            self._abort = abort
+            cancelled = self._error is not None
+        if cancelled:
+            abort()
+
+    def detach(self):
+        with self._lock:
+            self._process = None
+            self._abort = None
+
+    def cancel(self, error=None):
+        with self._lock:
+            if self._error is None:
+                self._error = error if error is not None else JobCancelledError("Cancelled by user.")
+            process, abort = self._process, self._abort
+        if process is not None:
+            self._terminate(process)
+        if abort is not None:
+            abort()
+
+    def check(self):
+        """Raises the cancellation reason if the job has been cancelled.
+
+        Raises:
+            JobCancelledError: If cancelled by the user
+            JobTimeoutError: If cancelled because the deadline has passed
+        """
+        if self._error is not None:
+            raise self._error
+
+    @property
+    def cancelled(self):
+        return self._error is not None
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def remaining(self):
+        return None if self.deadline is None else max(self.deadline - self._watchdog.clock(), 0.0)
+
+    def _terminate(self, process):
+        self._signal_group(process, signal.SIGTERM)
+        self.kill_at = self._watchdog.clock() + Job.KILL_GRACE
+        self._watchdog.wake()
+
+    def kill(self):
+        self.kill_at = None
+        with self._lock:
+            process = self._process
+        if process is not None:
+            self._signal_group(process, signal.SIGKILL)
+
+    @staticmethod
+    def _signal_group(process, sig):
+        # Signal the group even if its leader has already exited - its children may still be running
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+class Watchdog:
+    """One background thread which cancels jobs after their deadline and kills process groups ignoring SIGTERM."""
+
+    def __init__(self, clock=time.monotonic, background=True):
+        """
+        Args:
+            clock: Returns the current time in seconds (like time.monotonic)
+            background: Start the thread with the first watched job - without it, poll() has to be called instead
+        """
+        self.clock = clock
+        self._background = background
+        self._condition = threading.Condition()
+        self._jobs = set()
+        self._thread = None
+
+    def watch(self, job: Job):
+        with self._condition:
+            self._jobs.add(job)
+            if self._background and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ElectrumWatchdog", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def unwatch(self, job: Job):
+        with self._condition:
+            self._jobs.discard(job)
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify()
+
+    def __contains__(self, job: Job):
+        with self._condition:
+            return job in self._jobs
+
+    def poll(self):
+        """Cancels the jobs whose deadline has passed and kills the ones whose grace period is over (once)."""
+        with self._condition:
+            expired, to_kill, _ = self._due()
+        self._handle(expired, to_kill)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                expired, to_kill, wait = self._due()
+                if not expired and not to_kill:
+                    self._condition.wait(wait)
+                    continue
+            self._handle(expired, to_kill)
+
+    def _due(self):
+        """Get the expired jobs, the jobs to kill and the seconds until the next one is due (None: nothing)."""
+        now = self.clock()
+        expired = [job for job in self._jobs
+                   if job.deadline is not None and now >= job.deadline and not job.cancelled]
+        to_kill = [job for job in self._jobs if job.kill_at is not None and now >= job.kill_at]
+        wake_times = [t for job in self._jobs for t in (job.deadline, job.kill_at) if t is not None and t > now]
+        return expired, to_kill, min(wake_times) - now if wake_times else None
+
+    @staticmethod
+    def _handle(expired, to_kill):
+        for job in expired:
+            job.cancel(JobTimeoutError("Electrum did not finish within {0:.0f}s.".format(job.timeout)))
+        for job in to_kill:
+            job.kill()
+
+
+_watchdog = Watchdog()
@@ -0,0 +1,113 @@
+class LatencyModel:
+    """Latency model for Electrum operations: seconds = overhead + per_kb * size + per_io * (inputs + outputs).
+
+    The coefficients are fitted with weighted least squares over the recorded samples. Older samples decay
+    exponentially (every new sample multiplies the weight of all older ones with DECAY), so the model follows
+    changes like a new Electrum version. Percentiles come from the weighted distribution of the residuals.
+    """
+    DECAY = 0.85
+    MAX_SAMPLES = 40
+
+    def __init__(self, samples=None):
+        """
+        Args:
+            samples: List of [size_kb, io_count, seconds], oldest first
+        """
+        self._samples = [list(sample) for sample in (samples or [])][-LatencyModel.MAX_SAMPLES:]
+        self._fit()
+
+    @property
+    def samples(self):
+        return self._samples
+
+    def add(self, size_kb, io_count, seconds):
+        self._samples.append([size_kb, io_count, seconds])
+        del self._samples[:-LatencyModel.MAX_SAMPLES]
+        self._fit()
+
+    def _weights(self):
+        n = len(self._samples)
+        return [LatencyModel.DECAY ** (n - 1 - i) for i in range(n)]
+
+    def _fit(self):
+        self.overhead, self.per_kb, self.per_io = 0.0, 0.0, 0.0
+        self._residuals = []
+        if len(self._samples) == 0:
+            return
+        weights = self._weights()
+        io_known = all(sample[1] is not None for sample in self._samples)
+        # Try the full model first and drop features which would get a negative cost (e.g. too few samples)
+        for features in ((True, True), (True, False), (False, False)):
+            if features[1] and not io_known:
+                continue
+            coefficients = self._solve(weights, *features)
+            if coefficients is not None and min(coefficients) >= 0:
+                self.overhead, self.per_kb, self.per_io = coefficients
+                break
+        self._residuals = sorted((sample[2] - self._predict(sample[0], sample[1]), weight)
+                                 for sample, weight in zip(self._samples, weights))
+
+    def _solve(self, weights, use_size, use_io):
+        """Weighted least squares via the normal equations (at most 3x3, solved with Gaussian elimination)."""
+        rows = [[1.0] + ([sample[0]] if use_size else []) + ([sample[1]] if use_io else [])
+                for sample in self._samples]
+        n = len(rows[0])
+        if len(rows) < n:
+            return None
+        matrix = [[sum(w * row[i] * row[j] for row, w in zip(rows, weights)) for j in range(n)] +
+                  [sum(w * row[i] * sample[2] for row, w, sample in zip(rows, weights, self._samples))]
+                  for i in range(n)]
+        for col in range(n):
+            pivot = max(range(col, n), key=lambda r: abs(matrix[r][col]))
+            if abs(matrix[pivot][col]) < 1e-12:
+                return None
+            matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+            for r in range(n):
+                if r != col:
+                    factor = matrix[r][col] / matrix[col][col]
+                    matrix[r] = [a - factor * b for a, b in zip(matrix[r], matrix[col])]
+        solution = [matrix[i][n] / matrix[i][i] for i in range(n)]
+        overhead = solution.pop(0)
+        per_kb = solution.pop(0) if use_size else 0.0
+        per_io = solution.pop(0) if use_io else 0.0
+        return overhead, per_kb, per_io
+
+    def _predict(self, size_kb, io_count):
+        if io_count is None:
+            io_count = self.mean_io_count
+        return self.overhead + self.per_kb * size_kb + self.per_io * io_count
+
+    @property
+    def mean_io_count(self):
+        known = [(sample[1], w) for sample, w in zip(self._samples, self._weights()) if sample[1] is not None]
+        total_weight = sum(w for _, w in known)
+        return sum(io * w for io, w in known) / total_weight if total_weight > 0 else 0.0
+
+    def estimate(self, size_kb, io_count=None, percentile=50):
+        """Estimated duration of an operation.
+
+        Args:
+            size_kb: Size of the transaction
+            io_count: Amount of inputs + outputs (the weighted mean of the samples is used if unknown)
+            percentile: 50 for the median, 90 for a pessimistic estimate etc.
+
+        Returns:
+            Estimated seconds or None if there are no samples yet
+        """
+        if len(self._samples) == 0:
+            return None
+        return max(self._predict(size_kb, io_count) + self._residual_percentile(percentile), 0.0)
+
+    def _residual_percentile(self, percentile):
+        total_weight = sum(w for _, w in self._residuals)
+        threshold = total_weight * percentile / 100.0
+        cumulated = 0.0
+        for residual, weight in self._residuals:
+            cumulated += weight
+            if cumulated >= threshold - 1e-9:
+                return residual
+        return self._residuals[-1][0]
+
+    def __repr__(self):
+        return "LatencyModel({0:.2f}s + {1:.2f}s/kb + {2:.3f}s/io, n={3})".format(
+            self.overhead, self.per_kb, self.per_io, len(self._samples))
@@ -0,0 +1,140 @@
+import logging
+import threading
+
+from . import mount_tool
+
+
+class _Session:
+    def __init__(self, device, mount_point, owned):
+        self.device = device
+        self.mount_point = mount_point
+        self.owned = owned  # mounted by us (and not by someone else before)
+        self.leases = 0
+        self.timer = None
+
+    def cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+class MountLease:
+    """Keeps a device mounted until it is released (see MountSessionManager)."""
+
+    def __init__(self, manager, session: _Session):
+        self._manager = manager
+        self.session = session
+        self.released = False
+
+    @property
+    def device(self):
+        return self.session.device
+
+    @property
+    def mount_point(self):
+        return self.session.mount_point
+
+    def release(self):
+        self._manager.release(self)
+
+
+class MountSessionManager:
+    """Hands out reference-counted leases on mounted devices, so a stick is not mounted again for every signature.
+
+    The first lease mounts the device, further leases share the mount. After the last lease has been released, the
+    device stays mounted for idle_timeout seconds (0 unmounts at once) - a lease taken in the meantime keeps it.
+    eject() unmounts at once, no matter how many leases there are (they become stale). Devices which were already
+    mounted by someone else are shared, but only unmounted by eject().
+    """
+
+    def __init__(self, idle_timeout=30.0):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.RLock()
+        self._sessions = {}  # device -> _Session
+
+    def acquire(self, device, mount_target, options="") -> MountLease:
+        """Get a lease on a device, mounting it to mount_target if it is not mounted yet.
+
+        Returns:
+            The MountLease or None if the device could not be mounted
+        """
+        with self._lock:
+            session = self._sessions.get(device)
+            if session is not None and mount_tool.mount_table.mount_point(device) is None:
+                session.cancel_timer()  # unmounted behind our back
+                del self._sessions[device]
+                session = None
+            if session is None:
+                mount_point = mount_tool.mount_table.mount_point(device)
+                if mount_point is not None:
+                    session = _Session(device, mount_point, owned=False)
+                elif mount_tool.mount(device, mount_target, options):
+                    session = _Session(device, mount_target, owned=True)
+                else:
+                    return None
+                self._sessions[device] = session
+            session.cancel_timer()
+            session.leases += 1
+            return MountLease(self, session)
+
+    def release(self, lease: MountLease):
+        with self._lock:
+            if lease.released:
+                return
+            lease.released = True
+            session = lease.session
+            if self._sessions.get(session.device) is not session:
+                return  # ejected in the meantime
+            session.leases -= 1
+            if session.leases > 0:
+                return
+            if not session.owned:
+                del self._sessions[session.device]
+            elif self.idle_timeout <= 0:
+                self._unmount(session)
+            else:
+                self._start_timer(session)
+
+    def _start_timer(self, session: _Session):
+        session.timer = threading.Timer(self.idle_timeout, self._expire, [session])
+        session.timer.daemon = True
+        session.timer.start()
+
+    def _expire(self, session: _Session):
+        with self._lock:
+            if self._sessions.get(session.device) is session and session.leases == 0:
+                self._unmount(session)
+
+    def eject(self, device=None) -> bool:
+        """Unmounts the device (or all devices with sessions) at once.
+
+        Returns:
+            True if all of them have been unmounted
+        """
+        with self._lock:
+            sessions = [session for session in self._sessions.values() if device is None or session.device == device]
+            return all([self._unmount(session) for session in sessions])
+
+    def close(self):
+        """Unmounts all devices mounted by this manager (e.g. at exit)."""
+        with self._lock:
+            return all([self._unmount(session) for session in list(self._sessions.values()) if session.owned])
+
+    def is_mounted(self, device) -> bool:
+        with self._lock:
+            return device in self._sessions
+
+    def _unmount(self, session: _Session) -> bool:
+        session.cancel_timer()
+        # umount writes everything back to the device before it returns
+        if mount_tool.umount(session.device):
+            self._sessions.pop(session.device, None)
+            return True
+        # Still mounted (e.g. busy): keep the session, so the device is not mounted a second time, and try again later
+        logging.warning("Could not unmount %s from %s", session.device, session.mount_point)
+        if session.owned and session.leases == 0 and self.idle_timeout > 0:
+            self._start_timer(session)
+        return False
+
+
+sessions = MountSessionManager()
@@ -1,66 +1,171 @@
+"""Mounting and the table of mounted filesystems, read from /proc/self/mountinfo instead of "mount -l"."""
+import logging
+import os
 import re
-import subprocess
+import select
+import threading
 
-blkid_dict = dict()
+from . import process as proc
+from .block_devices import registry
 
+# mount/umount need root - run them through sudo unless we are root already
+_SUDO = [] if os.geteuid() == 0 else ['sudo']
+_ESCAPED = re.compile(r'\\([0-7]{3})')
 
-def read_blkid(dev_filter=None):
-    output_elements = str(subprocess.check_output("sudo blkid", shell=True, universal_newlines=True)).split()
-    key = None
-    for el in output_elements:
-        if el[len(el) - 1] == ':':
-            if dev_filter is None or re.match(dev_filter, el[0:len(el) - 1]):
-                key = el[0:len(el) - 1]
-                blkid_dict[key] = dict()
-        elif key is not None:
-            pair_delim_pos = el.find('=')
-            blkid_dict[key][el[0:pair_delim_pos]] = el[pair_delim_pos + 2:-1]
 
+class MountEntry:
+    __slots__ = ('device', 'mount_point', 'fs_type', 'options')
 
-def is_plugged_in(dev_or_uuid):
-    if dev_or_uuid in blkid_dict:
-        return True
-    else:
-        for dev in blkid_dict:
-            if 'UUID' in blkid_dict[dev].keys() and blkid_dict[dev]['UUID'] == dev_or_uuid:
-                return True
-    return False
+    def __init__(self, device, mount_point, fs_type, options):
+        self.device = device
+        self.mount_point = mount_point
+        self.fs_type = fs_type
+        self.options = options
+
+    def __repr__(self):
+        return "MountEntry({0} on {1} type {2})".format(self.device, self.mount_point, self.fs_type)
+
+
+class MountTable:
+    """The mounted filesystems, indexed by device and by mount point.
+
+    mountinfo is parsed once and kept until the kernel reports a change: /proc/self/mountinfo signals every mount
+    and unmount to poll() with POLLPRI, so checking for changes does not even read the file. Other files (e.g. a
+    fake mountinfo in tests) are checked by their mtime and size instead.
+    """
+
+    def __init__(self, path='/proc/self/mountinfo'):
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._poll = None
+        self._stat = None
+        self._by_device = {}
+        self._by_mount_point = {}
+        self._valid = False
+        self.reads = 0
+
+    def invalidate(self):
+        """Forces the table to be read again (done after every mount/umount of this module)."""
+        with self._lock:
+            self._valid = False
+
+    def _refresh(self):
+        with self._lock:
+            if self._valid and not self._changed():
+                return
+            try:
+                self._read()
+                self._valid = True
+            except OSError as ex:
+                logging.warning("Could not read mount table \"%s\": %s", self._path, ex)
+                self._by_device, self._by_mount_point = {}, {}
+
+    def _changed(self) -> bool:
+        if self._poll is not None:
+            return len(self._poll.poll(0)) > 0
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return True
+        return (stat.st_mtime_ns, stat.st_size) != self._stat
+
+    def _read(self):
+        if self._path.startswith('/proc/'):
+            if self._file is None:
+                self._file = open(self._path)
+                self._poll = select.poll()
+                self._poll.register(self._file, select.POLLPRI | select.POLLERR)
+            self._file.seek(0)
+            self._poll.poll(0)  # reading from the start acknowledges the change
+            content = self._file.read()
+        else:
+            stat = os.stat(self._path)
+            with open(self._path) as mountinfo:
+                content = mountinfo.read()
+            self._stat = (stat.st_mtime_ns, stat.st_size)
+        self.reads += 1
+        by_device = {}
+        by_mount_point = {}
+        for line in content.splitlines():
+            # 36 35 98:0 /mnt1 /mnt2 rw,noatime master:1 - ext3 /dev/root rw,errors=continue
+            fields = line.split()
+            try:
+                separator = fields.index('-', 6)
+                entry = MountEntry(_unescape(fields[separator + 2]), _unescape(fields[4]), fields[separator + 1],
+                                   fields[5] + ',' + fields[separator + 3] if len(fields) > separator + 3
+                                   else fields[5])
+            except (ValueError, IndexError):
+                logging.debug("Skipping unknown mountinfo line: %s", line)
+                continue
+            by_device[entry.device] = entry  # the last mount of a device is the visible one
+            by_mount_point[entry.mount_point] = entry
+        self._by_device = by_device
+        self._by_mount_point = by_mount_point
 
+    def entries(self) -> list:
+        self._refresh()
+        return list(self._by_mount_point.values())
 
-def get_dev(uuid) -> str:
-    for dev in blkid_dict:
-        if 'UUID' in blkid_dict[dev].keys() and blkid_dict[dev]['UUID'] == uuid:
-            return dev
-    return ""
+    def by_device(self, device) -> MountEntry:
+        """Get the mount of a device (e.g. "/dev/sda1") or None if it is not mounted."""
+        self._refresh()
+        return self._by_device.get(device)
+
+    def by_mount_point(self, mount_point) -> MountEntry:
+        self._refresh()
+        return self._by_mount_point.get(os.path.normpath(mount_point))
+
+    def by_uuid(self, uuid) -> MountEntry:
+        """Get the mount of the device with this filesystem UUID (see block_devices) or None."""
+        device = registry.by_uuid(uuid)
+        return self.by_device(device.path) if device is not None else None
+
+    def mount_point(self, device) -> str:
+        entry = self.by_device(device)
+        return entry.mount_point if entry is not None else None
+
+
+def _unescape(field):
+    # mountinfo escapes space, tab, newline and backslash as octal (e.g. "\040")
+    return _ESCAPED.sub(lambda match: chr(int(match.group(1), 8)), field)
+
+
+mount_table = MountTable()
 
 
 def mount(dev, mnt_point, opt="") -> bool:
-    subprocess.call("sudo mkdir {mnt}".format(mnt=mnt_point), shell=True)
-    err_code = subprocess.call("sudo mount {dev} {mnt} {opt}"
-                               .format(dev=dev, mnt=mnt_point, opt="" if opt == "" else "-o " + opt), shell=True)
-    if err_code == 0:
+    if mount_table.mount_point(dev) == os.path.normpath(mnt_point):
         return True
-    else:
-        return False
+    if not os.path.isdir(mnt_point):
+        try:
+            os.makedirs(mnt_point)
+        except PermissionError:
+            proc.run(_SUDO + ['mkdir', '-p', mnt_point])
+        except OSError as ex:
+            logging.warning("Could not create mount point \"%s\": %s", mnt_point, ex)
+    err_code = proc.run(_SUDO + ['mount', dev, mnt_point] + ([] if opt == "" else ['-o', opt]))
+    mount_table.invalidate()
+    return err_code == 0
 
 
-def umount(dev) -> bool:
-    err_code = subprocess.call('sudo umount {dev}'.format(dev=dev), shell=True)
-    if err_code == 0:
-        return True
-    else:
-        return False
+def umount(dev_or_mnt_point) -> bool:
+    """Unmounts a device (e.g. "/dev/sda1") or a mount point."""
+    err_code = proc.run(_SUDO + ['umount', dev_or_mnt_point])
+    mount_table.invalidate()
+    return err_code == 0
 
 
 def get_mount_points(dev_filter="/dev/.*") -> dict:
-    mounted_devs = {}
-    dev_lines = str(subprocess.check_output("mount -l", shell=True, universal_newlines=True)).split('\n')
-    for dev_line in dev_lines:
-        kw_pos = dev_line.find("on")
-        if kw_pos == -1 and dev_line != '':
-            raise LookupError("Could not parse: Unknown format of \"mount -l\" output. Missing \"on\"-keyword.")
-        else:
-            dev = dev_line[0:kw_pos - 1]
-            if re.match(dev_filter, dev):
-                mounted_devs[dev] = dev_line[kw_pos + 3:dev_line.find(' ', kw_pos + 3)]
-    return mounted_devs
+    """Get the mount points of all mounted devices which match dev_filter (device -> mount point)."""
+    return {entry.device: entry.mount_point for entry in mount_table.entries() if re.match(dev_filter, entry.device)}
+
+
+def sync_file(path):
+    """Writes a file and its directory entry through to the device (e.g. before reporting it as saved)."""
+    for sync_path in (path, os.path.dirname(os.path.abspath(path))):
+        fd = os.open(sync_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
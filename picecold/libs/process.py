@@ -0,0 +1,127 @@
+"""Process-launch layer for all external programs (Electrum, mount, ...).
+
+Programs are started directly from an argv list - never through a shell - and input files are handed to them as
+their stdin file descriptor instead of piping them through "cat". Every spawn is timed (see spawn_stats).
+"""
+import collections
+import os
+import subprocess
+import threading
+import time
+
+ChildUsage = collections.namedtuple('ChildUsage', ['user', 'system', 'max_rss'])
+ChildUsage.__doc__ = "CPU time (user/system in seconds) and peak resident memory (max_rss in kB) of a child process."
+
+
+class SpawnStats:
+    """Keeps how long starting (fork + exec) each program took."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, program, seconds):
+        with self._lock:
+            count, total, _ = self._stats.get(program, (0, 0.0, 0.0))
+            self._stats[program] = (count + 1, total + seconds, seconds)
+
+    def average(self, program):
+        """Get the average spawn time of a program.
+
+        Returns:
+            Average spawn time in seconds or None if the program has not been started yet
+        """
+        with self._lock:
+            count, total, _ = self._stats.get(program, (0, 0.0, 0.0))
+        return total / count if count > 0 else None
+
+    def last(self, program):
+        with self._lock:
+            return self._stats.get(program, (0, 0.0, None))[2]
+
+    def as_dict(self):
+        with self._lock:
+            return {program: {'count': count, 'avg': total / count, 'last': last}
+                    for program, (count, total, last) in self._stats.items()}
+
+
+spawn_stats = SpawnStats()
+
+
+def program_name(argv) -> str:
+    """The name under which spawns of argv are tracked (skips "sudo")."""
+    args = argv[1:] if os.path.basename(argv[0]) == 'sudo' and len(argv) > 1 else argv
+    return os.path.basename(args[0])
+
+
+def spawn(argv, stdin_path=None, **popen_kwargs) -> subprocess.Popen:
+    """Starts a program directly (without shell).
+
+    Args:
+        argv: Program and its arguments
+        stdin_path: Optional file which becomes the stdin of the program (the program inherits the open file)
+        popen_kwargs: Passed to subprocess.Popen
+
+    Raises:
+        OSError: If the program or the stdin file cannot be opened
+    """
+    stdin_file = open(stdin_path, 'rb') if stdin_path is not None else None
+    try:
+        if stdin_file is not None:
+            popen_kwargs['stdin'] = stdin_file
+        start = time.monotonic()
+        process = subprocess.Popen(argv, **popen_kwargs)
+        spawn_stats.add(program_name(argv), time.monotonic() - start)
+        return process
+    finally:
+        if stdin_file is not None:
+            stdin_file.close()  # the child has its own copy of the descriptor
+
+
+def wait(process: subprocess.Popen) -> ChildUsage:
+    """Waits for a spawned program like Popen.wait() and returns the resources it used.
+
+    The child is reaped with wait4, which is the only way to get the usage of one specific child (RUSAGE_CHILDREN
+    would mix in every other program which has been started in the meantime).
+    """
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        process.wait()  # already reaped elsewhere, the usage is lost
+        return ChildUsage(None, None, None)
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return ChildUsage(usage.ru_utime, usage.ru_stime, usage.ru_maxrss)
+
+
+def run(argv, stdin_path=None) -> int:
+    """Runs a program to completion, discarding its output.
+
+    Returns:
+        The exit code (127 if the program could not be started, like a shell would report it)
+    """
+    try:
+        process = spawn(argv, stdin_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError as ex:
+        if stdin_path is not None and ex.filename == stdin_path:
+            raise
+        return 127
+    return process.wait()
+
+
+def check_output(argv, stdin_path=None) -> str:
+    """Runs a program to completion and returns its output.
+
+    Raises:
+        subprocess.CalledProcessError: If the program exits with an error or cannot be started
+    """
+    try:
+        process = spawn(argv, stdin_path, stdout=subprocess.PIPE, universal_newlines=True)
+    except FileNotFoundError as ex:
+        if stdin_path is not None and ex.filename == stdin_path:
+            raise
+        raise subprocess.CalledProcessError(127, argv)
+    with process:
+        output = process.stdout.read()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, argv, output)
+    return output
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+
+class TransactionCache:
+    """LRU cache for deserialized transactions, keyed by the SHA-256 of the transaction file content.
+
+    Every entry holds the parsed outputs and the raw transaction (as returned by last_raw_tx), so reading the same
+    transaction again does not need Electrum at all. If a file path is given, the cache is also stored there
+    (e.g. on the SD card) and survives restarts. Changes are written SAVE_DELAY seconds after the first of them
+    (so a burst of puts, e.g. by the prefetcher, is written once) and when the cache is closed.
+    """
+    SAVE_DELAY = 5.0
+
+    # Digests of the files hashed so far, shared by all caches: path -> (size, mtime, SHA-256)
+    _digests = {}
+    _digests_lock = threading.Lock()
+
+    def __init__(self, max_entries=32, file_path=None):
+        self._max_entries = max_entries
+        self._file_path = file_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        if file_path:
+            self._load()
+
+    @staticmethod
+    def hash_file(path) -> str:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as tx_file:
+            for chunk in iter(lambda: tx_file.read(64 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    @staticmethod
+    def file_key(path) -> str:
+        """Get the key of a transaction file - it is only hashed again if its size or mtime has changed."""
+        key = TransactionCache.known_key(path)
+        if key is None:
+            stat = os.stat(path)
+            key = TransactionCache.hash_file(path)
+            TransactionCache.remember_key(path, stat.st_size, stat.st_mtime, key)
+        return key
+
+    @staticmethod
+    def known_key(path) -> str:
+        """Get the key of a transaction file without reading it (needs only a stat).
+
+        Returns:
+            The key or None if the file has not been hashed yet (or has changed since)
+        """
+        with TransactionCache._digests_lock:
+            known = TransactionCache._digests.get(path)
+        if known is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return known[2] if known[:2] == (stat.st_size, stat.st_mtime) else None
+
+    @staticmethod
+    def remember_key(path, size, mtime, key):
+        """Takes over a digest computed elsewhere (e.g. stored in a TransactionIndex)."""
+        with TransactionCache._digests_lock:
+            TransactionCache._digests[path] = (size, mtime, key)
+
+    def get(self, key):
+        """Get a cached transaction.
+
+        Returns:
+            Tuple (outputs, raw_tx) or None if the key is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return [tuple(output) for output in entry['outputs']], entry['raw_tx']
+
+    def put(self, key, outputs, raw_tx):
+        with self._lock:
+            self._entries[key] = {'outputs': [list(output) for output in outputs], 'raw_tx': raw_tx}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            if self._file_path and self._save_timer is None:
+                self._save_timer = threading.Timer(TransactionCache.SAVE_DELAY, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def flush(self):
+        """Writes pending changes to the file of the cache."""
+        with self._lock:
+            if self._save_timer is None:
+                return
+            self._save_timer.cancel()
+            self._save_timer = None
+            entries = list(self._entries.items())
+        self._save(entries)
+
+    def _load(self):
+        try:
+            with open(self._file_path) as cache_file:
+                entries = json.load(cache_file)
+            for key, entry in entries[-self._max_entries:]:
+                self._entries[key] = entry
+        except FileNotFoundError:
+            pass
+        except (IOError, ValueError) as ex:
+            logging.warning("Ignoring unreadable transaction cache \"%s\": %s", self._file_path, ex)
+
+    def _save(self, entries):
+        # Written outside of the cache lock, so reading from the cache does not wait for the SD card
+        with self._save_lock:
+            tmp_path = self._file_path + '.tmp'
+            try:
+                with open(tmp_path, 'w') as cache_file:
+                    json.dump(entries, cache_file)
+                os.replace(tmp_path, self._file_path)
+            except IOError as ex:
+                logging.warning("Could not save transaction cache to \"%s\": %s", self._file_path, ex)
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from .tx_cache import TransactionCache
+
+
+class IndexedTransaction:
+    __slots__ = ('rel_path', 'size', 'mtime', 'hash', 'signed')
+
+    def __init__(self, rel_path, size, mtime, tx_hash, signed):
+        self.rel_path = rel_path
+        self.size = size
+        self.mtime = mtime
+        self.hash = tx_hash
+        self.signed = signed
+
+    def as_list(self):
+        return [self.size, self.mtime, self.hash, self.signed]
+
+
+class TransactionIndex:
+    """Index of all transactions below a root directory of one USB stick, stored on the SD card.
+
+    The index stores path, size, mtime, content hash (SHA-256 like the TransactionCache) and signed status of every
+    transaction file (signed ones are never hashed). A rescan lists every directory again (directory mtimes cannot be trusted on FAT sticks: Linux
+    reports 0 for the root directory and Windows does not update them at all), but does not hash anything, so the
+    list is available at once. New and changed unsigned files are hashed afterwards on a background thread; the hashes are
+    handed to the TransactionCache, so a selected transaction does not have to be hashed again.
+    """
+    VERSION = 2
+    SKIPPED_DIRS = re.compile(r'^(\..*|System Volume Information|\$RECYCLE\.BIN)$')
+
+    _shared = {}  # file path -> (arguments, TransactionIndex), see shared()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, file_path, root, unsigned_regex, signed_suffix, recursive=True):
+        """
+        Args:
+            file_path: File of the index on the SD card (one per stick, see index_path())
+            root: Directory to search in (on the mounted stick)
+            unsigned_regex: Compiled pattern matching the names of unsigned transactions
+            signed_suffix: Suffix of signed transactions (without .txn, may contain "{time}")
+            recursive: Include subdirectories of root
+        """
+        self._file_path = file_path
+        self._root = root
+        self._unsigned_regex = unsigned_regex
+        self._signed_regex = re.compile(re.escape(signed_suffix).replace(re.escape('{time}'), '.*') + r'\.txn$')
+        self._recursive = recursive
+        self._lock = threading.Lock()
+        self._hashing = None  # thread hashing new and changed files
+        self._dirs = {}  # rel_dir -> [[rel_subdirs], [rel_paths]]
+        self._files = {}  # rel_path -> IndexedTransaction
+        self.listed_dirs = 0  # directories listed again by the last rescan
+        self.changed_files = 0  # new or changed files found by the last rescan
+        self._load()
+
+    @staticmethod
+    def shared(file_path, root, unsigned_regex, signed_suffix, recursive=True):
+        """Get the one TransactionIndex of an index file (arguments like for the constructor).
+
+        Everybody who scans a stick (e.g. the TransactionListWarmer and the signers) has to use the same index, so
+        their rescans are serialized by its lock instead of overwriting each other's index file.
+        """
+        arguments = (root, unsigned_regex.pattern, signed_suffix, recursive)
+        with TransactionIndex._shared_lock:
+            shared_arguments, index = TransactionIndex._shared.get(file_path, (None, None))
+            if shared_arguments != arguments:
+                index = TransactionIndex(file_path, root, unsigned_regex, signed_suffix, recursive)
+                TransactionIndex._shared[file_path] = (arguments, index)
+            return index
+
+    @staticmethod
+    def index_path(index_dir, uuid) -> str:
+        return os.path.join(index_dir, 'tx_index_{uuid}.json'.format(uuid=uuid))
+
+    def rescan(self):
+        """Brings the index up to date with the stick and saves it (if anything has changed).
+
+        Returns:
+            List of all IndexedTransaction
+        """
+        with self._lock:
+            self.listed_dirs = 0
+            self.changed_files = 0
+            old_dirs = self._dirs
+            self._dirs = {}
+            changed = self._scan_dir('', old_dirs) or self.changed_files > 0
+            changed = changed or old_dirs.keys() != self._dirs.keys()
+            indexed = set(rel_path for entry in self._dirs.values() for rel_path in entry[1])
+            for rel_path in list(self._files):
+                if rel_path not in indexed:
+                    del self._files[rel_path]
+            if changed:
+                self._save()
+            if self._hashing is None and len(self._unhashed()) > 0:
+                self._hashing = threading.Thread(target=self._hash_pending, name="TransactionIndex", daemon=True)
+                self._hashing.start()
+            return [self._files[rel_path] for rel_dir in sorted(self._dirs) for rel_path in self._dirs[rel_dir][1]
+                    if rel_path in self._files]
+
+    def unsigned(self):
+        """Rescans and returns the unsigned transactions."""
+        return [tx for tx in self.rescan() if not tx.signed]
+
+    def path(self, tx: IndexedTransaction) -> str:
+        return os.path.join(self._root, tx.rel_path)
+
+    def _scan_dir(self, rel_dir, old_dirs) -> bool:
+        """Indexes a directory (and its subdirectories) and tells if anything has changed."""
+        listed = self._list_dir(os.path.join(self._root, rel_dir), rel_dir)
+        if listed is None:
+            return rel_dir in old_dirs
+        self._dirs[rel_dir] = listed
+        changed = old_dirs.get(rel_dir) != listed
+        for rel_subdir in listed[0]:
+            changed = self._scan_dir(rel_subdir, old_dirs) or changed
+        return changed
+
+    def _list_dir(self, path, rel_dir):
+        self.listed_dirs += 1
+        rel_subdirs = []
+        rel_paths = []
+        try:
+            with os.scandir(path) as dir_entries:
+                for dir_entry in dir_entries:
+                    rel_path = os.path.join(rel_dir, dir_entry.name)
+                    if dir_entry.is_dir(follow_symlinks=False):
+                        if self._recursive and not TransactionIndex.SKIPPED_DIRS.match(dir_entry.name):
+                            rel_subdirs.append(rel_path)
+                    elif dir_entry.is_file():
+                        signed = self._signed_regex.search(dir_entry.name) is not None
+                        if signed or self._unsigned_regex.search(dir_entry.name):
+                            self._index_file(dir_entry, rel_path, signed)
+                            rel_paths.append(rel_path)
+        except OSError as ex:
+            logging.warning("Could not list \"%s\": %s", path, ex)
+            return None
+        return [sorted(rel_subdirs), sorted(rel_paths)]
+
+    def _index_file(self, dir_entry, rel_path, signed):
+        stat = dir_entry.stat()
+        old = self._files.get(rel_path)
+        if old is not None and old.size == stat.st_size and old.mtime == stat.st_mtime:
+            old.signed = signed
+            if old.hash is not None:
+                TransactionCache.remember_key(dir_entry.path, old.size, old.mtime, old.hash)
+            return
+        self.changed_files += 1
+        self._files[rel_path] = IndexedTransaction(rel_path, stat.st_size, stat.st_mtime, None, signed)
+
+    def _unhashed(self):
+        # Only unsigned transactions are read for the review - hashing the signed ones would only cost time
+        return [tx for tx in self._files.values() if tx.hash is None and not tx.signed]
+
+    def _hash_pending(self):
+        """Hashes all unsigned files without a hash (runs on the hashing thread) and saves the index."""
+        while True:
+            with self._lock:
+                pending = self._unhashed()
+                if len(pending) == 0:
+                    self._hashing = None
+                    return
+            hashed = []
+            for tx in pending:
+                try:
+                    hashed.append((tx, TransactionCache.file_key(self.path(tx))))
+                except OSError as ex:
+                    logging.debug("Could not hash \"%s\": %s", self.path(tx), ex)
+            with self._lock:
+                for tx, tx_hash in hashed:
+                    if self._files.get(tx.rel_path) is tx:
+                        tx.hash = tx_hash
+                self._save()
+                if len(hashed) < len(pending):
+                    self._hashing = None  # e.g. the stick has been removed - the next rescan tries again
+                    return
+
+    def _load(self):
+        if not self._file_path:
+            return
+        try:
+            with open(self._file_path) as index_file:
+                index = json.load(index_file)
+            if index.get('version') != TransactionIndex.VERSION or index.get('settings') != self._settings():
+                return  # a different root or filter - start over
+            self._files = {rel_path: IndexedTransaction(rel_path, *values)
+                           for rel_path, values in index['files'].items()}
+            self._dirs = index['dirs']
+        except FileNotFoundError:
+            pass
+        except (IOError, ValueError, KeyError, TypeError) as ex:
+            logging.warning("Ignoring unreadable transaction index \"%s\": %s", self._file_path, ex)
+            self._files = {}
+            self._dirs = {}
+
+    def _settings(self):
+        return [self._root, self._unsigned_regex.pattern, self._signed_regex.pattern, self._recursive]
+
+    def _save(self):
+        if not self._file_path:
+            return
+        tmp_path = self._file_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as index_file:
+                json.dump({'version': TransactionIndex.VERSION,
+                           'settings': self._settings(),
+                           'dirs': self._dirs,
+                           'files': {rel_path: tx.as_list() for rel_path, tx in self._files.items()}}, index_file)
+            os.replace(tmp_path, self._file_path)
+        except IOError as ex:
+            logging.warning("Could not save transaction index to \"%s\": %s", self._file_path, ex)
@@ -0,0 +1,228 @@
+"""Pure-Python reader for the transaction formats written by Electrum.
+
+Only the outputs (address and value) are needed to review a transaction, so there is no need to start Electrum
+for that. Supported formats are raw transactions (hex), PSBT (version 0; binary, hex or base64) and Electrum's
+JSON wrapper ({"hex": ...}) around any of them. Everything else raises UnsupportedFormatError so that the
+caller can fall back to Electrum.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import json
+
+from .electrum import TransactionReadError
+
+NETWORKS = {
+    'mainnet': {'p2pkh': 0x00, 'p2sh': 0x05, 'hrp': 'bc'},
+    'testnet': {'p2pkh': 0x6f, 'p2sh': 0xc4, 'hrp': 'tb'},
+}
+
+_PSBT_MAGIC = b'psbt\xff'
+_PSBT_GLOBAL_UNSIGNED_TX = 0x00
+
+_B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+_BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+_BECH32_CONST = 1
+_BECH32M_CONST = 0x2bc830a3
+
+
+class UnsupportedFormatError(TransactionReadError):
+    pass
+
+
+def _base58check(payload: bytes) -> str:
+    data = payload + hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    num = int.from_bytes(data, 'big')
+    encoded = ''
+    while num > 0:
+        num, rem = divmod(num, 58)
+        encoded = _B58_ALPHABET[rem] + encoded
+    leading_zeros = len(data) - len(data.lstrip(b'\x00'))
+    return _B58_ALPHABET[0] * leading_zeros + encoded
+
+
+def _bech32_polymod(values):
+    generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            chk ^= generator[i] if ((top >> i) & 1) else 0
+    return chk
+
+
+def _segwit_address(hrp, witness_version, program: bytes) -> str:
+    data = [witness_version]
+    acc = bits = 0
+    for byte in program:  # convert 8-bit groups to 5-bit groups
+        acc = (acc << 8) | byte
+        bits += 8
+        while bits >= 5:
+            bits -= 5
+            data.append((acc >> bits) & 31)
+    if bits:
+        data.append((acc << (5 - bits)) & 31)
+    const = _BECH32_CONST if witness_version == 0 else _BECH32M_CONST
+    hrp_expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    polymod = _bech32_polymod(hrp_expanded + data + [0] * 6) ^ const
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(_BECH32_CHARSET[d] for d in data + checksum)
+
+
+def script_to_address(script: bytes, network='mainnet') -> str:
+    """Converts a standard output script to its address.
+
+    Raises:
+        UnsupportedFormatError: If the script is not a standard address script (e.g. OP_RETURN or bare multisig)
+    """
+    net = NETWORKS[network]
+    if len(script) == 25 and script[:3] == b'\x76\xa9\x14' and script[23:] == b'\x88\xac':
+        return _base58check(bytes([net['p2pkh']]) + script[3:23])
+    if len(script) == 23 and script[:2] == b'\xa9\x14' and script[22] == 0x87:
+        return _base58check(bytes([net['p2sh']]) + script[2:22])
+    if 4 <= len(script) <= 42 and (script[0] == 0 or 0x51 <= script[0] <= 0x60) and script[1] == len(script) - 2 \
+            and (script[0] != 0 or script[1] in (20, 32)):
+        return _segwit_address(net['hrp'], 0 if script[0] == 0 else script[0] - 0x50, script[2:])
+    raise UnsupportedFormatError("Output script {0} has no known address format.".format(script.hex()))
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self._stream = io.BytesIO(data)
+        self._len = len(data)
+
+    def read(self, n) -> bytes:
+        data = self._stream.read(n)
+        if len(data) != n:
+            raise UnsupportedFormatError("Unexpected end of transaction data.")
+        return data
+
+    def uint(self, n) -> int:
+        return int.from_bytes(self.read(n), 'little')
+
+    def varint(self) -> int:
+        prefix = self.uint(1)
+        if prefix < 0xfd:
+            return prefix
+        return self.uint({0xfd: 2, 0xfe: 4, 0xff: 8}[prefix])
+
+    def var_bytes(self) -> bytes:
+        return self.read(self.varint())
+
+    @property
+    def at_end(self):
+        return self._stream.tell() == self._len
+
+
+def parse_raw_transaction(data: bytes, network='mainnet') -> dict:
+    """Parses a serialized transaction (legacy or segwit) into a dict similar to Electrum's "deserialize" output."""
+    reader = _Reader(data)
+    tx = {'version': reader.uint(4), 'inputs': [], 'outputs': []}
+    input_count = reader.varint()
+    segwit = input_count == 0
+    if segwit:
+        if reader.uint(1) != 1:
+            raise UnsupportedFormatError("Unknown segwit flag.")
+        input_count = reader.varint()
+    for _ in range(input_count):
+        prevout_hash = reader.read(32)[::-1].hex()
+        tx['inputs'].append({'prevout_hash': prevout_hash,
+                             'prevout_n': reader.uint(4),
+                             'scriptSig': reader.var_bytes().hex(),
+                             'sequence': reader.uint(4)})
+    for n in range(reader.varint()):
+        value = reader.uint(8)
+        script = reader.var_bytes()
+        tx['outputs'].append({'address': script_to_address(script, network),
+                              'prevout_n': n,
+                              'scriptPubKey': script.hex(),
+                              'value': value})
+    if segwit:
+        for _ in tx['inputs']:
+            for _ in range(reader.varint()):
+                reader.var_bytes()
+    tx['lockTime'] = reader.uint(4)
+    if not reader.at_end:
+        raise UnsupportedFormatError("Trailing data after transaction.")
+    return tx
+
+
+def parse_psbt(data: bytes, network='mainnet') -> dict:
+    """Parses the unsigned transaction of a version 0 PSBT (BIP 174)."""
+    reader = _Reader(data)
+    if reader.read(len(_PSBT_MAGIC)) != _PSBT_MAGIC:
+        raise UnsupportedFormatError("Not a PSBT.")
+    while True:
+        key = reader.var_bytes()
+        if len(key) == 0:
+            break
+        value = reader.var_bytes()
+        if key[0] == _PSBT_GLOBAL_UNSIGNED_TX:
+            tx = parse_raw_transaction(value, network)
+            tx['partial'] = True
+            return tx
+    raise UnsupportedFormatError("PSBT does not contain an unsigned transaction (PSBT version 2?).")
+
+
+def parse_transaction(text: str, network='mainnet') -> dict:
+    """Parses the textual content of a transaction file as written by Electrum.
+
+    Raises:
+        UnsupportedFormatError: If the format is unknown - use Electrum to deserialize it instead
+    """
+    text = text.strip()
+    if text.startswith('{'):
+        try:
+            wrapper = json.loads(text)
+        except ValueError:
+            raise UnsupportedFormatError("Transaction file is not valid JSON.")
+        if not isinstance(wrapper, dict) or not isinstance(wrapper.get('hex'), str):
+            raise UnsupportedFormatError("JSON transaction without \"hex\" field.")
+        tx = parse_transaction(wrapper['hex'], network)
+        if 'complete' in wrapper:
+            tx['partial'] = not wrapper['complete']
+        return tx
+    if text.startswith('cHNidP'):  # base64 of the PSBT magic
+        try:
+            return parse_psbt(base64.b64decode(text, validate=True), network)
+        except binascii.Error:
+            raise UnsupportedFormatError("Invalid base64 PSBT.")
+    try:
+        data = bytes.fromhex(text)
+    except ValueError:
+        raise UnsupportedFormatError("Transaction is neither JSON, base64 nor hex.")
+    if data.startswith(_PSBT_MAGIC):
+        return parse_psbt(data, network)
+    return parse_raw_transaction(data, network)
+
+
+class NativeTransactionReader:
+    """Drop-in for ElectrumSigner.deserialize_transaction which does not need Electrum at all."""
+
+    def __init__(self, network='mainnet'):
+        if network not in NETWORKS:
+            raise ValueError("Unknown network: " + network)
+        self._network = network
+        self._json_tx = None
+
+    @property
+    def last_raw_tx(self):
+        return self._json_tx
+
+    def deserialize_transaction(self, path_txn, convert_to_btc=True):
+        try:
+            with open(path_txn, 'rb') as tx_file:
+                content = tx_file.read()
+        except IOError:
+            raise IOError("Unable to read transaction file. Path: " + path_txn)
+        if content.startswith(_PSBT_MAGIC):
+            self._json_tx = parse_psbt(content, self._network)
+        else:
+            try:
+                self._json_tx = parse_transaction(content.decode('ascii'), self._network)
+            except UnicodeDecodeError:
+                raise UnsupportedFormatError("Unknown binary transaction format.")
+        return [(out['address'], out['value'] / 10.0 ** 8 if convert_to_btc else out['value'])
+                for out in self._json_tx['outputs']]
@@ -0,0 +1,32 @@
+import heapq
+
+
+class TransactionSummary:
+    """Aggregates the outputs of one or more transactions in a single pass.
+
+    Holds the number of outputs, their total, the total per address and the top_n largest outputs, so a payout with
+    thousands of outputs can be reviewed without paging through all of them.
+    """
+    __slots__ = ('count', 'total', 'per_address', 'top')
+
+    def __init__(self, outputs, top_n=5):
+        """
+        Args:
+            outputs: Iterable of (address, amount), e.g. the outputs of a deserialized transaction
+            top_n: Amount of largest outputs to keep
+        """
+        self.count = 0
+        self.total = 0
+        self.per_address = {}
+        heap = []  # (amount, -position, address), the smallest of the kept outputs first
+        for address, amount in outputs:
+            self.total += amount
+            self.per_address[address] = self.per_address.get(address, 0) + amount
+            entry = (amount, -self.count, address)
+            if len(heap) < top_n:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            self.count += 1
+        # Largest first, earlier outputs first on equal amounts
+        self.top = [(address, amount) for amount, _, address in sorted(heap, reverse=True)]
@@ -1,11 +1,18 @@
 import atexit
 import logging
 
+import libs.block_devices as block_devices
+import libs.mount_sessions as mount_sessions
 from config import ConfigurationManager
+from libs.dot_extended.scheduler import RedrawScheduler
+from libs.dot_extended.shadow import ShadowLcd
 from libs.dot_extended.views import ProgressBarView
+from libs.dot_extended.virtual import VirtualDisplay
+from libs.hotplug import HotplugWatcher
 from menu_opts.general import About
-from menu_opts.sign import TransactionSigner
-from menu_opts.usb import UsbEject, UsbTrusting
+from menu_opts.sign import TransactionSigner, BatchTransactionSigner, AsyncBenchmarkingElectrum, \
+    TransactionListWarmer
+from menu_opts.usb import UsbEject, UsbHelper, UsbTrusting
 
 PLUGIN_NAME = "PiceCold"
 PLUGIN_VERSION = "v0.6.0"
@@ -17,85 +24,130 @@ class PiceCold:
 
         self._cfg_man = ConfigurationManager(cfg_path)
         atexit.register(self._cfg_man.save_configuration)
-        self._is_hat = self._cfg_man.configuration.display_type == 'dothat'
-        if self._is_hat:
+        AsyncBenchmarkingElectrum.start_backend(self._cfg_man.configuration)
+        atexit.register(AsyncBenchmarkingElectrum.stop_backend)
+        self._display_type = self._cfg_man.configuration.display_type
+        self._virtual_display = None
+        if self._display_type == 'virtual':
+            self._virtual_display = VirtualDisplay()
+            lcd = self._virtual_display.lcd
+            backlight = self._virtual_display.backlight
+        elif self._display_type == 'dothat':
             import dothat.backlight as backlight
             import dothat.lcd as lcd
-            self._lcd = lcd
-            self._backlight = backlight
         else:
             import dot3k.backlight as backlight
             import dot3k.lcd as lcd
-            self._lcd = lcd
-            self._backlight = backlight
+        # Only changed characters are sent to the display (frames are ended by the scheduler)
+        self._lcd = ShadowLcd(lcd)
+        self._backlight = backlight
+        self._scheduler = None
+
+        cfg = self._cfg_man.configuration
+        mount_sessions.sessions.idle_timeout = cfg.unmount_timeout
+        atexit.register(mount_sessions.sessions.close)
+        self._list_warmer = None
+        self._hotplug = None
+        if cfg.auto_mount:
+            self._list_warmer = TransactionListWarmer(cfg)
+            self._hotplug = HotplugWatcher(block_devices.registry, self._list_warmer.on_added,
+                                           self._list_warmer.on_removed, UsbHelper.DEVICE_FILTER,
+                                           cfg.hotplug_interval)
+            self._hotplug.start()
+            atexit.register(self._hotplug.stop)
 
     def add_to_menu(self, target_menu, parent_name="PiceCold", show_trust_usb=True):
         target_menu.add_item(parent_name + '/Sign TX',
-                             TransactionSigner(self._lcd, self._backlight, self._cfg_man.configuration))
+                             TransactionSigner(self._lcd, self._backlight, self._cfg_man.configuration,
+                                               self._list_warmer))
+        target_menu.add_item(parent_name + '/Sign all TX',
+                             BatchTransactionSigner(self._lcd, self._backlight, self._cfg_man.configuration,
+                                                    self._list_warmer))
         if show_trust_usb:
             target_menu.add_item(parent_name + '/Trust USB', UsbTrusting(self._backlight, self._cfg_man.configuration))
         target_menu.add_item(parent_name + '/Eject USB', UsbEject())
         target_menu.add_item(parent_name + '/About', About(self._backlight, self._cfg_man.configuration))
 
-        # Rebind navigation keys (only applies for DOT-HAT).
-        # Rebinding is necessary because of the key "nav.CANCEL".
-        # It is not intended to abort a transaction signing process.
+        # Rebind navigation keys.
+        # Rebinding is necessary because of the key "nav.CANCEL" (only applies for DOT-HAT):
+        # While a transaction is processed, it aborts the Electrum job instead of leaving the menu.
+        # Input is handled on the UI loop of the scheduler (not on the thread of the touch/joystick driver).
         menu = target_menu
-        if self._is_hat:
-            import dothat.touch as nav
+        self._scheduler = RedrawScheduler(menu, self._lcd, self._cfg_man.configuration.display_idle_timeout)
+        scheduler = self._scheduler
+        if self._display_type in ('dothat', 'virtual'):
+            if self._virtual_display is not None:
+                nav = self._virtual_display.nav
+            else:
+                import dothat.touch as nav
             from dot3k.menu import _MODE_ADJ as ADJUST
 
             @nav.on(nav.UP)
             def handle_up(ch, evt):
-                menu.up()
+                scheduler.post_input(menu.up)
 
             @nav.on(nav.DOWN)
             def handle_down(ch, evt):
-                menu.down()
+                scheduler.post_input(menu.down)
 
             @nav.on(nav.LEFT)
             def handle_left(ch, evt):
-                menu.left()
+                scheduler.post_input(menu.left)
 
             @nav.on(nav.RIGHT)
             def handle_right(ch, evt):
-                menu.right()
+                scheduler.post_input(menu.right)
 
             @nav.on(nav.BUTTON)
             def handle_button(ch, evt):
-                menu.select()
+                scheduler.post_input(menu.select)
 
-            @nav.on(nav.CANCEL)
-            def handle_cancel(ch, evt):
+            def cancel():
                 current = menu.current_value()
                 if menu.mode == ADJUST and \
                         isinstance(current, TransactionSigner) and \
                         (isinstance(current.current_menu_opt, ProgressBarView) or current.is_progressing):
-                    # Do NOT menu.cancel() here!
-                    # This can have unhandled consequences when cancelled while processing a tx
-                    pass
+                    # Do NOT menu.cancel() here, the signer has to show the result of the aborted job.
+                    # Aborting kills the whole Electrum process group, partial output is removed.
+                    current.cancel_job()
                 else:
                     menu.cancel()
 
+            @nav.on(nav.CANCEL)
+            def handle_cancel(ch, evt):
+                scheduler.post_input(cancel)
+        else:
+            import dot3k.joystick as nav
+
             @nav.on(nav.UP)
             def handle_up(pin):
-                menu.up()
+                scheduler.post_input(menu.up)
 
             @nav.on(nav.DOWN)
             def handle_down(pin):
-                menu.down()
+                scheduler.post_input(menu.down)
 
             @nav.on(nav.LEFT)
             def handle_left(pin):
-                menu.left()
+                scheduler.post_input(menu.left)
 
             @nav.on(nav.RIGHT)
             def handle_right(pin):
-                menu.right()
+                scheduler.post_input(menu.right)
 
             @nav.on(nav.BUTTON)
             def handle_button(pin):
-                menu.select()
+                scheduler.post_input(menu.select)
+
+    @property
+    def scheduler(self) -> RedrawScheduler:
+        """Drives the redraws of the menu passed to add_to_menu() - call scheduler.run_forever() as main loop."""
+        return self._scheduler
+
+    @property
+    def virtual_display(self) -> VirtualDisplay:
+        """The headless display if Display.type is "virtual" (to script input and inspect the output), else None."""
+        return self._virtual_display
 
     @property
     def lcd(self):
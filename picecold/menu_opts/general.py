@@ -1,54 +1,113 @@
-import time
-
 from dot3k.menu import MenuOption
 
+import libs.process as proc
 import main
 from config import Configuration
+from libs.dot_extended import scheduler
+from libs.dot_extended.animation import clock
+from libs.dot_extended.marquee import Marquee
+from libs.electrum import RunMetrics
+from libs.latency import LatencyModel
 from util import Symbols
 from .sign import AsyncBenchmarkingElectrum
 
 
 class About(MenuOption):
+    SWEEP_INTERVAL = 0.035  # seconds
+    SWEEP_PERIOD = 3.5  # seconds for one pass through all colours
+    FOOTER_PERIOD = 2.1  # seconds until the footer text changes
+
     def __init__(self, backlight, cfg: Configuration):
         super().__init__()
         self._backlight = backlight
         self._cfg = cfg
         self._electrum = None
         self._electrum_version = None
-        self._sweep = 0
+        self._sweep_animation = None
+        self._show_link = False
+        self._title = "{0} {1}".format(main.PLUGIN_NAME, main.PLUGIN_VERSION)
+        self._banner = None
 
     def setup(self, config):
         super().setup(config)
         self._electrum = AsyncBenchmarkingElectrum(self._cfg)
 
     def begin(self):
-        future_version = self._electrum.start_electrum("version")
-        future_version.add_done_callback(self._on_electrum_end)
+        future_version = self._electrum.version()
+        future_version.add_done_callback(scheduler.in_ui(self._on_electrum_end))
+        self._sweep_animation = clock.subscribe(About.SWEEP_INTERVAL, self._sweep, suspend_in_idle=True)
+        self._update_banner()
+
+    def _sweep(self, elapsed):
+        self._backlight.sweep((elapsed % About.SWEEP_PERIOD) / About.SWEEP_PERIOD)
+        footer_idx = int(elapsed / About.FOOTER_PERIOD)
+        self._show_link = footer_idx != 0 and footer_idx % 2 == 0
 
     def redraw(self, menu):
-        self._backlight.sweep(((self._sweep % 100) / 100))
-        self._sweep += 1
-        Symbols(menu.lcd, [Symbols.ARROW_RIGHT, Symbols.BTC_LOGO, Symbols.TARGET]).create_symbols()
-        menu.write_row(0, "{0} {1}".format(main.PLUGIN_NAME, main.PLUGIN_VERSION))
-        menu.write_option(1, "Offline wallet \x00 "
-                             "Easily sign your \x01itcoin transactions. "
-                             "Installed Electrum version: {version} - "
-                             "Electrum benchmark stats: "
-                             "DESERIALIZE={deserialize_time}ms/kb | SIGN={sign_time}ms/kb"
-                          .format(version="Fetching..." if self._electrum_version is None else self._electrum_version,
-                                  deserialize_time=self._cfg.deserialize_time_average,
-                                  sign_time=self._cfg.sign_time_average),
-                          scroll=self._electrum_version is not None, scroll_speed=200)
-        if int(self._sweep / 60) != 0 and int(self._sweep / 60) % 2 == 0:
+        menu.write_row(0, self._title)
+        menu.write_row(1, self._banner.frame())
+        if self._show_link:
             menu.write_row(2, "~git.io/pyo".format().center(16))
         else:
-            menu.write_row(2, "By Py\x02tek".format().center(16))
-        time.sleep(0.01)
+            menu.write_row(2, "By Py{target}tek".format(target=Symbols.char('TARGET')).center(16))
+
+    def _update_banner(self):
+        """Builds the banner and its marquee frames - only when its content changes, not on every frame."""
+        self._banner = Marquee("Offline wallet {arrow} "
+                               "Easily sign your {btc}itcoin transactions. "
+                               "Installed Electrum version: {version} - "
+                               "Electrum benchmark stats: "
+                               "DESERIALIZE={deserialize_time} {deserialize_metrics} | "
+                               "SIGN={sign_time} {sign_metrics} | "
+                               "SPAWN={spawn_time}ms | DAEMON LOAD={daemon_load}s | "
+                               "ANIMATIONS={animations} ({tick_time}ms/tick)"
+                               .format(arrow=Symbols.char('ARROW_RIGHT'), btc=Symbols.char('BTC_LOGO'),
+                                       version="Fetching..." if self._electrum_version is None
+                                       else self._electrum_version,
+                                       deserialize_time=self._latency(self._cfg.deserialize_latency),
+                                       sign_time=self._latency(self._cfg.sign_latency),
+                                       deserialize_metrics=self._metrics(self._cfg.deserialize_metrics),
+                                       sign_metrics=self._metrics(self._cfg.sign_metrics),
+                                       daemon_load=self._cfg.daemon_metrics.get('load', "-"),
+                                       spawn_time=self._spawn_time(),
+                                       animations=clock.active,
+                                       tick_time=round(clock.average_tick_time * 1000, 2)),
+                               icon=' ', scroll=self._electrum_version is not None,
+                               scroll_speed=200, scroll_delay=2000)
+
+    def frame_need(self):
+        # Like the backlight sweep, this stops in deep idle - the Electrum version coming in still redraws
+        return scheduler.scroll(0.2)
+
+    @staticmethod
+    def _latency(model: LatencyModel):
+        if len(model.samples) == 0:
+            return "-"
+        return "{0:.1f}s+{1:.2f}s/kb+{2:.3f}s/io".format(model.overhead, model.per_kb, model.per_io)
+
+    @staticmethod
+    def _metrics(metrics: dict):
+        if metrics.get('wall') is None:
+            return ""
+        cpu = "-" if metrics.get('user') is None else round(metrics['user'] + metrics['system'], 1)
+        rss = "-" if metrics.get('max_rss') is None else round(metrics['max_rss'] / 1024)
+        phases = "/".join("-" if metrics.get(phase) is None else "{0:.1f}".format(metrics[phase])
+                          for phase in RunMetrics.PHASES)
+        return "({0:.1f}s wall, {1}s cpu, {2}MB rss, spawn/load/work/write={3}s)".format(metrics['wall'], cpu, rss,
+                                                                                         phases)
+
+    def _spawn_time(self):
+        avg = proc.spawn_stats.average(proc.program_name([self._cfg.electrum_path]))
+        return "-" if avg is None else round(avg * 1000, 1)
 
     def _on_electrum_end(self, future):
-        self._electrum_version = future.result()[0].strip()
+        self._electrum_version = future.result()
+        self._update_banner()
 
     def cleanup(self):
+        if self._sweep_animation is not None:
+            clock.unsubscribe(self._sweep_animation)
+            self._sweep_animation = None
         self._backlight.rgb(int(self.get_option('Backlight', 'r', 255)),
                             int(self.get_option('Backlight', 'g', 255)),
                             int(self.get_option('Backlight', 'b', 255)))
@@ -1,81 +1,217 @@
 import datetime as dt
+import itertools
+import logging
 import os
-import subprocess
+import secrets
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, Future
 
+import libs.mount_sessions as mount_sessions
 import libs.mount_tool as mount_tool
 from config import Configuration
-from libs.dot_extended.base import SymbolHandler, MenuOptionSwitcher
-from libs.dot_extended.dialogs import StatusMessage, SimpleDialog
+from libs.dot_extended import scheduler
+from libs.dot_extended.base import MenuOptionSwitcher
+from libs.dot_extended.dialogs import StatusMessage, SimpleDialog, SimpleMessage
 from libs.dot_extended.views import PageView, ProgressBarView, SelectFileView
-from libs.electrum import ElectrumSigner
-from menu_opts.usb import UsbHelper
+from libs.electrum import ElectrumSigner, ElectrumDaemonSigner, ElectrumError
+from libs.jobs import Job, JobCancelledError, JobTimeoutError
+from libs.tx_cache import TransactionCache
+from libs.tx_index import TransactionIndex
+from libs.tx_parser import NativeTransactionReader, UnsupportedFormatError
+from libs.tx_summary import TransactionSummary
+from menu_opts.usb import MountedUsbDevice, UsbHelper
 from util import Symbols
 
 
 class TransactionSigner(MenuOptionSwitcher):
-    def __init__(self, lcd, backlight, cfg: Configuration):
+    OUTPUT_PAGE_FORMAT = ("To: {text1}", Symbols.char('BTC_LOGO') + " : {text2}", "{nav}")
+    SUMMARY_TOP_N = 5  # largest outputs shown in front of the outputs of larger transactions
+
+    def __init__(self, lcd, backlight, cfg: Configuration, list_warmer=None):
         super().__init__()
 
         self._cfg = cfg
+        self._list_warmer = list_warmer
         self._lcd = lcd
         self._backlight = backlight
 
         self._electrum = None
-        self._mounted_usb_dev = None
+        self._mounted_usb_devs = []
+        self._usb_lock = threading.Lock()
+        self._scan_generation = 0  # increased whenever the sticks are given up, outdating running scans
+        self._unscanned = 0  # scans whose result has not been shown yet
+        self._file_view = None
         self._tx_path = None
 
         self._usb_helper = UsbHelper(cfg)
         self._worker = ThreadPoolExecutor(max_workers=1)
+        self._prefetcher = TransactionPrefetcher(cfg)
 
         self._progressing = False
 
     def begin(self):
         self._electrum = AsyncBenchmarkingElectrum(self._cfg)
+        self._release_usb()
         if self._usb_helper.is_usb_plugged_in():
             try:
-                self._mounted_usb_dev = self._usb_helper.find_trusted_usb()
-                self._enter_select_tx_view()
+                scans = self._scan_trusted_sticks()
             except LookupError as ex:
-                self.switch(StatusMessage(["Please note", str(ex)], self._backlight))
-            except PermissionError as ex:
-                self.switch(StatusMessage(["Warning", str(ex)], self._backlight))
+                self._enter_scan_failed_view(ex)
+                return
+            # Mounting and listing take a while - the UI loop keeps running meanwhile
+            self.switch(SimpleMessage(["Scanning USB...", "Listing the transactions on the trusted USB sticks."],
+                                      blink=False, auto_button=False))
+            self._enter_select_tx_view(scans)
         else:
             self.switch(StatusMessage(["Please note", "No USB stick seems to be plugged in."],
                                       self._backlight))
 
-    def _enter_select_tx_view(self):
-        root_path = os.path.normpath(os.path.join(self._mounted_usb_dev.mount_path, self._cfg.transaction_dir))
-        file_view = SelectFileView(root_path, prompt="Select TX on USB",
-                                   file_filter_pattern=self._cfg.unsigned_pattern,
-                                   callback_on_select=self._enter_deserializing_view)
-        self.switch(file_view)
+    def _scan_trusted_sticks(self):
+        """Mounts and lists all trusted sticks in parallel.
+
+        Returns:
+            List of futures, one per stick, with the stick's list of SelectFileView.FileEntry as result
+
+        Raises:
+            LookupError: If no trusted USB stick is plugged in
+        """
+        devices = self._usb_helper.trusted_devices()
+        if len(devices) == 0:
+            raise LookupError("Could not mount any device because no USB stick is in the list of trusted devices.")
+        with self._usb_lock:
+            generation = self._scan_generation
+        executor = ThreadPoolExecutor(max_workers=len(devices))
+        scans = [executor.submit(self._scan_stick, device, generation, len(devices) > 1) for device in devices]
+        executor.shutdown(wait=False)
+        return scans
+
+    def _scan_stick(self, device, generation, tagged):
+        mounted_dev = UsbHelper.mount(device)
+        if mounted_dev is None:
+            raise LookupError("Could not mount {0}.".format(device.path))
+        with self._usb_lock:
+            outdated = generation != self._scan_generation
+            if not outdated:
+                self._mounted_usb_devs.append(mounted_dev)
+        if outdated:
+            mounted_dev.release()
+            raise LookupError("The USB sticks have been given up while {0} was scanned.".format(device.path))
+        entries = self._list_transactions(mounted_dev)
+        if tagged:
+            # Signed transactions are written next to the unsigned ones, so they go back to the same stick
+            tag = device.label or device.uuid
+            entries = [SelectFileView.FileEntry(entry.file_path, "{0}:{1}".format(tag, entry.file_entry_text),
+                                                entry.size, entry.mtime) for entry in entries]
+        return entries
+
+    def _enter_scan_failed_view(self, error):
+        if isinstance(error, PermissionError):
+            self.switch(StatusMessage(["Warning", str(error)], self._backlight))
+        elif isinstance(error, LookupError):
+            self.switch(StatusMessage(["Please note", str(error)], self._backlight))
+        else:
+            self.switch(StatusMessage(["Error", "Could not list the transactions: {0}".format(error)],
+                                      self._backlight))
+
+    def _list_transactions(self, mounted_usb_dev: MountedUsbDevice):
+        """The unsigned transactions of a mounted stick - prepared in the background if it has been plugged in
+        since the last time, otherwise taken from the stick's index."""
+        prepared = self._list_warmer.take(mounted_usb_dev) if self._list_warmer is not None else None
+        return prepared if prepared is not None else TransactionSigner.list_transactions(self._cfg, mounted_usb_dev)
+
+    @staticmethod
+    def list_transactions(cfg: Configuration, mounted_usb_dev: MountedUsbDevice):
+        """The unsigned transactions below the transaction directory of the stick, taken from the stick's index.
+
+        Returns:
+            List of SelectFileView.FileEntry, named by their path relative to the transaction directory
+        """
+        root_path = os.path.normpath(os.path.join(mounted_usb_dev.mount_path, cfg.transaction_dir))
+        uuid = mounted_usb_dev.uuid or os.path.basename(mounted_usb_dev.mount_path)
+        index = TransactionIndex.shared(TransactionIndex.index_path(cfg.index_dir, uuid), root_path,
+                                        cfg.unsigned_regex, cfg.signed_suffix, cfg.recursive_search)
+        return [SelectFileView.FileEntry(index.path(tx), tx.rel_path, tx.size, tx.mtime) for tx in index.unsigned()]
+
+    def _enter_select_tx_view(self, scans):
+        # Shown as soon as the first stick has been listed, the others are added when they are done
+        self._unscanned = len(scans)
+        self._file_view = None
+        generation = self._scan_generation
+        for scan in scans:
+            scan.add_done_callback(scheduler.in_ui(lambda done: self._add_scanned(scans, generation, done)))
+
+    def _add_scanned(self, scans, generation, scan: Future):
+        if generation != self._scan_generation:
+            return  # the signer has been left in the meantime
+        self._unscanned -= 1
+        if scan.exception() is not None:
+            logging.warning("Could not list the transactions of a stick: %s", scan.exception())
+            if self._unscanned == 0 and self._file_view is None:
+                self._enter_scan_failed_view(scans[0].exception())
+        elif self._file_view is not None:
+            self._file_view.add_entries(scan.result())
+        else:
+            file_view = SelectFileView(scan.result(), prompt="Select TX on USB",
+                                       sort_by=self._cfg.transaction_sort,
+                                       callback_on_select=self._enter_deserializing_view,
+                                       callback_on_cursor_change=lambda idx: self._prefetch(file_view, idx))
+            self._file_view = file_view
+            self.switch(file_view)
+            self._prefetch(file_view, 0)
+
+    def _prefetch(self, file_view: SelectFileView, cursor_idx):
+        # Only prefetch what has been listed so far instead of reading the whole directory
+        file_view.file_entries.available(cursor_idx + TransactionPrefetcher.RADIUS)
+        self._prefetcher.schedule([entry.file_path for entry in file_view.file_entries.loaded], cursor_idx)
 
     def _enter_deserializing_view(self, tx: SelectFileView.FileEntry):
+        self._prefetcher.cancel()
         self._tx_path = tx.file_path
+        cached_outputs = self._electrum.cached_transaction(self._tx_path)
+        if cached_outputs is not None:
+            # Already read (e.g. by the prefetcher) - no need to show any progress
+            read_tx_future = Future()
+            read_tx_future.set_result(cached_outputs)
+            self._enter_show_tx_view(read_tx_future)
+            return
         progress_bar = ProgressBarView(["Reading TX...", '{bar}', '{val:.0%}'],
-                                       empty_char="\x00", fill_char="\x01",
-                                       callback_after_redraw=lambda:
-                                       SymbolHandler(self._lcd, [Symbols.CIRCLE, Symbols.CIRCLE_FILLED])
-                                       .create_symbols())
+                                       empty_char=Symbols.char('CIRCLE'), fill_char=Symbols.char('CIRCLE_FILLED'))
         self.switch(progress_bar)
         read_tx_future = self._electrum.deserialize_transaction(self._tx_path)
-        read_tx_future.add_done_callback(self._enter_show_tx_view)
+        read_tx_future.add_done_callback(scheduler.in_ui(self._enter_show_tx_view))
         self._refresh_progress(read_tx_future, progress_bar,
-                               Configuration.calc_estimated_time(self._cfg.deserialize_time_average, self._tx_path))
+                               self._cfg.calc_estimated_deserialize_time(self._tx_path))
 
     def _enter_show_tx_view(self, future: Future):
-        pages = []
-        for tx in future.result():
-            pages.append(PageView.Page(["{address}".format(address=tx[0]),
-                                        "{amount}".format(amount=str(tx[1]))],
-                                       ("To: {text1}", "\x00 : {text2}", "{nav}")))
+        if future.cancelled() or future.exception() is not None:
+            self._enter_failed_view(future, "reading")
+            return
+        outputs = future.result()
+        summary_pages = self._summary_pages(TransactionSummary(outputs, TransactionSigner.SUMMARY_TOP_N)) \
+            if len(outputs) > 1 else []
+        # Output pages are only created when the user navigates to them
+        pages = itertools.chain(summary_pages,
+                                (PageView.Page([address, str(amount)], TransactionSigner.OUTPUT_PAGE_FORMAT)
+                                 for address, amount in outputs))
         self.switch(PageView(pages,
                              callback_on_select=self._enter_confirm_tx_dialog,
-                             callback_after_redraw=lambda: SymbolHandler(self._lcd, [Symbols.BTC_LOGO])
-                             .create_symbols(),
-                             auto_center=False))
+                             auto_center=False,
+                             page_count=len(summary_pages) + len(outputs)))
+
+    @staticmethod
+    def _summary_pages(summary: TransactionSummary):
+        """Pages with the number of outputs and receiving addresses, the total and (for larger transactions) the
+        largest outputs."""
+        pages = [PageView.Page(["{0} to {1} addr.".format(summary.count, len(summary.per_address)),
+                                str(round(summary.total, 8))],
+                               ("Out: {text1}", Symbols.char('BTC_LOGO') + " : {text2}", "{nav}"))]
+        if summary.count > TransactionSigner.SUMMARY_TOP_N:
+            for rank, (address, amount) in enumerate(summary.top, 1):
+                pages.append(PageView.Page([address, str(amount)],
+                                           ("#{0}: {{text1}}".format(rank),
+                                            Symbols.char('BTC_LOGO') + " : {text2}", "{nav}")))
+        return pages
 
     def _enter_confirm_tx_dialog(self):
         self.switch(SimpleDialog(["Sign TX?", "Confirm to sign  \"{file}\" "
@@ -87,40 +223,85 @@ class TransactionSigner(MenuOptionSwitcher):
 
     def _enter_sign_tx_view(self):
         progress_bar = ProgressBarView(["Signing TX...".center(16), '{bar}', '{val:.0%} (ca.)'],
-                                       empty_char="\x00", fill_char="\x01",
-                                       callback_after_redraw=lambda:
-                                       SymbolHandler(self._lcd,
-                                                     [Symbols.CIRCLE, Symbols.CIRCLE_FILLED])
-                                       .create_symbols())
+                                       empty_char=Symbols.char('CIRCLE'), fill_char=Symbols.char('CIRCLE_FILLED'))
         self.switch(progress_bar)
-        path_without_ext = os.path.splitext(self._tx_path)[0]
-        signed_tx_path = "{0}{suffix}.txn".format(path_without_ext,
-                                                  suffix=self._cfg.signed_suffix
-                                                  .format(time=dt.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")))
-        sign_tx_future = self._electrum.sign_transaction(self._tx_path, signed_tx_path, self._cfg.wallet_password)
-        sign_tx_future.add_done_callback(self._enter_finished_view)
+        sign_tx_future = self._electrum.sign_transaction(self._tx_path, self._signed_tx_path(self._tx_path),
+                                                         self._cfg.wallet_password)
+        sign_tx_future.add_done_callback(scheduler.in_ui(self._enter_finished_view))
         self._refresh_progress(sign_tx_future, progress_bar,
-                               self._cfg.calc_estimated_time(self._cfg.sign_time_average, self._tx_path))
+                               self._cfg.calc_estimated_sign_time(self._tx_path,
+                                                                  self._electrum.io_count(self._tx_path)))
+
+    def _signed_tx_path(self, tx_path):
+        path_without_ext = os.path.splitext(tx_path)[0]
+        return "{0}{suffix}.txn".format(path_without_ext,
+                                        suffix=self._cfg.signed_suffix
+                                        .format(time=dt.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")))
 
     def _enter_finished_view(self, future: Future):
-        mount_tool.umount(self._mounted_usb_dev)
-        if future.exception() is None:
-            self.switch(StatusMessage(["Success", "The transaction has been signed successfully. "
-                                                  "The USB stick was automatically unmounted."],
+        self._prefetcher.cancel()
+        self._release_usb()
+        if not future.cancelled() and future.exception() is None:
+            self.switch(StatusMessage(["Success", "The transaction has been signed successfully "
+                                                  "and saved to the USB stick."],
                                       self._backlight))
         else:
-            self.switch(StatusMessage(["Error", "There was an error while signing the transaction: "
-                                       + str(future.exception())], self._backlight))
+            self._enter_failed_view(future, "signing")
+
+    def _enter_failed_view(self, future: Future, action):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or (isinstance(error, JobCancelledError) and not isinstance(error, JobTimeoutError)):
+            self.switch(StatusMessage(["Info", "{0} the transaction has been cancelled. "
+                                               "Nothing has been written to the USB stick."
+                                      .format(action.capitalize())], self._backlight))
+        else:
+            self.switch(StatusMessage(["Error", "There was an error while {0} the transaction: {1}"
+                                      .format(action, error)], self._backlight))
 
-    def _refresh_progress(self, future: Future, progress_bar: ProgressBarView, estimated_time: float):
+    def cancel_job(self):
+        """Aborts the running Electrum operation (and everything queued behind it)."""
+        self._electrum.cancel()
+
+    def _refresh_progress(self, future: Future, progress_bar: ProgressBarView, estimated_time, progress=None):
+        """Updates the progress bar and the backlight graph on the UI loop until the future is done.
+
+        The bar shows the larger of the elapsed share of estimated_time (None: not estimated) and progress.value
+        (e.g. a BatchProgress). Returns at once - the updates are timer events of the UI loop, so input keeps working
+        meanwhile.
+        """
         self._progressing = True
-        start_time = time.clock()
-        while not future.done():
-            progress_bar.value = round((time.clock() - start_time) / estimated_time, 2)
+        start_time = time.monotonic()
+        estimated_time = None if estimated_time is None else max(estimated_time, 0.1)
+
+        def update():
+            if future.done():
+                return
+            value = 0.0 if progress is None else progress.value
+            if estimated_time is not None:
+                value = max(min((time.monotonic() - start_time) / estimated_time, 0.99), value)
+            progress_bar.value = round(value, 2)
             self._backlight.set_graph(progress_bar.value)
-            time.sleep(0.25)
-        self._progressing = False
-        self._backlight.set_graph(0.0)
+            scheduler.call_later(ProgressBarView.FRAME_INTERVAL, update)
+
+        def finish(_):
+            self._progressing = False
+            self._backlight.set_graph(0.0)
+
+        future.add_done_callback(scheduler.in_ui(finish))
+        update()
+
+    def _release_usb(self):
+        """Gives up the sticks - they are unmounted once they have not been used for USB.unmount_timeout seconds."""
+        with self._usb_lock:
+            self._scan_generation += 1
+            mounted_usb_devs, self._mounted_usb_devs = self._mounted_usb_devs, []
+        for mounted_usb_dev in mounted_usb_devs:
+            mounted_usb_dev.release()
+
+    def cleanup(self):
+        self._prefetcher.cancel()
+        self._release_usb()
+        super().cleanup()
 
     def select(self):
         if isinstance(self._current_menu_opt, ProgressBarView):
@@ -145,39 +326,451 @@ class TransactionSigner(MenuOptionSwitcher):
         return self._progressing
 
 
+class BatchTransactionSigner(TransactionSigner):
+    """Signs all unsigned transactions on the trusted USB sticks after one combined review and confirmation."""
+
+    def __init__(self, lcd, backlight, cfg: Configuration, list_warmer=None):
+        super().__init__(lcd, backlight, cfg, list_warmer)
+        self._tx_paths = []
+        self._read_errors = {}
+        self._scan_error = None
+        self._sticks_listed = 0
+        self._listed = []
+        self._reads = {}
+        self._read_progress = None
+        self._all_read = None
+
+    def _enter_select_tx_view(self, scans):
+        # All sticks are needed for the combined review. Every stick reports back on the UI loop when it has been
+        # listed and its transactions are queued for reading at once, so reading overlaps with scanning the others.
+        self._unscanned = len(scans)
+        self._scan_error = None
+        self._sticks_listed = 0
+        self._listed = []  # SelectFileView.FileEntry of all listed sticks
+        self._reads = {}  # tx path -> future of reading it
+        self._read_errors = {}
+        self._read_progress = BatchProgress()
+        self._all_read = Future()
+        self._all_read.add_done_callback(scheduler.in_ui(self._enter_batch_review_view))
+        generation = self._scan_generation
+        for scan in scans:
+            scan.add_done_callback(scheduler.in_ui(lambda done: self._add_scanned(scans, generation, done)))
+
+    def _add_scanned(self, scans, generation, scan: Future):
+        if generation != self._scan_generation:
+            return  # the signer has been left in the meantime
+        self._unscanned -= 1
+        if scan.exception() is not None:
+            logging.warning("Could not list the transactions of a stick: %s", scan.exception())
+            self._scan_error = self._scan_error or scan.exception()
+        else:
+            self._sticks_listed += 1
+            if len(self._reads) == 0 and len(scan.result()) > 0:
+                self._enter_reading_view()
+            for entry in scan.result():
+                self._listed.append(entry)
+                read_future = self._electrum.deserialize_transaction(entry.file_path)
+                self._reads[entry.file_path] = read_future
+                read_future.add_done_callback(scheduler.in_ui(lambda _: self._count_read(generation)))
+            self._read_progress.total = len(self._reads)
+        self._check_all_read()
+
+    def _enter_reading_view(self):
+        progress_bar = ProgressBarView(["Reading TXs...", '{bar}', '{val:.0%}'],
+                                       empty_char=Symbols.char('CIRCLE'), fill_char=Symbols.char('CIRCLE_FILLED'))
+        self.switch(progress_bar)
+        self._refresh_progress(self._all_read, progress_bar, None, self._read_progress)
+
+    def _count_read(self, generation):
+        if generation == self._scan_generation:
+            self._read_progress.done += 1
+            self._check_all_read()
+
+    def _check_all_read(self):
+        if self._unscanned > 0 or self._read_progress.done < len(self._reads):
+            return
+        if len(self._reads) > 0:
+            self._all_read.set_result(None)
+        elif self._sticks_listed == 0:
+            self._enter_scan_failed_view(self._scan_error)
+        else:
+            self._release_usb()
+            self.switch(StatusMessage(["Please note", "There are no unsigned transactions on the USB stick."],
+                                      self._backlight))
+
+    @staticmethod
+    def _gather(futures) -> Future:
+        """Combines futures into one future which is done when all of them are done.
+
+        Returns:
+            Future with the list of the given futures as result
+        """
+        combined = Future()
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    combined.set_result(futures)
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        return combined
+
+    def _enter_batch_review_view(self, _):
+        readable_paths = []
+        readable_outputs = []
+        for entry in SelectFileView.sort_entries(self._listed, self._cfg.transaction_sort):
+            tx_path, read_future = entry.file_path, self._reads[entry.file_path]
+            if read_future.cancelled() or read_future.exception() is not None:
+                self._read_errors[tx_path] = "Cancelled" if read_future.cancelled() else read_future.exception()
+                continue
+            readable_paths.append(tx_path)
+            readable_outputs.append(read_future.result())
+        self._tx_paths = readable_paths
+        summary = TransactionSummary(itertools.chain.from_iterable(readable_outputs))
+        pages = [PageView.Page(["{0} files{1}".format(len(readable_paths),
+                                                      " ({0} unreadable)".format(len(self._read_errors))
+                                                      if self._read_errors else ""),
+                                str(round(summary.total, 8))],
+                               ("Sign: {text1}", Symbols.char('BTC_LOGO') + " : {text2}", "{nav}"))]
+        pages.extend(PageView.Page([address, str(round(amount, 8))], TransactionSigner.OUTPUT_PAGE_FORMAT)
+                     for address, amount in summary.per_address.items())
+        self.switch(PageView(pages,
+                             callback_on_select=self._enter_confirm_tx_dialog
+                             if len(readable_paths) > 0 else self._enter_batch_results_view,
+                             auto_center=False))
+
+    def _enter_confirm_tx_dialog(self):
+        self.switch(SimpleDialog(["Sign all TXs?", "Confirm to sign all {count} transactions "
+                                                   "and save them to your USB stick. "
+                                                   "Use left/right + select to choose an answer (Y/N)."
+                                 .format(count=len(self._tx_paths)),
+                                  "{answers}"],
+                                 callback_on_positive=self._enter_sign_tx_view))
+
+    def _enter_sign_tx_view(self):
+        progress_bar = ProgressBarView(["Signing TXs...".center(16), '{bar}', '{val:.0%} (ca.)'],
+                                       empty_char=Symbols.char('CIRCLE'), fill_char=Symbols.char('CIRCLE_FILLED'))
+        self.switch(progress_bar)
+        # All jobs go into the single worker queue of the Electrum wrapper and are signed one after another
+        sign_futures = [self._electrum.sign_transaction(tx_path, self._signed_tx_path(tx_path),
+                                                        self._cfg.wallet_password)
+                        for tx_path in self._tx_paths]
+        all_signed = self._gather(sign_futures)
+        all_signed.add_done_callback(scheduler.in_ui(self._enter_batch_results_view))
+        self._refresh_progress(all_signed, progress_bar,
+                               sum(self._cfg.calc_estimated_sign_time(tx_path, self._electrum.io_count(tx_path))
+                                   for tx_path in self._tx_paths))
+
+    def _enter_batch_results_view(self, future: Future = None):
+        self._prefetcher.cancel()
+        self._release_usb()
+        results = [(tx_path, "Not readable: " + str(error)) for tx_path, error in self._read_errors.items()]
+        if future is not None:
+            for tx_path, sign_future in zip(self._tx_paths, future.result()):
+                if sign_future.cancelled() or isinstance(sign_future.exception(), JobCancelledError):
+                    results.append((tx_path, "Cancelled"))
+                elif sign_future.exception() is not None:
+                    results.append((tx_path, "Error: " + str(sign_future.exception())))
+                else:
+                    results.append((tx_path, "Signed"))
+        signed_count = sum(1 for result in results if result[1] == "Signed")
+        pages = [PageView.Page(["{0}/{1} signed".format(signed_count, len(results)),
+                                "Saved to USB stick" if signed_count > 0 else "Nothing signed"])]
+        for tx_path, result in sorted(results):
+            pages.append(PageView.Page([os.path.basename(tx_path), result]))
+        self.switch(PageView(pages, callback_on_select=self._leave_batch_results_view))
+
+    def _leave_batch_results_view(self):
+        self.cleanup()
+        return True
+
+
+class BatchProgress:
+    """Progress of a batch which grows while it runs: the completed jobs of all jobs added so far (e.g. by the sticks
+    listed one after another)."""
+
+    def __init__(self):
+        self.total = 0
+        self.done = 0
+
+    @property
+    def value(self):
+        if self.total == 0:
+            return 0.0
+        return min(self.done / self.total, 1.0)
+
+
 class AsyncBenchmarkingElectrum:
+    BACKEND_SUBPROCESS = 'subprocess'
+    BACKEND_DAEMON = 'daemon'
+
+    # One daemon and one cache are shared between all instances - they are set up once when PiceCold starts
+    _daemon = None
+    _cache = None
+
     def __init__(self, cfg: Configuration):
         self._cfg = cfg
-        self._electrum = ElectrumSigner(self._cfg.electrum_path)
+        if AsyncBenchmarkingElectrum._daemon is not None:
+            self._electrum = AsyncBenchmarkingElectrum._daemon
+        else:
+            self._electrum = ElectrumSigner(self._cfg.electrum_path)
+        self._native = NativeTransactionReader(self._cfg.electrum_network) if self._cfg.native_deserialize else None
+        self._raw_tx = None
         self._executor = ThreadPoolExecutor(max_workers=1)
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+
+    @staticmethod
+    def start_backend(cfg: Configuration):
+        """Sets up the shared transaction cache and starts the Electrum daemon if it is the configured backend.
+
+        If the daemon cannot be started, the subprocess backend is used as fallback.
+        """
+        AsyncBenchmarkingElectrum._cache = TransactionCache(cfg.cache_size, cfg.cache_file or None)
+        if cfg.electrum_backend != AsyncBenchmarkingElectrum.BACKEND_DAEMON:
+            return
+        daemon = ElectrumDaemonSigner(cfg.electrum_path,
+                                      host=cfg.electrum_rpc_host, port=cfg.electrum_rpc_port,
+                                      user=cfg.electrum_rpc_user,
+                                      password=cfg.electrum_rpc_password or secrets.token_urlsafe(16))
+        try:
+            daemon.start(cfg.wallet_password)
+            cfg.add_daemon_metrics({'load': daemon.load_time})
+            AsyncBenchmarkingElectrum._daemon = daemon
+        except (ElectrumError, OSError) as ex:
+            logging.error("Electrum daemon could not be started, falling back to subprocess backend: %s", ex)
+            daemon.stop()
+
+    @staticmethod
+    def stop_backend():
+        if AsyncBenchmarkingElectrum._cache is not None:
+            AsyncBenchmarkingElectrum._cache.flush()
+        if AsyncBenchmarkingElectrum._daemon is not None:
+            AsyncBenchmarkingElectrum._daemon.stop()
+            AsyncBenchmarkingElectrum._daemon = None
+
+    def _submit(self, job: Job, func, *args):
+        """Queues func on the worker. The job's deadline starts when func starts, not when it is queued."""
+        future = self._executor.submit(self._run_job, job, func, *args)
+        with self._jobs_lock:
+            self._jobs[future] = job
+        future.add_done_callback(self._forget_job)
+        return future
+
+    @staticmethod
+    def _run_job(job: Job, func, *args):
+        job.start()
+        try:
+            return func(*args)
+        finally:
+            job.finish()
+
+    def _forget_job(self, future):
+        with self._jobs_lock:
+            self._jobs.pop(future, None)
+
+    def cancel(self):
+        """Cancels all queued jobs and aborts the running one."""
+        with self._jobs_lock:
+            jobs = list(self._jobs.items())
+        for future, job in jobs:
+            future.cancel()
+            job.cancel()
 
     def sign_transaction(self, path_txn, path_signed_txn, password):
-        return self._executor.submit(self._sync_sign_transaction, path_txn, path_signed_txn, password)
+        job = Job(self._cfg.calc_timeout(self._cfg.calc_estimated_sign_time(path_txn, self.io_count(path_txn),
+                                                                            percentile=90)))
+        return self._submit(job, self._sync_sign_transaction, path_txn, path_signed_txn, password, job)
 
-    def _sync_sign_transaction(self, tx_path, path_signed_txn, password):
-        return self._benchmark(self._cfg.add_sign_timing, tx_path,
-                               lambda: self._electrum.sign_transaction(tx_path, path_signed_txn, password))
+    def _sync_sign_transaction(self, tx_path, path_signed_txn, password, job=None):
+        io_count = self.io_count(tx_path)
+        result = self._benchmark(lambda measured, path: self._cfg.add_sign_timing(measured, path, io_count),
+                                 self._cfg.add_sign_metrics, tx_path,
+                                 lambda: self._electrum.sign_transaction(tx_path, path_signed_txn, password,
+                                                                         job=job))
+        # Only report success once the signed transaction has actually reached the stick
+        mount_tool.sync_file(path_signed_txn)
+        return result
 
     def deserialize_transaction(self, tx_path):
-        return self._executor.submit(self._sync_deserialize_transaction, tx_path)
+        job = Job(self._cfg.calc_timeout(self._cfg.calc_estimated_deserialize_time(tx_path, percentile=90)))
+        return self._submit(job, self._sync_deserialize_transaction, tx_path, job)
+
+    def _sync_deserialize_transaction(self, tx_path, job=None):
+        cache = AsyncBenchmarkingElectrum._cache
+        if cache is None:
+            outputs, self._raw_tx = self._read_transaction(tx_path, job)
+            return outputs
+        key = TransactionCache.file_key(tx_path)
+        cached = cache.get(key)
+        self._cfg.add_cache_result(cached is not None)
+        if cached is None:
+            cached = self._read_transaction(tx_path, job)
+            cache.put(key, *cached)
+        outputs, self._raw_tx = cached
+        return outputs
 
-    def _sync_deserialize_transaction(self, tx_path):
-        return self._benchmark(self._cfg.add_deserialize_timing, tx_path,
-                               lambda: self._electrum.deserialize_transaction(tx_path))
+    def _read_transaction(self, tx_path, job=None):
+        if self._native is not None:
+            try:
+                return self._native.deserialize_transaction(tx_path), self._native.last_raw_tx
+            except UnsupportedFormatError as ex:
+                logging.info("Reading transaction natively failed (%s), using Electrum instead.", ex.message)
+        # The amount of inputs/outputs is known after reading, so the timing is added afterwards
+        outputs = self._benchmark(lambda measured, path: self._cfg.add_deserialize_timing(
+                                      measured, path, self._count_ios(self._electrum.last_raw_tx)),
+                                  self._cfg.add_deserialize_metrics, tx_path,
+                                  lambda: self._electrum.deserialize_transaction(tx_path, job=job))
+        return outputs, self._electrum.last_raw_tx
 
-    def start_electrum(self, electrum_args):
-        return self._executor.submit(self._start_electrum, electrum_args)
+    def cached_transaction(self, tx_path):
+        """Get the outputs of an already read transaction without doing any work (synchronously).
 
-    @staticmethod
-    def _start_electrum(electrum_args):
-        with subprocess.Popen("electrum " + electrum_args,
-                              universal_newlines=True, stdout=subprocess.PIPE, shell=True) as process:
-            return process.stdout.readlines()
+        Files which have not been hashed yet (e.g. by the prefetcher) are not read for this, they count as not cached.
+
+        Returns:
+            The outputs like deserialize_transaction() or None if the transaction is not cached
+        """
+        cache = AsyncBenchmarkingElectrum._cache
+        key = None if cache is None else TransactionCache.known_key(tx_path)
+        cached = None if key is None else cache.get(key)
+        if cached is None:
+            return None
+        self._cfg.add_cache_result(True)
+        outputs, self._raw_tx = cached
+        return outputs
+
+    def prefetch_transaction(self, tx_path):
+        """Reads a transaction into the shared cache (synchronously) if this is possible without Electrum."""
+        cache = AsyncBenchmarkingElectrum._cache
+        if cache is None or self._native is None:
+            return
+        key = TransactionCache.file_key(tx_path)
+        if key not in cache:
+            try:
+                cache.put(key, self._native.deserialize_transaction(tx_path), self._native.last_raw_tx)
+            except UnsupportedFormatError:
+                pass
+
+    def io_count(self, tx_path):
+        """Get the amount of inputs + outputs of a transaction if it has already been read.
+
+        Returns:
+            Amount of inputs + outputs or None if the transaction is not cached
+        """
+        cache = AsyncBenchmarkingElectrum._cache
+        key = None if cache is None else TransactionCache.known_key(tx_path)
+        cached = None if key is None else cache.get(key)
+        return None if cached is None else self._count_ios(cached[1])
 
     @staticmethod
-    def _benchmark(add_timing_func, tx_path, func):
-        start = time.clock()
+    def _count_ios(raw_tx):
+        try:
+            # Electrum's streamed output only has the number of inputs (see OutputStreamParser)
+            inputs = raw_tx['input_count'] if 'input_count' in raw_tx else len(raw_tx['inputs'])
+            return inputs + len(raw_tx['outputs'])
+        except (KeyError, TypeError):
+            return None
+
+    @property
+    def last_raw_tx(self):
+        return self._raw_tx
+
+    def version(self):
+        return self._executor.submit(self._electrum.version)
+
+    def _benchmark(self, add_timing_func, add_metrics_func, tx_path, func):
+        start = time.monotonic()
         result = func()
-        measured = time.clock() - start
-        add_timing_func(measured, tx_path)
+        add_timing_func(time.monotonic() - start, tx_path)
+        if self._electrum.last_metrics is not None:
+            add_metrics_func(self._electrum.last_metrics.as_dict())
         return result
+
+
+class TransactionListWarmer:
+    """Mounts trusted sticks as soon as they are plugged in and lists their transactions in advance, so the signers
+    can show the list at once. Fed by a libs.hotplug.HotplugWatcher (its callbacks run on the watcher's thread).
+    """
+
+    def __init__(self, cfg: Configuration):
+        self._cfg = cfg
+        self._lock = threading.Lock()
+        self._lists = {}  # uuid -> (mount path, list of SelectFileView.FileEntry)
+
+    def on_added(self, device):
+        if not self._cfg.is_trusted_uuid(device.uuid):
+            return
+        mounted_dev = UsbHelper.mount(device)
+        if mounted_dev is None:
+            logging.warning("Could not mount trusted stick %s", device)
+            return
+        try:
+            entries = TransactionSigner.list_transactions(self._cfg, mounted_dev)
+        finally:
+            mounted_dev.release()  # stays mounted for USB.unmount_timeout, the user will probably need it soon
+        with self._lock:
+            self._lists[device.uuid] = (mounted_dev.mount_path, entries)
+
+    def on_removed(self, device):
+        with self._lock:
+            self._lists.pop(device.uuid, None)
+        mount_sessions.sessions.eject(device.path)  # pulled without Eject - drop the dead mount
+
+    def take(self, mounted_dev: MountedUsbDevice):
+        """Get the prepared list of a stick (only once - later lists are read from the index again).
+
+        Returns:
+            List of SelectFileView.FileEntry or None if there is no list for the stick
+        """
+        with self._lock:
+            mount_path, entries = self._lists.pop(mounted_dev.uuid, (None, None))
+        return entries if mount_path == mounted_dev.mount_path else None
+
+
+class TransactionPrefetcher:
+    """Reads the transactions listed in a SelectFileView in the background while the user is browsing.
+
+    Files are read in the order the user is likely to pick them: the one under the cursor first, then its
+    neighbours (below before above). Only the native reader is used, so prefetching never starts an Electrum
+    process which could slow down an explicitly selected transaction.
+    """
+    RADIUS = 8  # prefetch at most this many rows above and below the cursor
+
+    def __init__(self, cfg: Configuration):
+        self._electrum = AsyncBenchmarkingElectrum(cfg)
+        self._condition = threading.Condition()
+        self._queue = []
+        self._thread = None
+
+    def schedule(self, tx_paths, cursor_idx):
+        """Replaces all pending work with the files around cursor_idx."""
+        order = sorted(range(max(0, cursor_idx - self.RADIUS), min(len(tx_paths), cursor_idx + self.RADIUS + 1)),
+                       key=lambda idx: (abs(idx - cursor_idx), idx < cursor_idx))
+        with self._condition:
+            self._queue = [tx_paths[idx] for idx in order]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="TransactionPrefetcher", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self):
+        """Drops all pending work. A file which is currently read is finished, but nothing else is started."""
+        with self._condition:
+            self._queue = []
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while len(self._queue) == 0:
+                    self._condition.wait()
+                tx_path = self._queue.pop(0)
+            try:
+                self._electrum.prefetch_transaction(tx_path)
+            except (IOError, ElectrumError) as ex:
+                # The stick may have been removed in the meantime - the explicit selection will report errors
+                logging.debug("Prefetching %s failed: %s", tx_path, ex)
@@ -1,13 +1,22 @@
 import config
+import libs.block_devices as block_devices
+import libs.mount_sessions as mount_sessions
 import libs.mount_tool as mount_tool
 from libs.dot_extended.base import MenuOptionSwitcher
 from libs.dot_extended.dialogs import SimpleDialog, StatusMessage
 
 
 class MountedUsbDevice:
-    def __init__(self, dev, mnt):
+    def __init__(self, dev, mnt, uuid=None, lease=None):
         self._dev = dev
         self._mnt = mnt
+        self._uuid = uuid
+        self._lease = lease
+
+    def release(self):
+        """Gives up the mount lease (the stick is unmounted after USB.unmount_timeout unless it is used again)."""
+        if self._lease is not None:
+            self._lease.release()
 
     @property
     def mount_path(self):
@@ -15,21 +24,33 @@ class MountedUsbDevice:
 
     @property
     def device_path(self):
-        return self._mnt
+        return self._dev
+
+    @property
+    def uuid(self):
+        return self._uuid
 
 
 class UsbHelper:
+    DEVICE_FILTER = "/dev/sd.+"
+
     def __init__(self, cfg: config.Configuration):
         self._cfg = cfg
 
     @staticmethod
     def is_usb_plugged_in():
-        UsbHelper.refresh()
-        return len(mount_tool.blkid_dict) > 0
+        return len(UsbHelper.devices()) > 0
 
     @staticmethod
-    def refresh():
-        mount_tool.read_blkid("/dev/sd.+")
+    def devices() -> list:
+        """All plugged in USB storage devices with a filesystem (see block_devices.BlockDevice)."""
+        return block_devices.registry.devices(UsbHelper.DEVICE_FILTER)
+
+    def trusted_devices(self) -> list:
+        return [device for device in UsbHelper.devices() if self._cfg.is_trusted_uuid(device.uuid)]
+
+    def untrusted_devices(self) -> list:
+        return [device for device in UsbHelper.devices() if not self._cfg.is_trusted_uuid(device.uuid)]
 
     def find_trusted_usb(self) -> MountedUsbDevice:
         """Finds the first trusted USB stick
@@ -40,61 +61,88 @@ class UsbHelper:
         Raises:
             LookupError: If no trusted USB stick could be found AND mounted
         """
-        devs_dict = mount_tool.blkid_dict
-        for dev in mount_tool.blkid_dict:
-            if self._cfg.is_trusted_uuid(devs_dict[dev]['UUID']):
-                mount_target = "/media/{uuid}".format(uuid=devs_dict[dev]['UUID'])
-                if mount_tool.get_mount_points().get(dev) or \
-                        mount_tool.mount(dev, mount_target, "umask=000"):
-                    return MountedUsbDevice(dev, mount_target)
+        for device in self.trusted_devices():
+            mounted_dev = UsbHelper.mount(device)
+            if mounted_dev is not None:
+                return mounted_dev
         raise LookupError("Could not mount any device because no USB stick is in the list of trusted devices.")
 
+    @staticmethod
+    def mount(device) -> MountedUsbDevice:
+        """Takes a mount lease on a device (see block_devices.BlockDevice), mounting it to /media/<UUID> unless it
+        is mounted already somewhere. Call release() on the result when done.
+
+        Returns:
+            The MountedUsbDevice or None if the device could not be mounted
+        """
+        lease = mount_sessions.sessions.acquire(device.path, "/media/{uuid}".format(uuid=device.uuid), "umask=000")
+        if lease is None:
+            return None
+        return MountedUsbDevice(device.path, lease.mount_point, device.uuid, lease)
+
 
 class UsbTrusting(MenuOptionSwitcher):
+    """Asks for every plugged in stick which is not trusted yet, one after another."""
+
     def __init__(self, backlight, cfg: config.Configuration):
         super().__init__()
         self._usb_handler = UsbHelper(cfg)
-        self._untrusted_dev = None
+        self._untrusted_devs = []
+        self._trusted_devs = []
         self._backlight = backlight
         self._cfg = cfg
 
     def begin(self):
         if self._usb_handler.is_usb_plugged_in():
-            devs_dict = mount_tool.blkid_dict
-            untrusted_dev = None
-            for dev in devs_dict:
-                if not self._cfg.is_trusted_uuid(devs_dict[dev]['UUID']):
-                    untrusted_dev = dev
-                    break
-            if untrusted_dev is None:
+            self._untrusted_devs = self._usb_handler.untrusted_devices()
+            self._trusted_devs = []
+            if len(self._untrusted_devs) == 0:
                 self.switch(StatusMessage(["Please note",
                                            "Stick(s) are already on the list of trusted devices.",
                                            "{button}"], self._backlight))
             else:
-                self.switch(SimpleDialog(["Trust stick?",
-                                          "Trust {dev} labeled with \"{lbl}\"?"
-                                         .format(dev=untrusted_dev,
-                                                 lbl=devs_dict[untrusted_dev].get('LABEL')),
-                                          "{answers}"],
-                                         callback_on_positive=lambda:
-                                         self.on_trust(devs_dict[untrusted_dev]['UUID'],
-                                                       devs_dict[untrusted_dev].get('LABEL')),
-                                         callback_on_negative=lambda: self.on_abort()))
-
+                self._ask_next()
         else:
             self.switch(StatusMessage(["Information", "No USB stick has been found.", "{button}"],
                                       self._backlight))
 
-    def on_trust(self, uuid, lbl):
-        self._cfg.add_trusted_uuid(uuid)
+    def _ask_next(self):
+        untrusted_dev = self._untrusted_devs.pop(0)
+        remaining = len(self._untrusted_devs)
+        self.switch(SimpleDialog(["Trust stick?",
+                                  "Trust {dev} labeled with \"{lbl}\"?{more}"
+                                 .format(dev=untrusted_dev.path, lbl=untrusted_dev.label,
+                                         more=" ({0} more)".format(remaining) if remaining > 0 else ""),
+                                  "{answers}"],
+                                 callback_on_positive=lambda: self.on_trust(untrusted_dev),
+                                 callback_on_negative=lambda: self.on_abort()))
+
+    def on_trust(self, device):
+        self._cfg.add_trusted_uuid(device.uuid)
+        self._trusted_devs.append(device)
+        if len(self._untrusted_devs) > 0:
+            self._ask_next()
+        else:
+            self._show_trusted()
+        return False
+
+    def _show_trusted(self):
         self.switch(StatusMessage(["Success",
-                                   "Added device ({0}) to the list of trusted devices. "
-                                   "It will be mounted automatically by this plugin."
-                                  .format("UUID: " + uuid if lbl is None else "LABEL: " + lbl),
+                                   "Added device{s} ({0}) to the list of trusted devices. "
+                                   "{1} mounted automatically by this plugin."
+                                  .format(", ".join("UUID: " + device.uuid if device.label is None
+                                                    else "LABEL: " + device.label for device in self._trusted_devs),
+                                          "It will be" if len(self._trusted_devs) == 1 else "They will be",
+                                          s="" if len(self._trusted_devs) == 1 else "s"),
                                    "{button}"], self._backlight))
-        return False
 
     def on_abort(self):
+        if len(self._untrusted_devs) > 0:
+            self._ask_next()
+            return False
+        if len(self._trusted_devs) > 0:
+            self._show_trusted()
+            return False
         self.cleanup()
         return True
 
@@ -105,6 +153,8 @@ class UsbEject(SimpleDialog):
 
     def select(self):
         if self.selected_answer == self.positive:
-            for dev in mount_tool.get_mount_points():
+            # At once, even if the stick is still in use or its idle timeout has not passed yet
+            mount_sessions.sessions.eject()
+            for dev in mount_tool.get_mount_points(UsbHelper.DEVICE_FILTER):
                 mount_tool.umount(dev)
         return self.selected_answer is not None
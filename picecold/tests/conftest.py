@@ -0,0 +1,5 @@
+import os
+import sys
+
+# PiceCold imports its modules relative to the picecold directory (like main.py does when it is run from there)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
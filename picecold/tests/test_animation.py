@@ -0,0 +1,105 @@
+"""Tests of the animation clock and of the marquees driven by it, with a fake time source."""
+import unittest
+
+from libs.dot_extended.animation import AnimationClock
+from libs.dot_extended.marquee import Marquee, MarqueeRows
+
+TEXT = "abcdefghijklmnopqrstuvwxyz"
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 500.0
+
+    def __call__(self):
+        return self.now
+
+
+class AnimationClockTest(unittest.TestCase):
+    def setUp(self):
+        self.time = FakeTime()
+        self.clock = AnimationClock(self.time)
+
+    def test_now_stands_still_in_idle(self):
+        start = self.clock.now()
+        self.time.now += 2
+        self.clock.tick(idle=True)
+        self.time.now += 100
+        self.clock.tick(idle=True)
+        self.assertEqual(self.clock.now() - start, 2)
+        self.clock.tick()
+        self.time.now += 1
+        self.assertEqual(self.clock.now() - start, 3)
+
+    def test_suspended_animations_get_animation_time(self):
+        decorative, running = [], []
+        self.clock.subscribe(1.0, decorative.append, suspend_in_idle=True)
+        self.clock.subscribe(1.0, running.append)
+        self.time.now += 1
+        self.clock.tick()
+        self.time.now += 1
+        self.clock.tick(idle=True)
+        self.time.now += 60
+        self.clock.tick()
+        # The decorative one stopped with the first idle tick and goes on from there
+        self.assertEqual(decorative, [1, 2])
+        self.assertEqual(running, [1, 2, 62])
+
+    def test_next_due(self):
+        self.assertIsNone(self.clock.next_due())
+        self.clock.subscribe(0.5, lambda elapsed: None, suspend_in_idle=True)
+        self.assertIsNone(self.clock.next_due(idle=True))
+        self.time.now += 0.2
+        self.assertEqual(self.clock.next_due(), 0.0)
+        self.clock.tick()
+        self.assertAlmostEqual(self.clock.next_due(), 0.3)
+
+    def test_callback_ends_animation(self):
+        self.clock.subscribe(0.1, lambda elapsed: elapsed < 0.2)
+        for _ in range(5):
+            self.time.now += 0.1
+            self.clock.tick()
+        self.assertEqual(self.clock.active, 0)
+
+
+class MarqueeTest(unittest.TestCase):
+    def setUp(self):
+        self.time = FakeTime()
+        self.clock = AnimationClock(self.time)
+
+    def test_short_text_does_not_scroll(self):
+        marquee = Marquee("short", icon='>', clock=self.clock)
+        self.assertFalse(marquee.scrolling)
+        self.assertEqual(marquee.frame(), ">short".ljust(16))
+
+    def test_position_follows_clock(self):
+        marquee = Marquee(TEXT, scroll_speed=100, scroll_delay=200, clock=self.clock)
+        self.assertEqual(marquee.frame(), TEXT[:16])
+        self.time.now += 0.25
+        self.assertEqual(marquee.frame(), TEXT[:16])
+        self.time.now += 0.1
+        self.assertEqual(marquee.frame(), TEXT[1:17])
+        # One cycle: the delay and one step for every character of the text and its padding
+        self.time.now += 0.2 + (len(TEXT) + 2) * 0.1
+        self.assertEqual(marquee.frame(), TEXT[1:17])
+
+    def test_pauses_in_idle(self):
+        marquee = Marquee(TEXT, scroll_speed=100, scroll_delay=0, clock=self.clock)
+        self.time.now += 0.35
+        self.clock.tick(idle=True)
+        self.time.now += 12.34
+        self.assertEqual(marquee.frame(), TEXT[3:19])
+        self.clock.tick()
+        self.time.now += 0.1
+        self.assertEqual(marquee.frame(), TEXT[4:20])
+
+    def test_rows_keep_marquee_until_text_changes(self):
+        rows = MarqueeRows(self.clock)
+        self.assertEqual(rows.render(0, TEXT, scroll_delay=0), TEXT[:16])
+        self.time.now += 0.4
+        self.assertEqual(rows.render(0, TEXT, scroll_delay=0), TEXT[1:17])
+        self.assertEqual(rows.render(0, TEXT[::-1], scroll_delay=0), TEXT[::-1][:16])
+
+
+if __name__ == '__main__':
+    unittest.main()
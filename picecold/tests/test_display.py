@@ -0,0 +1,219 @@
+"""Tests of the display layer against the virtual LCD: framebuffer diffing, glyph slots and the UI loop."""
+import threading
+import time
+import unittest
+
+from dot3k.menu import _MODE_ADJ as ADJUST
+
+from libs.dot_extended import scheduler
+from libs.dot_extended.glyphs import GlyphManager
+from libs.dot_extended.scheduler import RedrawScheduler
+from libs.dot_extended.shadow import ShadowLcd
+from libs.dot_extended.virtual import VirtualDisplay
+
+
+def bitmap(n):
+    return [n] * 8
+
+
+def glyph(n):
+    return GlyphManager.placeholder("TEST_GLYPH_{0}".format(n), bitmap(n))
+
+
+class ShadowLcdTest(unittest.TestCase):
+    def setUp(self):
+        self.display = VirtualDisplay()
+        self.lcd = ShadowLcd(self.display.lcd)
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write("Hello world".ljust(16))
+        self.lcd.end_frame()
+        self.display.log.clear()
+
+    def lcd_calls(self):
+        return [(event.name, event.args) for event in self.display.log.select('lcd')]
+
+    def test_unchanged_frame_sends_nothing(self):
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write("Hello world".ljust(16))
+        self.assertEqual(self.lcd.end_frame(), 0)
+        self.assertEqual(self.lcd_calls(), [])
+
+    def test_only_changed_cells_are_written(self):
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write("Hello World!".ljust(16))
+        self.assertEqual(self.lcd_calls(), [('set_cursor_position', (6, 0)), ('write', ('W',)),
+                                            ('set_cursor_position', (11, 0)), ('write', ('!',))])
+        self.assertEqual(self.lcd.end_frame(), 4)
+        self.assertEqual(self.display.lcd.rows[0], "Hello World!".ljust(16))
+
+    def test_adjacent_changes_are_one_run(self):
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write("Hi there")
+        self.assertEqual(self.lcd_calls(), [('set_cursor_position', (1, 0)), ('write', ('i there',))])
+
+    def test_cursor_is_only_moved_if_needed(self):
+        # The display's cursor is still behind the first row written in setUp()
+        self.lcd.set_cursor_position(0, 1)
+        self.lcd.write("abc")
+        self.lcd.write("def")
+        self.assertEqual(self.lcd_calls(), [('write', ('abc',)), ('write', ('def',))])
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write("J")
+        self.assertEqual(self.lcd_calls()[2:], [('set_cursor_position', (0, 0)), ('write', ('J',))])
+        self.assertEqual(self.lcd.end_frame(), 8)
+
+    def test_run_does_not_wrap_around(self):
+        self.lcd.set_cursor_position(14, 2)
+        self.lcd.write("xyzw")
+        self.assertEqual(self.lcd_calls(), [('set_cursor_position', (14, 2)), ('write', ('xy',)),
+                                            ('set_cursor_position', (0, 0)), ('write', ('zw',))])
+        self.assertEqual(self.display.lcd.rows[0][:2], "zw")
+
+    def test_clear_and_invalidate(self):
+        self.lcd.clear()
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write(" " * 16)
+        self.assertEqual(self.lcd_calls(), [('clear', ())])
+        self.lcd.invalidate()
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write(" " * 16)
+        self.assertEqual(self.lcd_calls()[1:], [('set_cursor_position', (0, 0)), ('write', (" " * 16,))])
+
+    def test_bytes_match_the_display(self):
+        start = self.display.lcd.bytes
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write("Bye world".ljust(16) + "second row")
+        self.lcd.create_char(0, bitmap(1))
+        self.lcd.create_char(0, bitmap(1))
+        self.assertEqual(self.lcd.end_frame(), self.display.lcd.bytes - start)
+
+
+class GlyphManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.display = VirtualDisplay()
+        self.lcd = ShadowLcd(self.display.lcd)
+
+    def write(self, text):
+        self.lcd.set_cursor_position(0, 0)
+        self.lcd.write(text)
+
+    def uploads(self):
+        return [event.args for event in self.display.log.select('lcd', 'create_char')]
+
+    def test_glyphs_are_uploaded_once(self):
+        self.write(glyph(0) + glyph(1) + glyph(0))
+        self.assertEqual(self.display.lcd.rows[0][:3], "\x00\x01\x00")
+        self.write(glyph(1) + glyph(0))
+        self.assertEqual(self.uploads(), [(0, tuple(bitmap(0))), (1, tuple(bitmap(1)))])
+        self.assertEqual(self.display.lcd.rows[0][:2], "\x01\x00")
+
+    def test_least_recently_used_glyph_is_evicted(self):
+        for n in range(GlyphManager.SLOTS):
+            self.write(glyph(n))
+        # Using glyph 0 again makes glyph 1 the least recently used one
+        self.write(glyph(0))
+        self.write(glyph(8))
+        self.assertEqual(self.uploads()[-1], (1, tuple(bitmap(8))))
+        self.assertEqual(self.display.lcd.cgram[1], tuple(bitmap(8)))
+        self.assertEqual(self.lcd.glyphs.uploads, GlyphManager.SLOTS + 1)
+        # Glyph 1 has to be uploaded again - into the slot of glyph 2, now the least recently used one
+        self.write(glyph(1))
+        self.assertEqual(self.uploads()[-1], (2, tuple(bitmap(1))))
+        self.assertEqual(self.lcd.glyphs.used_slots, GlyphManager.SLOTS)
+
+    def test_more_than_eight_glyphs_at_once(self):
+        self.assertRaises(OverflowError, self.write, ''.join(glyph(n) for n in range(GlyphManager.SLOTS + 1)))
+
+    def test_slot_overwritten_directly_is_released(self):
+        self.write(glyph(0))
+        self.lcd.create_char(0, bitmap(7))
+        self.write(glyph(0))
+        self.assertEqual(self.display.lcd.cgram[0], tuple(bitmap(0)))
+        self.assertEqual(len(self.uploads()), 3)
+
+
+class FakeMenu:
+    """Menu in adjust mode whose view redraws every 10 ms."""
+    mode = ADJUST
+
+    def __init__(self):
+        self.redraws = 0
+
+    def redraw(self):
+        self.redraws += 1
+
+    def current_value(self):
+        return self
+
+    @staticmethod
+    def frame_need():
+        return scheduler.animation(0.01)
+
+
+class RedrawSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.menu = FakeMenu()
+        self.scheduler = RedrawScheduler(self.menu, idle_timeout=60.0)
+        self.addCleanup(scheduler._schedulers.remove, self.scheduler)
+        self.calls = []
+
+    def record(self, name):
+        return lambda: self.calls.append(name)
+
+    def test_posted_calls_run_in_order_before_the_frame(self):
+        for name in ('a', 'b', 'c'):
+            self.scheduler.post(self.record(name))
+        self.scheduler.post(lambda: self.calls.append(self.menu.redraws))
+        self.scheduler.run_once()
+        self.assertEqual(self.calls, ['a', 'b', 'c', 0])
+        self.assertEqual(self.menu.redraws, 1)
+
+    def test_timers_run_by_due_time_then_in_order(self):
+        self.scheduler.call_later(0.03, self.record('late'))
+        self.scheduler.call_later(0.01, self.record('first'))
+        self.scheduler.call_later(0.01, self.record('second'))
+        self.scheduler.call_later(10, self.record('never'))
+        time.sleep(0.05)
+        self.scheduler.run_once()
+        self.assertEqual(self.calls, ['first', 'second', 'late'])
+
+    def test_posted_calls_run_before_due_timers(self):
+        self.scheduler.call_later(0, self.record('timer'))
+        self.scheduler.post(self.record('posted'))
+        self.scheduler.run_once()
+        self.assertEqual(self.calls, ['posted', 'timer'])
+
+    def test_calls_posted_by_calls_run_in_the_same_pass(self):
+        self.scheduler.post(lambda: (self.calls.append('outer'), self.scheduler.post(self.record('inner'))))
+        self.scheduler.run_once()
+        self.assertEqual(self.calls, ['outer', 'inner'])
+
+    def test_failing_call_does_not_stop_the_loop(self):
+        self.scheduler.post(lambda: 1 / 0)
+        self.scheduler.post(self.record('after'))
+        with self.assertLogs(level='ERROR'):
+            self.scheduler.run_once()
+        self.assertEqual(self.calls, ['after'])
+
+    def test_run_in_ui(self):
+        # From another thread calls are queued for the loop, on the loop they run at once
+        self.scheduler.run_once()
+        thread = threading.Thread(target=scheduler.run_in_ui, args=(self.record('queued'),))
+        thread.start()
+        thread.join()
+        self.assertEqual(self.calls, [])
+        self.scheduler.run_once()
+        self.assertEqual(self.calls, ['queued'])
+        self.scheduler.post(lambda: scheduler.run_in_ui(self.record('direct')))
+        self.scheduler.run_once()
+        self.assertEqual(self.calls, ['queued', 'direct'])
+
+    def test_combine(self):
+        self.assertEqual(scheduler.combine(scheduler.NEVER, scheduler.ON_INPUT), scheduler.ON_INPUT)
+        self.assertEqual(scheduler.combine(scheduler.scroll(0.3), scheduler.animation(0.5)),
+                         scheduler.animation(0.3))
+        self.assertEqual(scheduler.scroll_need(["short", "x" * 17], 200), scheduler.scroll(0.2))
+
+
+if __name__ == '__main__':
+    unittest.main()
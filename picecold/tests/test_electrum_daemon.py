@@ -0,0 +1,233 @@
+"""Tests of ElectrumDaemonSigner against a fake Electrum executable with a JSON-RPC daemon.
+
+Run with python -m pytest picecold/tests from the repository root (see conftest.py).
+"""
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from libs.electrum import ElectrumDaemonSigner, ElectrumError, ElectrumStartError
+
+# Stands in for "electrum": "setconfig" writes config.json next to it, "daemon -d" starts the daemon in the
+# background, which answers the RPC methods PiceCold uses. The wallet password is "secret".
+FAKE_ELECTRUM = r'''#!{python}
+import base64, json, os, subprocess, sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+args = [arg for arg in sys.argv[1:] if arg != '--offline']
+
+
+def load_config():
+    try:
+        with open(CONFIG) as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        return {{}}
+
+
+if args[0] == 'setconfig':
+    config = load_config()
+    config[args[1]] = args[2]
+    with open(CONFIG, 'w') as config_file:
+        json.dump(config, config_file)
+elif args[0] == 'daemon':
+    if args[1:] != ['-d'] or load_config().get('fail_start'):
+        sys.exit(1)
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve'], start_new_session=True,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+elif args[0] == 'serve':
+    config = load_config()
+    auth = 'Basic ' + base64.b64encode('{{0}}:{{1}}'.format(config['rpcuser'], config['rpcpassword']).encode()).decode()
+    wallet = {{'loaded': False}}
+
+    def handle(method, params):
+        if method == 'version':
+            return '4.0.9'
+        if method == 'load_wallet':
+            if params.get('password') != 'secret':
+                raise ValueError('Invalid password')
+            wallet['loaded'] = True
+            return True
+        if method == 'deserialize':
+            # The outputs are encoded in the transaction: "<address>:<satoshi>,..."
+            return {{'inputs': [{{}}], 'outputs': [{{'address': address, 'value': int(value)}}
+                                                 for address, value in (output.split(':')
+                                                                        for output in params['tx'].split(','))]}}
+        if method == 'signtransaction':
+            if not wallet['loaded'] or params.get('password') != 'secret':
+                raise ValueError('Wallet not loaded or wrong password')
+            return {{'hex': 'signed:' + params['tx'], 'complete': True}}
+        raise ValueError('Unknown method ' + method)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.headers.get('Authorization') != auth:
+                self.send_response(401)
+                self.end_headers()
+                return
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            reply = {{'jsonrpc': '2.0', 'id': request['id']}}
+            try:
+                reply['result'] = handle(request['method'], request['params'])
+            except (ValueError, KeyError) as ex:
+                reply['error'] = {{'code': -32000, 'message': str(ex)}}
+            body = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            if request['method'] == 'stop':
+                server.shutdown_requested = True
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((config['rpchost'], int(config['rpcport'])), Handler)
+    server.shutdown_requested = False
+    while not server.shutdown_requested:
+        server.handle_request()
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ElectrumDaemonSignerTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.dir = self._dir.name
+        self.electrum = os.path.join(self.dir, 'electrum')
+        with open(self.electrum, 'w') as script:
+            script.write(FAKE_ELECTRUM.format(python=sys.executable))
+        os.chmod(self.electrum, os.stat(self.electrum).st_mode | stat.S_IXUSR)
+        self.signer = self.new_signer()
+        self.started = []
+
+    def tearDown(self):
+        for signer in self.started:
+            signer.stop()
+        self._dir.cleanup()
+
+    def new_signer(self, **kwargs):
+        return ElectrumDaemonSigner(self.electrum, port=kwargs.pop('port', None) or free_port(),
+                                    password='rpc-secret', **kwargs)
+
+    def start(self, signer, wallet_password='secret'):
+        self.started.append(signer)
+        signer.start(wallet_password)
+
+    def write_tx(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as tx_file:
+            tx_file.write(content + '\n')
+        return path
+
+    def test_start_loads_wallet(self):
+        self.start(self.signer)
+        self.assertIsNotNone(self.signer.load_time)
+        self.assertEqual(self.signer.version(), '4.0.9')
+
+    def test_start_with_wrong_wallet_password(self):
+        with self.assertRaises(ElectrumError):
+            self.start(self.signer, 'wrong')
+
+    def test_start_fails_if_daemon_does_not_start(self):
+        self.signer._run_electrum('setconfig', 'fail_start', '1')
+        with self.assertRaises(ElectrumStartError):
+            self.signer.start('secret')
+
+    def test_only_loopback_hosts(self):
+        with self.assertRaises(ValueError):
+            ElectrumDaemonSigner(self.electrum, host='192.168.1.2')
+
+    def test_deserialize(self):
+        self.start(self.signer)
+        outputs = self.signer.deserialize_transaction(self.write_tx('a.txn', 'addr1:150000000,addr2:5000'))
+        self.assertEqual(outputs, [('addr1', 1.5), ('addr2', 0.00005)])
+        self.assertEqual(len(self.signer.last_raw_tx['outputs']), 2)
+        self.assertIsNotNone(self.signer.last_metrics)
+
+    def test_deserialize_missing_file(self):
+        self.start(self.signer)
+        with self.assertRaises(IOError):
+            self.signer.deserialize_transaction(os.path.join(self.dir, 'missing.txn'))
+
+    def test_sign(self):
+        self.start(self.signer)
+        signed_path = os.path.join(self.dir, 'a_signed.txn')
+        self.assertTrue(self.signer.sign_transaction(self.write_tx('a.txn', 'addr1:1'), signed_path, 'secret'))
+        with open(signed_path) as signed_file:
+            self.assertEqual(json.load(signed_file)['hex'], 'signed:addr1:1')
+
+    def test_sign_with_wrong_password(self):
+        self.start(self.signer)
+        signed_path = os.path.join(self.dir, 'a_signed.txn')
+        with self.assertRaises(ElectrumError):
+            self.signer.sign_transaction(self.write_tx('a.txn', 'addr1:1'), signed_path, 'wrong')
+        self.assertFalse(os.path.exists(signed_path))
+
+    def test_sign_does_not_overwrite(self):
+        self.start(self.signer)
+        signed_path = self.write_tx('a_signed.txn', 'already signed')
+        with self.assertRaises(IOError):
+            self.signer.sign_transaction(self.write_tx('a.txn', 'addr1:1'), signed_path, 'secret')
+
+    def test_sign_leaves_no_partial_file(self):
+        self.start(self.signer)
+        signed_path = os.path.join(self.dir, 'a_signed.txn')
+        self.signer.sign_transaction(self.write_tx('a.txn', 'addr1:1'), signed_path, 'secret')
+        self.assertEqual(sorted(os.listdir(self.dir)), ['a.txn', 'a_signed.txn', 'config.json', 'electrum'])
+
+    def test_sign_keeps_partial_file_of_other_run(self):
+        self.start(self.signer)
+        signed_path = os.path.join(self.dir, 'a_signed.txn')
+        other_part = self.write_tx('a_signed.txn.part', 'being written by another run')
+        with self.assertRaises(IOError):
+            self.signer.sign_transaction(self.write_tx('a.txn', 'addr1:1'), signed_path, 'secret')
+        self.assertTrue(os.path.exists(other_part))
+        self.assertFalse(os.path.exists(signed_path))
+
+    def test_wrong_rpc_password(self):
+        self.start(self.signer)
+        intruder = ElectrumDaemonSigner(self.electrum, port=self.signer._port, password='guessed')
+        with self.assertRaises(ElectrumError):
+            intruder.version()
+
+    def test_no_daemon(self):
+        with self.assertRaises(OSError):
+            self.signer.version()
+
+    def test_concurrent_calls_keep_their_results(self):
+        self.start(self.signer)
+        paths = [self.write_tx('{0}.txn'.format(idx), 'addr{0}:{0}'.format(idx)) for idx in range(8)]
+        errors = []
+
+        def deserialize(path, idx):
+            try:
+                for _ in range(5):
+                    self.signer.deserialize_transaction(path)
+                    time.sleep(0.01)  # the results are read after some bookkeeping, other calls end meanwhile
+                    self.assertEqual(self.signer.last_raw_tx['outputs'][0]['address'], 'addr{0}'.format(idx))
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=deserialize, args=(path, idx)) for idx, path in enumerate(paths)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
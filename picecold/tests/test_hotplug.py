@@ -0,0 +1,225 @@
+"""Tests of DeviceRegistry and HotplugWatcher on a fake /proc, /dev and /sys tree, including the auto-mount of
+trusted sticks with a stubbed mount tool."""
+import configparser
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import main  # noqa: F401 - config imports main, which has to be imported first
+from config import Configuration
+from libs import mount_sessions, mount_tool
+from libs.block_devices import DeviceRegistry
+from libs.hotplug import HotplugWatcher
+from libs.mount_sessions import MountSessionManager
+from menu_opts.sign import TransactionListWarmer
+from menu_opts.usb import MountedUsbDevice, UsbHelper
+
+SD_CARD_UUID = '0123-4567'
+STICK_UUID = '89AB-CDEF'
+
+
+class FakeSystem:
+    """The parts of /proc, /dev and /sys which DeviceRegistry reads, below a temporary root."""
+
+    def __init__(self, root):
+        self.root = root
+        self._partitions = {}
+        for directory in ('proc', 'dev/disk/by-uuid', 'dev/disk/by-label', 'sys/class/block'):
+            os.makedirs(os.path.join(root, directory))
+        self._write_partitions()
+        self.plug('mmcblk0', 'mmcblk0p1', SD_CARD_UUID, 'platform/mmc', removable=False)
+
+    def plug(self, disk, partition, uuid, bus='platform/usb1/1-1/host0', label=None, removable=True):
+        disk_dir = os.path.join(self.root, 'sys/devices', bus, 'block', disk)
+        os.makedirs(os.path.join(disk_dir, partition))
+        with open(os.path.join(disk_dir, 'removable'), 'w') as flag:
+            flag.write('1\n' if removable else '0\n')
+        with open(os.path.join(disk_dir, partition, 'partition'), 'w') as number:
+            number.write('1\n')
+        os.symlink(os.path.relpath(os.path.join(disk_dir, partition), os.path.join(self.root, 'sys/class/block')),
+                   os.path.join(self.root, 'sys/class/block', partition))
+        os.symlink('../../' + partition, os.path.join(self.root, 'dev/disk/by-uuid', uuid))
+        if label is not None:
+            os.symlink('../../' + partition, os.path.join(self.root, 'dev/disk/by-label', label.replace(' ', '\\x20')))
+        self._partitions[partition] = disk
+        self._write_partitions()
+
+    def unplug(self, partition, uuid, stale_link=False):
+        os.remove(os.path.join(self.root, 'sys/class/block', partition))
+        if not stale_link:
+            os.remove(os.path.join(self.root, 'dev/disk/by-uuid', uuid))
+        del self._partitions[partition]
+        self._write_partitions()
+
+    def _write_partitions(self):
+        with open(os.path.join(self.root, 'proc/partitions'), 'w') as partitions:
+            partitions.write("major minor  #blocks  name\n\n")
+            for minor, name in enumerate(sorted(set(self._partitions) | set(self._partitions.values()))):
+                partitions.write("   8     {0:5d}   1000 {1}\n".format(minor, name))
+
+
+class FakeMounts:
+    """Stands in for mount/umount and the mount table."""
+
+    def __init__(self):
+        self.mounted = {}
+        self.calls = []
+
+    def mount(self, device, mount_point, options=""):
+        self.calls.append(('mount', device, mount_point, options))
+        self.mounted[device] = mount_point
+        return True
+
+    def umount(self, device):
+        self.calls.append(('umount', device))
+        return self.mounted.pop(device, None) is not None
+
+    def mount_point(self, device):
+        return self.mounted.get(device)
+
+
+class HotplugTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.system = FakeSystem(os.path.join(self._dir.name, 'root'))
+        self.registry = DeviceRegistry(self.system.root)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+
+class DeviceRegistryTest(HotplugTestCase):
+    def test_devices(self):
+        self.system.plug('sda', 'sda1', STICK_UUID, label='MY STICK')
+        self.assertEqual([device.path for device in self.registry.devices()], ['/dev/mmcblk0p1', '/dev/sda1'])
+        stick = self.registry.by_uuid(STICK_UUID)
+        self.assertEqual((stick.name, stick.label, stick.removable, stick.usb), ('sda1', 'MY STICK', True, True))
+        sd_card = self.registry.by_path('/dev/mmcblk0p1')
+        self.assertEqual((sd_card.uuid, sd_card.label, sd_card.removable, sd_card.usb),
+                         (SD_CARD_UUID, None, False, False))
+        self.assertEqual(self.registry.devices(UsbHelper.DEVICE_FILTER), [stick])
+        self.assertEqual(self.registry.get_dev(STICK_UUID), '/dev/sda1')
+
+    def test_probes_only_after_changes(self):
+        self.registry.devices()
+        self.registry.devices()
+        self.assertEqual(self.registry.probes, 1)
+        self.system.plug('sda', 'sda1', STICK_UUID)
+        self.assertTrue(self.registry.is_plugged_in(STICK_UUID))
+        self.assertEqual(self.registry.probes, 2)
+
+    def test_removed_device_with_stale_link(self):
+        self.system.plug('sda', 'sda1', STICK_UUID)
+        self.assertTrue(self.registry.is_plugged_in('/dev/sda1'))
+        # udev has not removed the UUID link yet, but the kernel has dropped the device
+        self.system.unplug('sda1', STICK_UUID, stale_link=True)
+        self.assertFalse(self.registry.is_plugged_in('/dev/sda1'))
+        self.assertIsNone(self.registry.by_uuid(STICK_UUID))
+        self.assertEqual(self.registry.get_dev(STICK_UUID), "")
+
+
+class HotplugWatcherTest(HotplugTestCase):
+    def setUp(self):
+        super().setUp()
+        self.added = []
+        self.removed = []
+        self.watcher = HotplugWatcher(self.registry, self.added.append, self.removed.append, UsbHelper.DEVICE_FILTER)
+
+    def test_added_and_removed(self):
+        self.watcher.poll()
+        self.assertEqual(self.added, [])  # the SD card does not match the filter
+        self.system.plug('sda', 'sda1', STICK_UUID)
+        self.system.plug('sdb', 'sdb1', 'FFFF-0000')
+        self.watcher.poll()
+        self.assertEqual([device.path for device in self.added], ['/dev/sda1', '/dev/sdb1'])
+        self.watcher.poll()
+        self.assertEqual(len(self.added), 2)
+        self.system.unplug('sda1', STICK_UUID)
+        self.watcher.poll()
+        self.assertEqual([device.uuid for device in self.removed], [STICK_UUID])
+        self.assertEqual(len(self.added), 2)
+
+    def test_failing_callback(self):
+        def fail(device):
+            raise RuntimeError("no " + device.name)
+
+        watcher = HotplugWatcher(self.registry, fail, self.removed.append, UsbHelper.DEVICE_FILTER)
+        self.system.plug('sda', 'sda1', STICK_UUID)
+        with self.assertLogs(level='ERROR'):
+            watcher.poll()
+        self.system.unplug('sda1', STICK_UUID)
+        watcher.poll()
+        self.assertEqual(len(self.removed), 1)
+
+    def test_background_thread(self):
+        watcher = HotplugWatcher(self.registry, self.added.append, self.removed.append, UsbHelper.DEVICE_FILTER,
+                                 interval=0.01)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        self.system.plug('sda', 'sda1', STICK_UUID)
+        deadline = time.monotonic() + 5
+        while not self.added and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([device.uuid for device in self.added], [STICK_UUID])
+
+
+class AutoMountTest(HotplugTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stick = os.path.join(self._dir.name, 'stick')
+        os.makedirs(self.stick)
+        for name in ('a.txn', 'a_SIGNED.txn'):
+            with open(os.path.join(self.stick, name), 'w') as tx_file:
+                tx_file.write(name)
+        cfg_dict = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
+        cfg_dict.read_dict({
+            # The stubbed mount does not mount anything: an absolute transaction directory replaces the mount point
+            'Transaction': {'directory': self.stick, 'index_directory': self._dir.name, 'signed_suffix': '_SIGNED',
+                            'unsigned_pattern': r'.*(?<!${signed_suffix})\.txn'},
+            'USB': {'trusted_uuids': json.dumps([STICK_UUID])},
+            'Stats': {},
+        })
+        self.warmer = TransactionListWarmer(Configuration(cfg_dict, self._dir.name))
+        self.mounts = FakeMounts()
+        self.sessions = MountSessionManager(idle_timeout=30.0)
+        for patcher in (mock.patch.object(mount_tool, 'mount', self.mounts.mount),
+                        mock.patch.object(mount_tool, 'umount', self.mounts.umount),
+                        mock.patch.object(mount_tool.mount_table, 'mount_point', self.mounts.mount_point),
+                        mock.patch.object(mount_sessions, 'sessions', self.sessions)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.sessions.close)  # before the patchers are stopped
+        self.watcher = HotplugWatcher(self.registry, self.warmer.on_added, self.warmer.on_removed,
+                                      UsbHelper.DEVICE_FILTER)
+
+    def test_trusted_stick_is_mounted_and_listed(self):
+        self.system.plug('sda', 'sda1', STICK_UUID)
+        self.watcher.poll()
+        mount_point = "/media/" + STICK_UUID
+        self.assertEqual(self.mounts.calls, [('mount', '/dev/sda1', mount_point, 'umask=000')])
+        # The lease has been released, but the stick stays mounted for the signers
+        self.assertTrue(self.sessions.is_mounted('/dev/sda1'))
+        entries = self.warmer.take(MountedUsbDevice('/dev/sda1', mount_point, STICK_UUID))
+        self.assertEqual([entry.file_path for entry in entries], [os.path.join(self.stick, 'a.txn')])
+        self.assertIsNone(self.warmer.take(MountedUsbDevice('/dev/sda1', mount_point, STICK_UUID)))
+
+    def test_removed_stick_is_unmounted(self):
+        self.system.plug('sda', 'sda1', STICK_UUID)
+        self.watcher.poll()
+        self.system.unplug('sda1', STICK_UUID)
+        self.watcher.poll()
+        self.assertEqual(self.mounts.calls[-1], ('umount', '/dev/sda1'))
+        self.assertFalse(self.sessions.is_mounted('/dev/sda1'))
+        self.assertIsNone(self.warmer.take(MountedUsbDevice('/dev/sda1', "/media/" + STICK_UUID, STICK_UUID)))
+
+    def test_untrusted_stick_is_not_mounted(self):
+        self.system.plug('sdb', 'sdb1', 'FFFF-0000')
+        self.watcher.poll()
+        self.assertEqual(self.mounts.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
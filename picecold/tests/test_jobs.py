@@ -0,0 +1,147 @@
+"""Tests of Job and Watchdog with a fake clock and fake processes (and one real process group)."""
+import signal
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from libs.jobs import Job, JobCancelledError, JobTimeoutError, Watchdog
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProcess:
+    def __init__(self, pid):
+        self.pid = pid
+
+
+class JobTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.watchdog = Watchdog(self.clock, background=False)
+        patcher = mock.patch('libs.jobs.os.killpg')
+        self.killpg = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cancel_terminates_process_group(self):
+        job = Job(watchdog=self.watchdog)
+        job.start()
+        job.attach_process(FakeProcess(42))
+        job.cancel()
+        self.killpg.assert_called_once_with(42, signal.SIGTERM)
+        self.assertTrue(job.cancelled)
+        self.assertRaises(JobCancelledError, job.check)
+        self.assertEqual(job.kill_at, self.clock.now + Job.KILL_GRACE)
+
+    def test_cancel_before_attach(self):
+        job = Job(watchdog=self.watchdog)
+        job.start()
+        job.cancel()
+        self.killpg.assert_not_called()
+        # Processes and other operations attached afterwards are aborted at once
+        job.attach_process(FakeProcess(7))
+        self.killpg.assert_called_once_with(7, signal.SIGTERM)
+        abort = mock.Mock()
+        job.attach(abort)
+        abort.assert_called_once_with()
+
+    def test_cancel_reason_is_kept(self):
+        job = Job(watchdog=self.watchdog)
+        job.cancel()
+        job.cancel(JobTimeoutError("late"))
+        with self.assertRaises(JobCancelledError) as raised:
+            job.check()
+        self.assertNotIsInstance(raised.exception, JobTimeoutError)
+
+    def test_timeout_escalates_to_sigkill(self):
+        job = Job(10, watchdog=self.watchdog)
+        job.start()
+        job.attach_process(FakeProcess(42))
+        self.clock.now += 9.9
+        self.watchdog.poll()
+        self.assertFalse(job.cancelled)
+        self.assertAlmostEqual(job.remaining(), 0.1)
+
+        self.clock.now += 0.1
+        self.watchdog.poll()
+        self.assertRaises(JobTimeoutError, job.check)
+        self.assertEqual(job.remaining(), 0.0)
+        self.killpg.assert_called_once_with(42, signal.SIGTERM)
+
+        # The group ignored SIGTERM: SIGKILL follows after the grace period, once
+        self.clock.now += Job.KILL_GRACE - 0.1
+        self.watchdog.poll()
+        self.assertEqual(self.killpg.call_count, 1)
+        self.clock.now += 0.1
+        self.watchdog.poll()
+        self.watchdog.poll()
+        self.assertEqual(self.killpg.call_args_list, [mock.call(42, signal.SIGTERM), mock.call(42, signal.SIGKILL)])
+        self.assertIsNone(job.kill_at)
+
+    def test_no_sigkill_after_detach(self):
+        job = Job(watchdog=self.watchdog)
+        job.start()
+        job.attach_process(FakeProcess(42))
+        job.cancel()
+        # The process has exited and its job detached it before the grace period was over
+        job.detach()
+        self.clock.now += Job.KILL_GRACE
+        self.watchdog.poll()
+        self.killpg.assert_called_once_with(42, signal.SIGTERM)
+
+    def test_queue_time_does_not_count(self):
+        job = Job(10, watchdog=self.watchdog)
+        self.clock.now += 60
+        self.assertIsNone(job.remaining())
+        job.start()
+        self.assertEqual(job.remaining(), 10)
+
+    def test_start_of_cancelled_job_raises(self):
+        job = Job(watchdog=self.watchdog)
+        job.cancel()
+        self.assertRaises(JobCancelledError, job.start)
+
+    def test_finish_unwatches(self):
+        job = Job(1, watchdog=self.watchdog)
+        job.start()
+        self.assertIn(job, self.watchdog)
+        job.finish()
+        self.assertNotIn(job, self.watchdog)
+        # A finished job is not cancelled after its deadline anymore
+        self.clock.now += 2
+        self.watchdog.poll()
+        self.assertFalse(job.cancelled)
+
+    def test_vanished_group(self):
+        self.killpg.side_effect = ProcessLookupError
+        job = Job(watchdog=self.watchdog)
+        job.attach_process(FakeProcess(42))
+        job.cancel()
+        self.assertTrue(job.cancelled)
+
+
+class WatchdogThreadTest(unittest.TestCase):
+    def test_timeout_kills_real_process_group(self):
+        job = Job(0.2)
+        process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'], start_new_session=True)
+        try:
+            job.start()
+            job.attach_process(process)
+            self.assertEqual(process.wait(10), -signal.SIGTERM)
+            self.assertRaises(JobTimeoutError, job.check)
+        finally:
+            job.detach()
+            job.finish()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests of the weighted least-squares LatencyModel."""
+import unittest
+from unittest import mock
+
+from libs.latency import LatencyModel
+
+
+class LatencyModelTest(unittest.TestCase):
+    def test_no_samples(self):
+        model = LatencyModel()
+        self.assertIsNone(model.estimate(10))
+        self.assertEqual((model.overhead, model.per_kb, model.per_io), (0.0, 0.0, 0.0))
+
+    def test_fits_exact_samples(self):
+        # seconds = 2 + 0.5 * size_kb + 0.1 * io_count
+        samples = [[size, ios, 2 + 0.5 * size + 0.1 * ios] for size, ios in ((1, 2), (4, 3), (10, 20), (7, 50), (3, 8))]
+        model = LatencyModel(samples)
+        self.assertAlmostEqual(model.overhead, 2)
+        self.assertAlmostEqual(model.per_kb, 0.5)
+        self.assertAlmostEqual(model.per_io, 0.1)
+        for percentile in (50, 90):
+            self.assertAlmostEqual(model.estimate(20, 100, percentile), 22)
+
+    def test_drops_negative_features(self):
+        # Larger files were faster here (e.g. a warm cache), which must not make large transactions free
+        model = LatencyModel([[1, None, 5.0], [2, None, 4.0], [3, None, 3.0]])
+        self.assertEqual((model.per_kb, model.per_io), (0.0, 0.0))
+        self.assertGreater(model.overhead, 0)
+        self.assertGreaterEqual(model.estimate(1000), 0.0)
+
+    def test_unknown_io_count_uses_weighted_mean(self):
+        model = LatencyModel([[1, 10, 2.0], [1, 20, 3.0], [2, 10, 2.5], [2, 30, 4.5]])
+        self.assertAlmostEqual(model.per_io, 0.1)
+        weights = [LatencyModel.DECAY ** n for n in (3, 2, 1, 0)]
+        expected_mean = sum(ios * w for ios, w in zip((10, 20, 10, 30), weights)) / sum(weights)
+        self.assertAlmostEqual(model.mean_io_count, expected_mean)
+        self.assertAlmostEqual(model.estimate(1), model.estimate(1, expected_mean))
+
+    def test_decay_follows_recent_samples(self):
+        # The same transaction took 10s ten times and 20s the last ten times (e.g. after an update)
+        model = LatencyModel([[5, 4, 10.0]] * 10 + [[5, 4, 20.0]] * 10)
+        weights = [LatencyModel.DECAY ** (19 - i) for i in range(20)]
+        expected = (10 * sum(weights[:10]) + 20 * sum(weights[10:])) / sum(weights)
+        self.assertAlmostEqual(model.overhead, expected)
+        self.assertGreater(model.overhead, 18)  # the plain mean would be 15s
+
+    def test_keeps_newest_samples(self):
+        model = LatencyModel([[1, 1, 100.0]] * LatencyModel.MAX_SAMPLES)
+        for _ in range(LatencyModel.MAX_SAMPLES):
+            model.add(1, 1, 1.0)
+        self.assertEqual(len(model.samples), LatencyModel.MAX_SAMPLES)
+        self.assertAlmostEqual(model.estimate(1, 1), 1.0)
+        self.assertEqual(len(LatencyModel([[1, 1, 1.0]] * 100).samples), LatencyModel.MAX_SAMPLES)
+
+    def test_residual_percentiles(self):
+        # Without decay all samples weigh the same: 1..10s for the same size, fitted as a mean of 5.5s
+        with mock.patch.object(LatencyModel, 'DECAY', 1.0):
+            model = LatencyModel([[3, None, float(seconds)] for seconds in (7, 2, 9, 1, 5, 10, 3, 8, 4, 6)])
+            self.assertAlmostEqual(model.overhead, 5.5)
+            self.assertAlmostEqual(model.estimate(3, percentile=50), 5.0)
+            self.assertAlmostEqual(model.estimate(3, percentile=90), 9.0)
+            self.assertAlmostEqual(model.estimate(3, percentile=100), 10.0)
+            self.assertAlmostEqual(model.estimate(3, percentile=0), 1.0)
+
+    def test_residual_percentiles_are_weighted(self):
+        # The newest sample weighs 1, the one before DECAY: the slow old run is not the median anymore
+        model = LatencyModel([[1, None, 30.0], [1, None, 10.0]])
+        mean = (30 * LatencyModel.DECAY + 10) / (LatencyModel.DECAY + 1)
+        self.assertAlmostEqual(model.overhead, mean)
+        self.assertAlmostEqual(model.estimate(1, percentile=50), 10.0)
+        self.assertAlmostEqual(model.estimate(1, percentile=90), 30.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Tests of MountSessionManager with a stubbed mount tool."""
+import time
+import unittest
+from unittest import mock
+
+from libs import mount_tool
+from libs.mount_sessions import MountSessionManager
+
+
+class FakeMounts:
+    """Stands in for mount/umount and the mount table: umount fails while the device is busy."""
+
+    def __init__(self):
+        self.mounted = {}
+        self.busy = set()
+        self.umount_calls = 0
+
+    def mount(self, device, mount_point, options=""):
+        self.mounted[device] = mount_point
+        return True
+
+    def umount(self, device):
+        self.umount_calls += 1
+        if device in self.busy:
+            return False
+        return self.mounted.pop(device, None) is not None
+
+    def mount_point(self, device):
+        return self.mounted.get(device)
+
+
+class MountSessionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.mounts = FakeMounts()
+        for patcher in (mock.patch.object(mount_tool, 'mount', self.mounts.mount),
+                        mock.patch.object(mount_tool, 'umount', self.mounts.umount),
+                        mock.patch.object(mount_tool.mount_table, 'mount_point', self.mounts.mount_point)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_leases_share_the_mount(self):
+        manager = MountSessionManager(idle_timeout=0)
+        first = manager.acquire('/dev/sda1', '/media/a')
+        second = manager.acquire('/dev/sda1', '/media/other')
+        self.assertEqual(second.mount_point, '/media/a')
+        first.release()
+        self.assertIn('/dev/sda1', self.mounts.mounted)
+        second.release()
+        self.assertNotIn('/dev/sda1', self.mounts.mounted)
+        self.assertFalse(manager.is_mounted('/dev/sda1'))
+
+    def test_unmounts_after_idle_timeout(self):
+        manager = MountSessionManager(idle_timeout=0.05)
+        manager.acquire('/dev/sda1', '/media/a').release()
+        self.assertTrue(manager.is_mounted('/dev/sda1'))
+        self.assertTrue(self.wait_for(lambda: not manager.is_mounted('/dev/sda1')))
+        self.assertEqual(self.mounts.mounted, {})
+
+    def test_failed_eject_keeps_session(self):
+        manager = MountSessionManager(idle_timeout=0)
+        lease = manager.acquire('/dev/sda1', '/media/a')
+        self.mounts.busy.add('/dev/sda1')
+        self.assertFalse(manager.eject('/dev/sda1'))
+        self.assertTrue(manager.is_mounted('/dev/sda1'))
+        # The session is still used: no second mount, and releasing the lease tries again
+        self.assertEqual(manager.acquire('/dev/sda1', '/media/b').mount_point, '/media/a')
+        self.mounts.busy.clear()
+        self.assertTrue(manager.eject('/dev/sda1'))
+        self.assertFalse(manager.is_mounted('/dev/sda1'))
+        lease.release()
+
+    def test_failed_idle_unmount_restarts_timer(self):
+        manager = MountSessionManager(idle_timeout=0.05)
+        self.mounts.busy.add('/dev/sda1')
+        manager.acquire('/dev/sda1', '/media/a').release()
+        self.assertTrue(self.wait_for(lambda: self.mounts.umount_calls >= 2))
+        self.assertTrue(manager.is_mounted('/dev/sda1'))
+        self.mounts.busy.clear()
+        self.assertTrue(self.wait_for(lambda: not manager.is_mounted('/dev/sda1')))
+        self.assertEqual(self.mounts.mounted, {})
+
+    def test_foreign_mounts_are_only_unmounted_by_eject(self):
+        self.mounts.mounted['/dev/sdb1'] = '/mnt/usb'
+        manager = MountSessionManager(idle_timeout=0)
+        lease = manager.acquire('/dev/sdb1', '/media/b')
+        self.assertEqual(lease.mount_point, '/mnt/usb')
+        lease.release()
+        self.assertTrue(manager.close())
+        self.assertIn('/dev/sdb1', self.mounts.mounted)
+        manager.acquire('/dev/sdb1', '/media/b')
+        self.assertTrue(manager.eject())
+        self.assertEqual(self.mounts.mounted, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
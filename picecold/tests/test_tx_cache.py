@@ -0,0 +1,137 @@
+"""Tests of TransactionCache (LRU eviction, persistence and file keys) and of the cache statistics."""
+import configparser
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import main  # noqa: F401 - config imports main, which has to be imported first
+from config import Configuration
+from libs.tx_cache import TransactionCache
+
+
+def outputs(n):
+    return [("addr{0}".format(n), n / 10.0)]
+
+
+class TransactionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, 'cache.json')
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_evicts_least_recently_used(self):
+        cache = TransactionCache(max_entries=3)
+        for n in range(3):
+            cache.put("key{0}".format(n), outputs(n), {'n': n})
+        # Reading key0 makes key1 the least recently used one
+        self.assertEqual(cache.get('key0'), (outputs(0), {'n': 0}))
+        cache.put('key3', outputs(3), {'n': 3})
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn('key1', cache)
+        self.assertIsNone(cache.get('key1'))
+        for key in ('key0', 'key2', 'key3'):
+            self.assertIn(key, cache)
+
+    def test_put_existing_key_refreshes_it(self):
+        cache = TransactionCache(max_entries=2)
+        cache.put('a', outputs(1), None)
+        cache.put('b', outputs(2), None)
+        cache.put('a', outputs(3), None)
+        cache.put('c', outputs(4), None)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), (outputs(3), None))
+
+    def test_outputs_are_tuples_after_reload(self):
+        cache = TransactionCache(file_path=self._path)
+        cache.put('a', outputs(1), {'outputs': []})
+        cache.flush()
+        self.assertEqual(TransactionCache(file_path=self._path).get('a'), (outputs(1), {'outputs': []}))
+
+    def test_persists_in_lru_order_and_reloads_newest(self):
+        cache = TransactionCache(max_entries=4, file_path=self._path)
+        for n in range(4):
+            cache.put("key{0}".format(n), outputs(n), None)
+        cache.get('key0')
+        cache.flush()
+        with open(self._path) as cache_file:
+            self.assertEqual([key for key, _ in json.load(cache_file)], ['key1', 'key2', 'key3', 'key0'])
+        # A smaller cache keeps the most recently used entries of the file
+        reloaded = TransactionCache(max_entries=2, file_path=self._path)
+        self.assertEqual(len(reloaded), 2)
+        self.assertIn('key3', reloaded)
+        self.assertIn('key0', reloaded)
+        self.assertFalse(os.path.exists(self._path + '.tmp'))
+
+    def test_saves_once_after_delay(self):
+        with mock.patch.object(TransactionCache, 'SAVE_DELAY', 0.1):
+            cache = TransactionCache(file_path=self._path)
+            with mock.patch.object(cache, '_save', wraps=cache._save) as save:
+                cache.put('a', outputs(1), None)
+                cache.put('b', outputs(2), None)
+                self.assertFalse(os.path.exists(self._path))
+                deadline = time.monotonic() + 5
+                while not os.path.exists(self._path) and time.monotonic() < deadline:
+                    time.sleep(0.02)
+                time.sleep(0.2)
+                self.assertEqual(save.call_count, 1)
+                # Nothing pending - flushing does not write again
+                cache.flush()
+                self.assertEqual(save.call_count, 1)
+        self.assertEqual(len(TransactionCache(file_path=self._path)), 2)
+
+    def test_ignores_unreadable_file(self):
+        with open(self._path, 'w') as cache_file:
+            cache_file.write('{not json')
+        with self.assertLogs(level='WARNING'):
+            cache = TransactionCache(file_path=self._path)
+        self.assertEqual(len(cache), 0)
+
+    def test_memory_only_cache_does_not_save(self):
+        cache = TransactionCache()
+        cache.put('a', outputs(1), None)
+        cache.flush()
+        self.assertEqual(os.listdir(self._dir.name), [])
+
+    def test_file_key(self):
+        tx_path = os.path.join(self._dir.name, 'tx.txn')
+        with open(tx_path, 'w') as tx_file:
+            tx_file.write('0100')
+        self.assertIsNone(TransactionCache.known_key(tx_path))
+        key = TransactionCache.file_key(tx_path)
+        self.assertEqual(key, TransactionCache.hash_file(tx_path))
+        self.assertEqual(TransactionCache.known_key(tx_path), key)
+        # A changed file has to be hashed again
+        with open(tx_path, 'w') as tx_file:
+            tx_file.write('020000')
+        self.assertIsNone(TransactionCache.known_key(tx_path))
+        self.assertNotEqual(TransactionCache.file_key(tx_path), key)
+        os.remove(tx_path)
+        self.assertIsNone(TransactionCache.known_key(tx_path))
+
+
+class CacheStatsTest(unittest.TestCase):
+    def test_counts_from_several_threads(self):
+        cfg_dict = configparser.ConfigParser()
+        cfg_dict.read_string("[Stats]\n")
+        cfg = Configuration(cfg_dict)
+
+        def count(hit):
+            for _ in range(500):
+                cfg.add_cache_result(hit)
+
+        threads = [threading.Thread(target=count, args=(n % 2 == 0,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cfg.cache_stats, (2000, 2000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Tests of TransactionIndex on a temporary stick."""
+import os
+import re
+import tempfile
+import time
+import unittest
+
+from libs.tx_cache import TransactionCache
+from libs.tx_index import TransactionIndex
+
+UNSIGNED = re.compile(r'.*(?<!_SIGNED)\.txn')
+
+
+class TransactionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self._dir.name, 'stick')
+        self.index_path = os.path.join(self._dir.name, 'index.json')
+        for rel_path in ('a.txn', 'a_SIGNED.txn', os.path.join('day', 'b.txn'), 'notes.txt'):
+            os.makedirs(os.path.dirname(os.path.join(self.root, rel_path)), exist_ok=True)
+            with open(os.path.join(self.root, rel_path), 'w') as tx_file:
+                tx_file.write(rel_path)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def index(self):
+        return TransactionIndex(self.index_path, self.root, UNSIGNED, '_SIGNED')
+
+    def wait_for_hashing(self, index):
+        deadline = time.monotonic() + 5
+        while index._hashing is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_lists_and_hashes_only_unsigned(self):
+        index = self.index()
+        listed = {tx.rel_path: tx for tx in index.rescan()}
+        self.assertEqual(sorted(listed), ['a.txn', 'a_SIGNED.txn', os.path.join('day', 'b.txn')])
+        self.assertTrue(listed['a_SIGNED.txn'].signed)
+        self.assertEqual(sorted(tx.rel_path for tx in index.unsigned()), ['a.txn', os.path.join('day', 'b.txn')])
+        self.wait_for_hashing(index)
+        for rel_path, tx in listed.items():
+            expected = None if tx.signed else TransactionCache.hash_file(os.path.join(self.root, rel_path))
+            self.assertEqual(tx.hash, expected, rel_path)
+
+    def test_reloaded_index_does_not_hash_again(self):
+        index = self.index()
+        index.rescan()
+        self.wait_for_hashing(index)
+        reloaded = self.index()
+        listed = {tx.rel_path: tx for tx in reloaded.rescan()}
+        self.assertEqual(reloaded.changed_files, 0)
+        self.assertIsNone(reloaded._hashing)
+        self.assertIsNotNone(listed['a.txn'].hash)
+        # A changed file is listed at once and hashed again in the background
+        with open(os.path.join(self.root, 'a.txn'), 'w') as tx_file:
+            tx_file.write('changed content')
+        listed = {tx.rel_path: tx for tx in reloaded.rescan()}
+        self.assertEqual(reloaded.changed_files, 1)
+        self.wait_for_hashing(reloaded)
+        self.assertEqual(listed['a.txn'].hash, TransactionCache.hash_file(os.path.join(self.root, 'a.txn')))
+
+    def test_removed_files_are_dropped(self):
+        index = self.index()
+        index.rescan()
+        os.remove(os.path.join(self.root, 'day', 'b.txn'))
+        self.assertEqual(sorted(tx.rel_path for tx in index.rescan()), ['a.txn', 'a_SIGNED.txn'])
+
+
+if __name__ == '__main__':
+    unittest.main()
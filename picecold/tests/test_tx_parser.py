@@ -0,0 +1,160 @@
+"""Tests of the native transaction reader against known transactions and address vectors."""
+import base64
+import json
+import os
+import tempfile
+import unittest
+
+from libs.tx_parser import NativeTransactionReader, UnsupportedFormatError, parse_psbt, parse_raw_transaction, \
+    parse_transaction, script_to_address
+
+# Output scripts and their addresses from BIP 173, BIP 350 and Bitcoin Core's key_io test data
+ADDRESS_VECTORS = [
+    ('76a91462e907b15cbf27d5425399ebf6f0fb50ebb88f1888ac', 'mainnet', '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'),
+    ('76a91465a16059864a2fdbc7c99a4723a8395bc6f188eb88ac', 'mainnet', '1AGNa15ZQXAZUgFiqJ2i7Z2DPU2J6hW62i'),
+    ('a91474f209f6ea907e2ea48f74fae05782ae8a66525787', 'mainnet', '3CMNFxN1oHBc4R1EpboAL5yzHGgE611Xou'),
+    ('0014751e76e8199196d454941c45d1b3a323f1433bd6', 'mainnet', 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4'),
+    ('00201863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262', 'testnet',
+     'tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7'),
+    ('512079be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798', 'mainnet',
+     'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0'),
+]
+
+# "Native P2WPKH" example of BIP 143: the unsigned transaction (legacy serialization) and the signed one (segwit)
+UNSIGNED_TX = '0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffffef51e1b80' \
+              '4cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a914' \
+              '8280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f016' \
+              '7faa815988ac11000000'
+SIGNED_TX = '01000000000102fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000049483045022100' \
+            '8b9d1dc26ba6a9cb62127b02742fa9d754cd3bebf337f7a55d114c8e5cdd30be022040529b194ba3f9281a99f2b1c0a19c04' \
+            '89bc22ede944ccf4ecbab4cc618ef3ed01eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b9' \
+            '0ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac909351' \
+            '0d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac000247304402203609e17b84f6a7d30c80bfa6' \
+            '10b5b4542f32a8a0d5447a12fb1366d7f01cc44a0220573a954c4518331561406f90300e8f3358f51928d43c212a8caed02d' \
+            'e67eebee0121025476c2e83188368da1ff3e292e7acafcd8a4a5e0e7a5f91d4d2b2a6ddc5af5bb11000000'
+OUTPUTS = [('1Cu32FVupVCgHkMMRJdYJugxwo2Aprgk7H', 112340000), ('16TZ8J6Q5iZKBWizWzFAYnrsaox5Z5aBRV', 223450000)]
+PREVOUTS = [('9f96ade4b41d5433f4eda31e1738ec2b36f6e7d1420d94a6af99801a88f7f7ff', 0),
+            ('8ac60eb9575db5b2d987e29f301b5b819ea83a5c6579d282d189cc04b8e151ef', 1)]
+
+
+def psbt(unsigned_tx_hex, inputs=2, outputs=2):
+    """A version 0 PSBT around the unsigned transaction with empty input and output maps."""
+    tx = bytes.fromhex(unsigned_tx_hex)
+    return b'psbt\xff' + b'\x01\x00' + bytes([len(tx)]) + tx + b'\x00' + b'\x00' * (inputs + outputs)
+
+
+class ScriptToAddressTest(unittest.TestCase):
+    def test_known_addresses(self):
+        for script, network, address in ADDRESS_VECTORS:
+            with self.subTest(address=address):
+                self.assertEqual(script_to_address(bytes.fromhex(script), network), address)
+
+    def test_testnet_prefixes(self):
+        self.assertTrue(script_to_address(bytes.fromhex(ADDRESS_VECTORS[0][0]), 'testnet')[0] in 'mn')
+        self.assertTrue(script_to_address(bytes.fromhex(ADDRESS_VECTORS[2][0]), 'testnet').startswith('2'))
+
+    def test_non_standard_scripts(self):
+        for script in ('6a0b68656c6c6f20776f726c64',  # OP_RETURN
+                       '0013751e76e8199196d454941c45d1b3a323f1433b',  # witness v0 program of 19 bytes
+                       '76a91465a16059864a2fdbc7c99a4723a8395bc6f188eb88ad'):  # OP_CHECKSIGVERIFY
+            with self.subTest(script=script):
+                self.assertRaises(UnsupportedFormatError, script_to_address, bytes.fromhex(script))
+
+
+class ParseTransactionTest(unittest.TestCase):
+    def assertOutputs(self, tx, outputs=OUTPUTS):
+        self.assertEqual([(out['address'], out['value']) for out in tx['outputs']], outputs)
+
+    def test_legacy(self):
+        tx = parse_raw_transaction(bytes.fromhex(UNSIGNED_TX))
+        self.assertOutputs(tx)
+        self.assertEqual([(tx_in['prevout_hash'], tx_in['prevout_n']) for tx_in in tx['inputs']], PREVOUTS)
+        self.assertEqual((tx['version'], tx['lockTime']), (1, 17))
+
+    def test_segwit(self):
+        tx = parse_raw_transaction(bytes.fromhex(SIGNED_TX))
+        self.assertOutputs(tx)
+        self.assertEqual([(tx_in['prevout_hash'], tx_in['prevout_n']) for tx_in in tx['inputs']], PREVOUTS)
+        self.assertEqual(tx['inputs'][0]['scriptSig'][:2], '48')
+        self.assertEqual(tx['lockTime'], 17)
+
+    def test_psbt_encodings(self):
+        data = psbt(UNSIGNED_TX)
+        for text in (data.hex(), base64.b64encode(data).decode()):
+            with self.subTest(text=text[:10]):
+                tx = parse_transaction(text)
+                self.assertOutputs(tx)
+                self.assertTrue(tx['partial'])
+        self.assertOutputs(parse_psbt(data))
+
+    def test_json_wrapper(self):
+        tx = parse_transaction(json.dumps({'hex': SIGNED_TX, 'complete': True}))
+        self.assertOutputs(tx)
+        self.assertFalse(tx['partial'])
+        tx = parse_transaction(json.dumps({'hex': base64.b64encode(psbt(UNSIGNED_TX)).decode(), 'complete': False}))
+        self.assertOutputs(tx)
+        self.assertTrue(tx['partial'])
+
+    def test_malformed(self):
+        cases = {
+            'truncated': UNSIGNED_TX[:-10],
+            'trailing data': UNSIGNED_TX + '00',
+            'segwit flag': SIGNED_TX[:10] + '02' + SIGNED_TX[12:],
+            'missing witness': SIGNED_TX[:-8 - 2 * 108] + SIGNED_TX[-8:],
+            'not hex': 'this is no transaction',
+            'invalid JSON': '{"hex": ',
+            'JSON without hex': json.dumps({'tx': UNSIGNED_TX}),
+            'invalid base64': 'cHNidP8B!!!',
+            'PSBT without transaction': (b'psbt\xff' + b'\x01\xfb\x04\x02\x00\x00\x00' + b'\x00').hex(),
+            'truncated PSBT': 'cHNidP8=',
+        }
+        for name, text in cases.items():
+            with self.subTest(name):
+                self.assertRaises(UnsupportedFormatError, parse_transaction, text)
+
+
+class NativeTransactionReaderTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _write(self, content: bytes):
+        path = os.path.join(self._dir.name, 'tx.txn')
+        with open(path, 'wb') as tx_file:
+            tx_file.write(content)
+        return path
+
+    def test_formats(self):
+        contents = {
+            'hex': UNSIGNED_TX.encode() + b'\n',
+            'JSON': json.dumps({'hex': SIGNED_TX, 'complete': True}).encode(),
+            'binary PSBT': psbt(UNSIGNED_TX),
+            'base64 PSBT': base64.b64encode(psbt(UNSIGNED_TX)),
+        }
+        reader = NativeTransactionReader()
+        for name, content in contents.items():
+            with self.subTest(name):
+                path = self._write(content)
+                self.assertEqual(reader.deserialize_transaction(path), [(OUTPUTS[0][0], 1.1234),
+                                                                        (OUTPUTS[1][0], 2.2345)])
+                self.assertEqual(reader.deserialize_transaction(path, convert_to_btc=False), OUTPUTS)
+                self.assertEqual(len(reader.last_raw_tx['inputs']), 2)
+
+    def test_testnet(self):
+        outputs = NativeTransactionReader('testnet').deserialize_transaction(self._write(UNSIGNED_TX.encode()))
+        self.assertTrue(all(address[0] in 'mn' for address, _ in outputs))
+
+    def test_unknown_network(self):
+        self.assertRaises(ValueError, NativeTransactionReader, 'regtest')
+
+    def test_unsupported_files(self):
+        reader = NativeTransactionReader()
+        self.assertRaises(UnsupportedFormatError, reader.deserialize_transaction, self._write(b'\xff\xfe\x00binary'))
+        self.assertRaises(UnsupportedFormatError, reader.deserialize_transaction, self._write(b'deadbeef'))
+        self.assertRaises(IOError, reader.deserialize_transaction, os.path.join(self._dir.name, 'missing.txn'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 from libs.dot_extended.base import SymbolHandler
+from libs.dot_extended.glyphs import GlyphManager
 
 
 class Symbols(SymbolHandler):
@@ -22,3 +23,10 @@ class Symbols(SymbolHandler):
     HOURGLASS_FULL = (31, 17, 10, 4, 14, 31, 31, 0)
     BTC_LOGO = (10, 30, 9, 14, 9, 9, 30, 10)  # Alternative: (10, 31, 17, 30, 17, 17, 31, 10)
 
+    @staticmethod
+    def char(name) -> str:
+        """Get the character to put into a text to show a symbol, e.g. Symbols.char('BTC_LOGO').
+
+        The display slot of the symbol is chosen when the text is written (see GlyphManager).
+        """
+        return GlyphManager.placeholder(name, getattr(Symbols, name))